@@ -45,6 +45,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestContextMiddleware',
+    'core.middleware.StaticFilesMiddleware',
+    'core.middleware.LoadSheddingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,6 +55,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -88,6 +92,62 @@ DATABASES = {
     }
 }
 
+# Read replicas, given as a comma separated list of hosts sharing the
+# credentials of the primary. Safe API requests read from a random replica
+# unless the user wrote within the last DATABASE_REPLICA_STICKY_SECONDS.
+# Stickiness is tracked in the default cache, shared between workers.
+
+DATABASE_REPLICAS = []
+
+for index, host in enumerate(
+        filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')),
+        start=1):
+    alias = 'replica{}'.format(index)
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        HOST=host.strip(),
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append(alias)
+
+# Shards for user owned rows (tags, ingredients, recipes), given as a comma
+# separated list of hosts sharing the credentials of the primary. Users, auth
+# and other global tables stay on the default database. Shards must hand out
+# primary keys from disjoint ranges so rows can move between them.
+
+DATABASE_SHARDS = []
+
+for index, host in enumerate(
+        filter(None, os.environ.get('DB_SHARD_HOSTS', '').split(',')),
+        start=1):
+    alias = 'shard{}'.format(index)
+    DATABASES[alias] = dict(DATABASES['default'], HOST=host.strip())
+    DATABASE_SHARDS.append(alias)
+
+DATABASE_ROUTERS = [
+    'core.routers.ShardRouter',
+    'core.routers.PrimaryReplicaRouter',
+]
+
+DATABASE_REPLICA_STICKY_SECONDS = int(
+    os.environ.get('DB_REPLICA_STICKY_SECONDS', 5)
+)
+
+# Cache
+# Idempotency records and read-your-writes pins live in the default cache,
+# which has to be shared by every worker process; a local memory cache is
+# refused by the core.E001 check. The database cache table is created with
+# createcachetable, CACHE_BACKEND and CACHE_LOCATION can point at memcached
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache',
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'core_cache'),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -127,9 +187,176 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+STATIC_ROOT = os.environ.get('STATIC_ROOT', BASE_DIR / 'static')
+
+# collectstatic writes content hashed names with gzip and brotli variants,
+# served from STATIC_ROOT by core.middleware.StaticFilesMiddleware
+
+STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
+
+STATIC_MAX_AGE = 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'
+
+# Similar recipes index
+# Built per user on first use and kept in each worker for the
+# RECIPE_INDEX_MAX_USERS most recently active users
+
+RECIPE_INDEX_MAX_USERS = int(os.environ.get('RECIPE_INDEX_MAX_USERS', 1000))
+
+# Precomputed recipe detail documents
+# When enabled, the detail representation of each recipe is stored on save
+# and served as is; renames of tags and ingredients are fanned out to the
+# recipes using them in batches of RECIPE_PRERENDER_BATCH_SIZE
+
+RECIPE_PRERENDER = os.environ.get('RECIPE_PRERENDER', '1') == '1'
+
+RECIPE_PRERENDER_BATCH_SIZE = 500
+
+# Background jobs
+# Failed jobs are retried after JOB_RETRY_BACKOFF seconds, doubling on every
+# attempt up to JOB_RETRY_BACKOFF_MAX
+
+JOB_MAX_ATTEMPTS = 5
+
+JOB_RETRY_BACKOFF = 10
+
+JOB_RETRY_BACKOFF_MAX = 3600
+
+JOB_TIMEOUT = 600
+
+# Admin changelists show the planner's row estimate instead of running an
+# exact COUNT(*) when it is above this number of rows
+
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100000
+
+# Maximum number of operations accepted by a single /api/batch/ request
+
+BATCH_MAX_REQUESTS = 20
+
+# Server-sent change events, served by the ASGI application only, which the
+# image runs as its own process with "entrypoint.sh events"
+# EVENTS_BACKEND fans events out to the connected clients. The default
+# PostgreSQL backend reaches the event stream processes from the API workers
+# with NOTIFY; core.events.LocalBackend only reaches clients connected to the
+# process that made the change
+
+EVENTS_BACKEND = os.environ.get(
+    'EVENTS_BACKEND', 'core.events.PostgresBackend',
+)
+
+EVENTS_PATH = '/api/events/'
+
+EVENTS_HEARTBEAT = 15
+
+# On-demand profiling of staff requests carrying the PROFILING_HEADER header
+# or the PROFILING_PARAM query parameter, the newest PROFILING_MAX_PROFILES
+# profiles are kept in PROFILING_DIR; profiling is off when it is unset
+
+PROFILING_DIR = os.environ.get('PROFILING_DIR')
+
+PROFILING_HEADER = 'X-Profile'
+
+PROFILING_PARAM = '_profile'
+
+PROFILING_MAX_PROFILES = int(os.environ.get('PROFILING_MAX_PROFILES', 50))
+
+PROFILING_TOP_FUNCTIONS = 50
+
+# Idempotency-Key support on create endpoints
+# Successful responses are replayed for IDEMPOTENCY_TTL seconds; retries of
+# a request still in progress wait up to IDEMPOTENCY_WAIT seconds for it
+
+IDEMPOTENCY_TTL = 24 * 60 * 60
+
+IDEMPOTENCY_WAIT = 10
+
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
+# Load shedding
+# Each worker runs at most an adaptive number of requests at once, starting
+# at LOAD_SHEDDING_INITIAL_LIMIT and lowered when requests take longer than
+# LOAD_SHEDDING_LATENCY_TARGET seconds. Reads may use LOAD_SHEDDING_READ_SHARE
+# of it; requests waiting longer than LOAD_SHEDDING_MAX_WAIT get a 503.
+# A worker never runs more requests than it has threads, so the limit starts
+# at and is capped by WORKER_THREADS, which gunicorn.conf.py reads as well
+
+WORKER_THREADS = int(os.environ.get('GUNICORN_THREADS', 2))
+
+LOAD_SHEDDING = os.environ.get('LOAD_SHEDDING', '1') == '1'
+
+LOAD_SHEDDING_INITIAL_LIMIT = int(
+    os.environ.get('LOAD_SHEDDING_INITIAL_LIMIT', WORKER_THREADS)
+)
+
+LOAD_SHEDDING_MIN_LIMIT = 1
+
+LOAD_SHEDDING_MAX_LIMIT = WORKER_THREADS
+
+LOAD_SHEDDING_LATENCY_TARGET = float(
+    os.environ.get('LOAD_SHEDDING_LATENCY_TARGET', 1.0)
+)
+
+LOAD_SHEDDING_BACKOFF = 0.9
+
+LOAD_SHEDDING_READ_SHARE = 0.8
+
+LOAD_SHEDDING_MAX_WAIT = {
+    'critical': 5.0,
+    'read': 1.0,
+}
+
+LOAD_SHEDDING_RETRY_AFTER = 2
+
+# Logging
+# Records are written as JSON lines by a background thread; when the sink
+# falls behind and LOG_QUEUE_SIZE records are waiting, new ones are dropped
+# and counted instead of blocking requests
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'core.logs.JSONFormatter',
+        },
+    },
+    'filters': {
+        'request_context': {
+            '()': 'core.logs.RequestContextFilter',
+        },
+    },
+    'handlers': {
+        'queue': {
+            '()': 'core.logs.BoundedQueueHandler',
+            'stream': 'ext://sys.stdout',
+            'maxsize': LOG_QUEUE_SIZE,
+            'formatter': 'json',
+            'filters': ['request_context'],
+        },
+    },
+    'root': {
+        'handlers': ['queue'],
+        'level': LOG_LEVEL,
+    },
+    'loggers': {
+        'django': {
+            'handlers': ['queue'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
+
+# The test runner keeps the log sink quiet, tests attach their own handlers
+
+TEST_RUNNER = 'core.runner.QuietTestRunner'
@@ -0,0 +1,34 @@
+"""
+Settings for running the tests on SQLite with several databases.
+
+SQLite databases stand in for two read replicas mirroring the primary and
+for two shards, so routing tests reach real connections. The replicas and
+shards are only enabled by the tests that override DATABASE_REPLICAS or
+DATABASE_SHARDS.
+
+    python manage.py test --settings=app.test_settings
+"""
+
+from app.settings import *  # noqa: F401,F403
+from app.settings import BASE_DIR
+
+
+def sqlite_database(name, **options):
+    return dict(
+        ENGINE='django.db.backends.sqlite3',
+        NAME=BASE_DIR / '{}.sqlite3'.format(name),
+        **options
+    )
+
+
+DATABASES = {
+    'default': sqlite_database('default'),
+    'replica1': sqlite_database('replica1', TEST={'MIRROR': 'default'}),
+    'replica2': sqlite_database('replica2', TEST={'MIRROR': 'default'}),
+    'shard1': sqlite_database('shard1'),
+    'shard2': sqlite_database('shard2'),
+}
+
+DATABASE_REPLICAS = []
+
+DATABASE_SHARDS = []
@@ -1,10 +1,64 @@
+import json
+
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from django.utils.translation import gettext as _
 
 from core import models
 
 
+class EstimatedCountPaginator(Paginator):
+    """Paginator that trusts the planner's row estimate on big tables
+
+    Exact counts are only run when PostgreSQL estimates fewer rows than
+    ADMIN_ESTIMATED_COUNT_THRESHOLD, other backends always count.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = self._estimate()
+        if estimate is not None \
+                and estimate > settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+            return estimate
+        return super().count
+
+    def _estimate(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE relname = %s',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+                return int(row[0]) if row else None
+
+            query = queryset.order_by().values('pk').query
+            sql, params = query.sql_with_params()
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    """Model admin that avoids full counts and per row lookups"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    list_per_page = 50
+
+
 class UserAdmin(BaseUserAdmin):
     ordering = ['id']
     list_display = ['email', 'name']
@@ -23,9 +77,28 @@ class UserAdmin(BaseUserAdmin):
             'fields': ('email', 'password1', 'password2')
         }),
     )
+    search_fields = ('=email',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class RecipeAttrAdmin(ScalableModelAdmin):
+    ordering = ('-id',)
+    list_display = ('name', 'user')
+    search_fields = ('=name',)
+
+
+class RecipeAdmin(ScalableModelAdmin):
+    ordering = ('-id',)
+    list_display = ('title', 'user', 'time_minutes', 'price', 'deleted_at')
+    search_fields = ('=title',)
+    autocomplete_fields = ('tags', 'ingredients')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('rendered')
 
 
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Tag)
-admin.site.register(models.Ingredient)
-admin.site.register(models.Recipe)
+admin.site.register(models.Tag, RecipeAttrAdmin)
+admin.site.register(models.Ingredient, RecipeAttrAdmin)
+admin.site.register(models.Recipe, RecipeAdmin)
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """Refuse caches that are not shared between worker processes"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in LOCAL_CACHE_BACKENDS:
+        return [Error(
+            'The default cache ({}) is not shared between processes.'
+            .format(backend),
+            hint='Idempotency-Key replays and read-your-writes pinning '
+                 'need a cache shared by every worker, such as the '
+                 'database or memcached cache.',
+            id='core.E001',
+        )]
+    return []
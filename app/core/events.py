@@ -0,0 +1,251 @@
+import asyncio
+import itertools
+import json
+import logging
+import select
+import threading
+from collections import OrderedDict, deque, namedtuple
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.utils.module_loading import import_string
+
+from core.models import ChangeSequence
+
+
+logger = logging.getLogger(__name__)
+
+Event = namedtuple('Event', ('id', 'type', 'data'))
+
+
+class Subscription:
+    """Stream of the events published for one user"""
+
+    def __init__(self, backend, user_id, maxsize):
+        self.backend = backend
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def deliver(self, event):
+        """Queue an event, called on the subscriber's event loop"""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout=None):
+        """Return the next event, or None when the wait timed out"""
+        if self.overflowed:
+            raise OverflowError('Subscriber fell behind')
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.backend.unsubscribe(self)
+
+
+class LocalBackend:
+    """In-process event broker
+
+    Stands in for a cross-process broker when publishers and subscribers
+    share a process. Other backends implement the same publish, subscribe
+    and unsubscribe methods on top of a shared message bus.
+
+    Only processes serving the event stream keep a history to resume from,
+    holding the last history events of the users who most recently
+    published.
+    """
+
+    def __init__(self, history=1000, users=1000, queue_size=1000):
+        self.history_size = history
+        self.history_users = users
+        self.queue_size = queue_size
+        self.serving = False
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._history = OrderedDict()
+        self._subscribers = {}
+
+    def serve(self):
+        """Keep the history subscribers of this process resume from"""
+        self.serving = True
+
+    def publish(self, user_id, event_type, data):
+        """Send an event to every subscriber of the user"""
+        event = Event(next(self._ids), event_type, data)
+        self.dispatch(user_id, event)
+        return event
+
+    def dispatch(self, user_id, event):
+        """Hand an event to the subscribers of the user in this process"""
+        with self._lock:
+            if self.serving:
+                self.record(user_id, event)
+            subscribers = list(self._subscribers.get(user_id, ()))
+
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(
+                    subscription.deliver, event,
+                )
+            except RuntimeError:
+                self.unsubscribe(subscription)
+
+    def record(self, user_id, event):
+        """Add an event to the user's history, called with the lock held"""
+        history = self._history.get(user_id)
+        if history is None:
+            history = self._history[user_id] = deque(maxlen=self.history_size)
+            while len(self._history) > self.history_users:
+                self._history.popitem(last=False)
+        else:
+            self._history.move_to_end(user_id)
+        history.append(event)
+
+    def subscribe(self, user_id, last_event_id=None):
+        """Subscribe to a user's events, replaying those after an id"""
+        subscription = Subscription(self, user_id, self.queue_size)
+        with self._lock:
+            if last_event_id is not None:
+                for event in self._history.get(user_id, ()):
+                    if event.id > last_event_id:
+                        subscription.deliver(event)
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+
+class PostgresBackend(LocalBackend):
+    """Event broker shared by every process through PostgreSQL NOTIFY
+
+    Events are numbered from the change sequence of the primary, under the
+    lock of their user, and notified in the same transaction. The events of
+    a user therefore reach every process in the order of their ids, and a
+    client can resume on any process serving the stream. Those processes
+    LISTEN from a background thread. On other databases events are only
+    delivered in-process, like the local backend.
+    """
+    channel = 'core_events'
+    poll_interval = 5.0
+    reconnect_delay = 1.0
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._listener = None
+        self.listening = threading.Event()
+        self.stopping = threading.Event()
+
+    def shared(self):
+        return connections['default'].vendor == 'postgresql'
+
+    def serve(self):
+        super().serve()
+        with self._lock:
+            if self.shared() and self._listener is None:
+                self._listener = threading.Thread(
+                    target=self.listen, name='events-listener', daemon=True,
+                )
+                self._listener.start()
+
+    def publish(self, user_id, event_type, data):
+        """Notify every process of an event of the user"""
+        if not self.shared():
+            return super().publish(user_id, event_type, data)
+        connection = connections['default']
+        with transaction.atomic(using='default'):
+            event = Event(
+                ChangeSequence.allocate(user_id), event_type, data,
+            )
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_notify(%s, %s)', [
+                    self.channel,
+                    json.dumps({
+                        'user': user_id,
+                        'id': event.id,
+                        'type': event.type,
+                        'data': event.data,
+                    }),
+                ])
+        return event
+
+    def receive(self, payload):
+        """Dispatch a notified event"""
+        message = json.loads(payload)
+        self.dispatch(
+            message['user'],
+            Event(message['id'], message['type'], message['data']),
+        )
+
+    def listen(self):
+        """Dispatch notified events, reconnecting when the connection drops
+
+        Events notified while the connection is down are lost, clients see
+        them on their next sync.
+        """
+        while not self.stopping.is_set():
+            connection = connections.create_connection('default')
+            try:
+                connection.ensure_connection()
+                with connection.cursor() as cursor:
+                    cursor.execute('LISTEN {}'.format(self.channel))
+                self.listening.set()
+                raw = connection.connection
+                while not self.stopping.is_set():
+                    select.select([raw], [], [], self.poll_interval)
+                    with connection.wrap_database_errors:
+                        raw.poll()
+                    while raw.notifies:
+                        self.receive(raw.notifies.pop(0).payload)
+            except (DatabaseError, OSError) as exc:
+                logger.warning('Event listener disconnected: %s', exc)
+            except Exception:
+                logger.exception('Event listener failed')
+            finally:
+                self.listening.clear()
+                connection.close()
+            self.stopping.wait(self.reconnect_delay)
+
+    def stop(self):
+        """Stop listening, waiting for the listener to disconnect"""
+        self.stopping.set()
+        if self._listener is not None:
+            self._listener.join()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the configured event backend"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = import_string(settings.EVENTS_BACKEND)()
+        return _backend
+
+
+def publish_on_commit(user_id, event_type, data, using=None):
+    """Publish an event once the current transaction commits"""
+    transaction.on_commit(
+        lambda: get_backend().publish(user_id, event_type, data),
+        using=using,
+    )
+
+
+def format_event(event):
+    """Encode an event in the server-sent events wire format"""
+    return 'id: {}\nevent: {}\ndata: {}\n\n'.format(
+        event.id, event.type, json.dumps(event.data),
+    ).encode()
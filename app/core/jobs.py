@@ -0,0 +1,158 @@
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def job(name):
+    """Register a function as a job runnable by the worker"""
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def get_job_function(name):
+    return _registry[name]
+
+
+def enqueue(name, priority=0, delay=0, max_attempts=None, **kwargs):
+    """Queue a registered job to run with the given keyword arguments"""
+    return Job.objects.create(
+        name=name,
+        kwargs=kwargs,
+        priority=priority,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def claim(limit=1, timeout=None):
+    """Mark up to limit due jobs as running and return them
+
+    Jobs claimed more than timeout seconds ago by a worker that died are
+    given back to the queue first. PostgreSQL skips rows locked by other
+    workers so they never wait on each other. Backends without SKIP LOCKED
+    claim each job with a conditional update and skip the ones another
+    worker got first.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now) \
+        .order_by('-priority', 'run_at', 'id')
+
+    with transaction.atomic(using='default'):
+        requeue_abandoned(now, timeout or settings.JOB_TIMEOUT)
+        if connections['default'].features.has_select_for_update_skip_locked:
+            job_ids = list(
+                due.select_for_update(skip_locked=True)
+                .values_list('id', flat=True)[:limit]
+            )
+            Job.objects.filter(id__in=job_ids).update(
+                status=Job.RUNNING,
+                started_at=now,
+                attempts=F('attempts') + 1,
+            )
+        else:
+            job_ids = [
+                job_id
+                for job_id in due.values_list('id', flat=True)[:limit]
+                if Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+                    status=Job.RUNNING,
+                    started_at=now,
+                    attempts=F('attempts') + 1,
+                )
+            ]
+
+    jobs = Job.objects.in_bulk(job_ids)
+    return [jobs[job_id] for job_id in job_ids]
+
+
+def requeue_abandoned(now, timeout):
+    """Queue again the jobs still running after the timeout
+
+    Workers give up on their own jobs when they time out, so these were
+    claimed by a worker that crashed or was killed. Jobs on their last
+    attempt are failed instead.
+    """
+    abandoned = Job.objects.filter(
+        status=Job.RUNNING,
+        started_at__lt=now - timedelta(seconds=timeout),
+    )
+    error = 'Abandoned after {}s'.format(timeout)
+    abandoned.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED,
+        finished_at=now,
+        last_error=error,
+    )
+    abandoned.update(status=Job.QUEUED, run_at=now, last_error=error)
+
+
+def execute(job_id):
+    """Run a claimed job and record its outcome"""
+    job = Job.objects.get(id=job_id)
+    start = time.monotonic()
+    try:
+        get_job_function(job.name)(**job.kwargs)
+    except Exception:
+        fail(job, traceback.format_exc(), time.monotonic() - start)
+    else:
+        finish(job, time.monotonic() - start)
+
+
+def finish(job, duration):
+    """Record a successful run"""
+    updated = _running(job).update(
+        status=Job.DONE,
+        finished_at=timezone.now(),
+        duration=duration,
+        last_error='',
+    )
+    if updated:
+        logger.info('Job %s done in %.3fs', job, duration)
+
+
+def fail(job, error, duration=None):
+    """Record a failed run, retrying it with exponential backoff"""
+    now = timezone.now()
+    if job.attempts >= job.max_attempts:
+        changes = {'status': Job.FAILED, 'finished_at': now}
+    else:
+        backoff = min(
+            settings.JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1),
+            settings.JOB_RETRY_BACKOFF_MAX,
+        )
+        changes = {
+            'status': Job.QUEUED,
+            'run_at': now + timedelta(seconds=backoff),
+        }
+    updated = _running(job).update(
+        duration=duration,
+        last_error=error,
+        **changes
+    )
+    if updated:
+        logger.warning(
+            'Job %s failed on attempt %s/%s', job, job.attempts,
+            job.max_attempts,
+        )
+
+
+def _running(job):
+    """Select the job only while it is still in the claimed attempt"""
+    return Job.objects.filter(
+        id=job.id,
+        status=Job.RUNNING,
+        attempts=job.attempts,
+    )
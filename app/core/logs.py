@@ -0,0 +1,179 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import weakref
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from django.utils.functional import SimpleLazyObject, empty
+
+
+_request_context = ContextVar('request_context', default=None)
+
+CONTEXT_FIELDS = ('request_id', 'user_id', 'view', 'db_time')
+
+# Attributes of every LogRecord, the others were passed with extra=
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message'}
+
+
+def get_request_context():
+    """Return the context of the current request, or None outside of one"""
+    return _request_context.get()
+
+
+def set_request_context(context):
+    return _request_context.set(context)
+
+
+def reset_request_context(token):
+    _request_context.reset(token)
+
+
+def authenticated_user_id(request):
+    """Return the id of the user of a request once it was authenticated"""
+    user = vars(request).get('user')
+    if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        return None
+    if user is not None and user.is_authenticated:
+        return user.pk
+    return None
+
+
+class RequestContextFilter(logging.Filter):
+    """Copy the context of the current request onto log records"""
+
+    def filter(self, record):
+        context = _request_context.get()
+        if context is not None:
+            if context['user_id'] is None and 'request' in context:
+                context['user_id'] = authenticated_user_id(
+                    context['request']
+                )
+            for name in CONTEXT_FIELDS:
+                if not hasattr(record, name):
+                    setattr(record, name, context.get(name))
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc)
+            .isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in RECORD_ATTRIBUTES and value is not None:
+                data[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Hand records to a background thread writing them to a stream
+
+    The request thread only puts records on a bounded queue; when the sink
+    can't keep up and the queue is full, records are dropped and counted,
+    and the count is reported once there is room again.
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.maxsize = maxsize
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.dropped = 0
+        self.unreported = 0
+        self.lock_counters = threading.Lock()
+        self.start()
+        _handlers.add(self)
+
+    def start(self):
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def after_fork(self):
+        """Replace the queue and thread, which do not survive a fork"""
+        self.queue = queue.Queue(self.maxsize)
+        self.start()
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        """Resolve the message here, it is formatted in the thread"""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info
+            )
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.lock_counters:
+                self.dropped += 1
+                self.unreported += 1
+            return
+        if self.unreported:
+            self.report_dropped()
+
+    def report_dropped(self):
+        with self.lock_counters:
+            count, self.unreported = self.unreported, 0
+        record = logging.makeLogRecord({
+            'name': __name__,
+            'levelno': logging.WARNING,
+            'levelname': 'WARNING',
+            'msg': 'Dropped %d log records, the log queue was full',
+            'args': (count,),
+            'dropped': self.dropped,
+        })
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except queue.Full:
+            with self.lock_counters:
+                self.unreported += count
+
+    def close(self):
+        self.stop()
+        super().close()
+
+
+_handlers = weakref.WeakSet()
+
+
+def _restart_after_fork():
+    for handler in list(_handlers):
+        handler.after_fork()
+
+
+def _stop_all():
+    for handler in list(_handlers):
+        handler.stop()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+atexit.register(_stop_all)
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+
+from core.purge import purge_deleted
+
+
+class Command(BaseCommand):
+    """Django command to remove soft deleted users and recipes"""
+    help = 'Delete users and recipes pending deletion in bounded batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--pause', type=float, default=0.1,
+            help='Seconds to sleep between batches',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep running, purging every INTERVAL seconds',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                recipes, users = purge_deleted(
+                    batch_size=options['batch_size'],
+                    pause=options['pause'],
+                )
+            except DatabaseError as exc:
+                if not options['interval']:
+                    raise
+                # A scheduled purge outlives database restarts, the next
+                # run picks up where this one stopped
+                self.stderr.write('Purge failed: {}'.format(exc))
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    'Purged {} recipe(s) and {} user(s)'.format(
+                        recipes, users,
+                    )
+                ))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
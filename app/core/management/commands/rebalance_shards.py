@@ -0,0 +1,127 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from core import sharding
+from core.models import Tag, Ingredient, Recipe, Tombstone, UserShard
+
+
+class Command(BaseCommand):
+    """Django command to move users and their data between shards
+
+    Writes of a user being moved are rejected while their rows are copied,
+    reads keep being served from the old shard until the placement flips.
+    """
+    help = 'Move users and their recipes, tags and ingredients between shards'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='Id of a user to move, all misplaced users by default',
+        )
+        parser.add_argument(
+            '--to', dest='target',
+            help='Shard to move to, the hashed shard of the user by default',
+        )
+        parser.add_argument(
+            '--from', dest='source',
+            help='Shard to move from, the current shard of the user by '
+                 'default',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--grace', type=float, default=2.0,
+            help='Seconds to wait for in-flight writes after locking a user',
+        )
+
+    def handle(self, *args, **options):
+        if not sharding.sharding_enabled():
+            raise CommandError('Sharding is not enabled')
+        shards = set(sharding.data_aliases())
+        if options['target'] and options['target'] not in shards:
+            raise CommandError('Unknown shard {}'.format(options['target']))
+
+        user_ids = options['users'] or get_user_model().objects \
+            .using('default').order_by('pk').values_list('pk', flat=True)
+        moved = 0
+        for user_id in user_ids:
+            source = options['source'] or sharding.shard_for_user(user_id)
+            target = options['target'] or sharding.hashed_shard(user_id)
+            if source == target:
+                continue
+            self.move_user(user_id, source, target, options)
+            moved += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            'Moved {} user(s)'.format(moved)
+        ))
+
+    def move_user(self, user_id, source, target, options):
+        self.stdout.write('Moving user {} from {} to {}...'.format(
+            user_id, source, target,
+        ))
+        user = get_user_model().objects.using('default').get(pk=user_id)
+        placement, _ = UserShard.objects.using('default').get_or_create(
+            user_id=user_id, defaults={'alias': source},
+        )
+        UserShard.objects.using('default').filter(pk=user_id) \
+            .update(locked=True)
+        time.sleep(options['grace'])
+
+        try:
+            sharding.mirror_user(user, target)
+            with transaction.atomic(using=target):
+                self.copy_rows(user_id, source, target, options['batch_size'])
+        except IntegrityError as exc:
+            UserShard.objects.using('default').filter(pk=user_id) \
+                .update(locked=False)
+            raise CommandError(
+                'Could not move user {}: {}'.format(user_id, exc)
+            )
+
+        UserShard.objects.using('default').filter(pk=user_id) \
+            .update(alias=target, locked=False)
+        self.delete_rows(user_id, source, options['batch_size'])
+
+    def copy_rows(self, user_id, source, target, batch_size):
+        for model in (Tag, Ingredient, Recipe, Tombstone):
+            queryset = model.objects.using(source).filter(user_id=user_id)
+            self.copy_queryset(queryset, target, batch_size)
+        for through in (Recipe.tags.through, Recipe.ingredients.through):
+            queryset = through.objects.using(source) \
+                .filter(recipe__user_id=user_id)
+            self.copy_queryset(queryset, target, batch_size)
+
+    def copy_queryset(self, queryset, target, batch_size):
+        model = queryset.model
+        batch = []
+        for obj in queryset.order_by('pk').iterator(chunk_size=batch_size):
+            batch.append(obj)
+            if len(batch) == batch_size:
+                model.objects.using(target).bulk_create(batch)
+                batch = []
+        if batch:
+            model.objects.using(target).bulk_create(batch)
+
+    def delete_rows(self, user_id, source, batch_size):
+        querysets = (
+            Recipe.tags.through.objects.filter(recipe__user_id=user_id),
+            Recipe.ingredients.through.objects.filter(
+                recipe__user_id=user_id
+            ),
+            Recipe.objects.filter(user_id=user_id),
+            Tag.objects.filter(user_id=user_id),
+            Ingredient.objects.filter(user_id=user_id),
+            Tombstone.objects.filter(user_id=user_id),
+        )
+        for queryset in querysets:
+            queryset = queryset.using(source)
+            while True:
+                pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+                if not pks:
+                    break
+                # Rows were already copied, skip signals and cascades
+                queryset.model.objects.using(source).filter(pk__in=pks) \
+                    ._raw_delete(source)
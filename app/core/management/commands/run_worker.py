@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+import signal
+import time
+from concurrent import futures
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from core import jobs
+from core.worker import init_process, run_job
+
+
+class Command(BaseCommand):
+    """Django command to run queued background jobs"""
+    help = 'Run queued background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=os.cpu_count() or 1,
+            help='Number of jobs run at the same time',
+        )
+        parser.add_argument(
+            '--pool', choices=('thread', 'process'), default='thread',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to wait for new jobs when the queue is empty',
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=settings.JOB_TIMEOUT,
+            help='Seconds after which a running job is given up on',
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit once the queue is empty',
+        )
+
+    def handle(self, *args, **options):
+        autodiscover_modules('tasks')
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        if options['pool'] == 'process':
+            pool = futures.ProcessPoolExecutor(
+                options['concurrency'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_process,
+            )
+        else:
+            pool = futures.ThreadPoolExecutor(options['concurrency'])
+
+        self.stdout.write('Worker started with {} {}(s)'.format(
+            options['concurrency'], options['pool'],
+        ))
+        with pool:
+            self.run(pool, options)
+        self.stdout.write(self.style.SUCCESS('Worker stopped'))
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def run(self, pool, options):
+        running = {}
+        while not self.stopping:
+            free = options['concurrency'] - len(running)
+            claimed = jobs.claim(free, options['timeout']) \
+                if free > 0 else []
+            for job in claimed:
+                future = pool.submit(run_job, job.id)
+                running[future] = (job, time.monotonic())
+
+            if not running:
+                if options['burst']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+
+            done, _ = futures.wait(
+                running,
+                timeout=options['poll_interval'],
+                return_when=futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                job, started = running.pop(future)
+                self.report(job, future, time.monotonic() - started)
+            self.expire(running, options['timeout'])
+
+        futures.wait(running)
+
+    def report(self, job, future, elapsed):
+        queued = (job.started_at - job.run_at).total_seconds()
+        error = future.exception()
+        if error is not None:
+            jobs.fail(job, repr(error), elapsed)
+        self.stdout.write(
+            '{} {} attempt={} queued={:.3f}s ran={:.3f}s'.format(
+                job, 'crashed' if error else 'finished', job.attempts,
+                max(queued, 0), elapsed,
+            )
+        )
+
+    def expire(self, running, timeout):
+        """Give up on jobs running for longer than the timeout
+
+        Threads and processes can't be interrupted safely, the job keeps
+        running but its outcome is no longer recorded and it is retried.
+        """
+        now = time.monotonic()
+        for future, (job, started) in list(running.items()):
+            if now - started > timeout:
+                running.pop(future)
+                jobs.fail(job, 'Timed out after {}s'.format(timeout),
+                          now - started)
+                self.stdout.write(self.style.WARNING(
+                    '{} timed out at {}'.format(job, timezone.now())
+                ))
@@ -0,0 +1,75 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.seeding import DISTRIBUTIONS, Seeder
+
+
+class Command(BaseCommand):
+    """Django command to fill the database with synthetic data"""
+    help = 'Bulk insert synthetic users, tags, ingredients and recipes ' \
+           'for load testing; nothing else may write while it runs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument(
+            '--recipes-per-user', type=int, default=20,
+            help='Mean number of recipes per user',
+        )
+        parser.add_argument('--tags-per-user', type=int, default=10)
+        parser.add_argument('--ingredients-per-user', type=int, default=30)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=6)
+        parser.add_argument(
+            '--distribution', choices=DISTRIBUTIONS, default='exponential',
+            help='Distribution of the per user and per recipe counts '
+                 'around their mean',
+        )
+        parser.add_argument(
+            '--name-skew', type=float, default=1.1,
+            help='Zipf exponent of the name and attribute popularity',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of users written per transaction',
+        )
+        parser.add_argument(
+            '--password', default='password',
+            help='Password of every user, hashed once',
+        )
+
+    def handle(self, *args, **options):
+        seeder = Seeder(
+            users=options['users'],
+            recipes_per_user=options['recipes_per_user'],
+            tags_per_user=options['tags_per_user'],
+            ingredients_per_user=options['ingredients_per_user'],
+            tags_per_recipe=options['tags_per_recipe'],
+            ingredients_per_recipe=options['ingredients_per_recipe'],
+            distribution=options['distribution'],
+            name_skew=options['name_skew'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            password=options['password'],
+        )
+        started = time.monotonic()
+
+        def progress(counts):
+            elapsed = time.monotonic() - started
+            self.stdout.write('{}/{} users, {} rows, {:.0f} rows/s'.format(
+                counts['users'], options['users'], sum(counts.values()),
+                sum(counts.values()) / max(elapsed, 1e-6),
+            ))
+
+        try:
+            counts = seeder.run(progress=progress)
+        except ValueError as e:
+            raise CommandError(e)
+
+        self.stdout.write(self.style.SUCCESS('Seeded {} in {:.1f}s'.format(
+            ', '.join(
+                '{} {}'.format(count, name) for name, count in counts.items()
+            ),
+            time.monotonic() - started,
+        )))
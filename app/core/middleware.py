@@ -0,0 +1,445 @@
+import cProfile
+import io
+import json
+import logging
+import mimetypes
+import os
+import pstats
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import FileResponse, HttpResponse, \
+                        HttpResponseNotModified, JsonResponse
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from core import logs
+
+
+class SQLTimeline:
+    """Record when each query of a request ran and how long it took"""
+
+    def __init__(self, started):
+        self.started = started
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            end = time.perf_counter()
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'start': round((start - self.started) * 1000, 3),
+                'duration': round((end - start) * 1000, 3),
+                'sql': sql,
+            })
+
+
+class DatabaseTimer:
+    """Add up the time spent in queries into a request's log context"""
+
+    def __init__(self, context):
+        self.context = context
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.context['db_time'] += (time.perf_counter() - start) * 1000
+
+
+class RequestContextMiddleware:
+    """Give the log records of a request its id, user, view and DB time
+
+    The id is taken from the X-Request-ID header set by the proxy, or made
+    up, and returned in the response. Every request is logged on finishing
+    to the app.requests logger.
+    """
+    logger = logging.getLogger('app.requests')
+    request_id_max_length = 128
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id = request.META.get('HTTP_X_REQUEST_ID', '')
+        if not request_id or len(request_id) > self.request_id_max_length:
+            request_id = uuid.uuid4().hex
+        context = {
+            'request': request,
+            'request_id': request_id,
+            'user_id': None,
+            'view': None,
+            'db_time': 0.0,
+        }
+        token = logs.set_request_context(context)
+        started = time.perf_counter()
+        try:
+            timer = DatabaseTimer(context)
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(timer)
+                    )
+                response = self.get_response(request)
+            response['X-Request-ID'] = request_id
+            context['user_id'] = logs.authenticated_user_id(request)
+            context['db_time'] = round(context['db_time'], 3)
+            self.logger.info(
+                '%s %s %s', request.method, request.path,
+                response.status_code,
+                extra={
+                    'method': request.method,
+                    'path': request.path,
+                    'status': response.status_code,
+                    'duration': round(
+                        (time.perf_counter() - started) * 1000, 3,
+                    ),
+                },
+            )
+            return response
+        finally:
+            logs.reset_request_context(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        context = logs.get_request_context()
+        if context is not None:
+            context['view'] = request.resolver_match.view_name \
+                or view_func.__qualname__
+
+
+class StaticFilesMiddleware:
+    """Serve collected static files, preferring their precompressed variant
+
+    The contents of STATIC_ROOT are indexed once when the worker starts, so
+    files collected later are only served after a restart. Content hashed
+    names are cached forever, other names for STATIC_MAX_AGE seconds.
+    Responses are FileResponses, sent with sendfile by the WSGI server.
+    """
+    encodings = (('br', '.br'), ('gzip', '.gz'))
+    immutable_cache_control = 'public, max-age=31536000, immutable'
+
+    def __init__(self, get_response):
+        if not settings.STATIC_ROOT or not os.path.isdir(settings.STATIC_ROOT):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        self.files = self.scan(str(settings.STATIC_ROOT))
+        self.immutable = set(
+            getattr(staticfiles_storage, 'hashed_files', {}).values()
+        )
+
+    def scan(self, root):
+        """Return the files below root with their compressed variants"""
+        files = {}
+        for directory, _, names in os.walk(root):
+            for filename in names:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                if name.endswith(('.gz', '.br')):
+                    continue
+                stat = os.stat(path)
+                variants = [
+                    (encoding, path + suffix)
+                    for encoding, suffix in self.encodings
+                    if os.path.exists(path + suffix)
+                ]
+                files[name] = (path, stat.st_mtime, variants)
+        return files
+
+    def __call__(self, request):
+        if not request.path_info.startswith(self.prefix):
+            return self.get_response(request)
+        entry = self.files.get(request.path_info[len(self.prefix):])
+        if entry is None or request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+        return self.serve(request, request.path_info[len(self.prefix):],
+                          *entry)
+
+    def serve(self, request, name, path, mtime, variants):
+        if not was_modified_since(
+            request.META.get('HTTP_IF_MODIFIED_SINCE'), mtime,
+        ):
+            return HttpResponseNotModified()
+
+        accepted = self.accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''),
+        )
+        encoding, preference = None, 0
+        for candidate, variant in variants:
+            quality = accepted.get(candidate, accepted.get('*', 0))
+            if quality > preference:
+                encoding, preference = candidate, quality
+                path = variant
+
+        content_type = mimetypes.guess_type(name)[0] \
+            or 'application/octet-stream'
+        if request.method == 'HEAD':
+            response = HttpResponse(content_type=content_type)
+            response['Content-Length'] = os.path.getsize(path)
+        else:
+            response = FileResponse(open(path, 'rb'),
+                                    content_type=content_type,
+                                    filename=os.path.basename(name))
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if variants:
+            response['Vary'] = 'Accept-Encoding'
+        response['Last-Modified'] = http_date(mtime)
+        response['Cache-Control'] = self.immutable_cache_control \
+            if name in self.immutable \
+            else 'public, max-age={}'.format(settings.STATIC_MAX_AGE)
+        return response
+
+    def accepted_encodings(self, header):
+        """Return the q-value of every coding of an Accept-Encoding header"""
+        accepted = {}
+        for coding in header.split(','):
+            name, *params = coding.split(';')
+            quality = 1.0
+            for param in params:
+                key, _, value = param.strip().partition('=')
+                if key.lower() == 'q':
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0
+            if name.strip():
+                accepted[name.strip().lower()] = quality
+        return accepted
+
+
+class AdaptiveLimiter:
+    """Concurrency limit adapted with additive increase, multiplicative decrease
+
+    The limit grows by about one for every limit requests served within the
+    latency target while the limit is in use, and shrinks by the backoff
+    factor for every slow or failed request.
+    """
+
+    def __init__(self, initial, minimum, maximum, latency_target, backoff):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, share=1.0, timeout=0):
+        """Take a slot within share of the limit, waiting up to timeout"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.in_flight >= max(1, int(self.limit * share)):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def release(self, latency, failed=False):
+        """Free a slot and adapt the limit to how the request went"""
+        with self.condition:
+            used = self.in_flight
+            self.in_flight -= 1
+            if failed or latency > self.latency_target:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+            elif used * 2 >= self.limit:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            # Waiters have different shares, the one woken by notify() may
+            # not fit while another would
+            self.condition.notify_all()
+
+
+class LoadSheddingMiddleware:
+    """Bound the requests a worker runs at once and shed the excess
+
+    Requests over the adaptive limit queue for at most the wait of their
+    priority class, then get a 503 with Retry-After. Reads may only use part
+    of the limit so logins and writes keep getting through under load.
+    Requests that already waited longer than their class allows in front of
+    the worker, as told by an X-Request-Start header, are shed at once.
+    """
+    critical_paths = ('/api/user/token/', '/api/user/create/')
+
+    def __init__(self, get_response):
+        if not settings.LOAD_SHEDDING:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.limiter = AdaptiveLimiter(
+            initial=settings.LOAD_SHEDDING_INITIAL_LIMIT,
+            minimum=settings.LOAD_SHEDDING_MIN_LIMIT,
+            maximum=settings.LOAD_SHEDDING_MAX_LIMIT,
+            latency_target=settings.LOAD_SHEDDING_LATENCY_TARGET,
+            backoff=settings.LOAD_SHEDDING_BACKOFF,
+        )
+        self.shed = 0
+
+    def __call__(self, request):
+        critical = self.is_critical(request)
+        max_wait = settings.LOAD_SHEDDING_MAX_WAIT['critical' if critical
+                                                   else 'read']
+        waited = self.proxy_wait(request)
+        share = 1.0 if critical else settings.LOAD_SHEDDING_READ_SHARE
+        if waited > max_wait \
+                or not self.limiter.acquire(share, max_wait - waited):
+            return self.reject()
+
+        started = time.monotonic()
+        failed = True
+        try:
+            response = self.get_response(request)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            self.limiter.release(time.monotonic() - started, failed)
+
+    def is_critical(self, request):
+        return request.method not in ('GET', 'HEAD', 'OPTIONS') \
+            or request.path in self.critical_paths
+
+    def proxy_wait(self, request):
+        """Return the seconds spent queued in front of the worker"""
+        value = request.META.get('HTTP_X_REQUEST_START', '')
+        try:
+            start = float(value[2:] if value.startswith('t=') else value)
+        except ValueError:
+            return 0
+        # Proxies send seconds, milliseconds or microseconds
+        while start > 1e11:
+            start /= 1000
+        return max(0, time.time() - start)
+
+    def reject(self):
+        self.shed += 1
+        response = JsonResponse(
+            {'detail': 'The server is overloaded, please retry shortly.'},
+            status=503,
+        )
+        response['Retry-After'] = str(settings.LOAD_SHEDDING_RETRY_AFTER)
+        return response
+
+
+class ProfilingMiddleware:
+    """Profile requests of staff users that ask for it
+
+    A request is profiled when it carries the PROFILING_HEADER header or the
+    PROFILING_PARAM query parameter and is made by a staff user. The call
+    tree is stored as <id>.prof, loadable with pstats or snakeviz, next to
+    <id>.json holding the request, its SQL timeline and the top functions.
+    The id is returned in the X-Profile-Id response header.
+    """
+    response_header = 'X-Profile-Id'
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_DIR:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.directory = Path(settings.PROFILING_DIR)
+        self.meta_key = 'HTTP_' + settings.PROFILING_HEADER.upper() \
+            .replace('-', '_')
+        # Only one profiler can be active in the process at a time
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        if self.meta_key not in request.META \
+                and settings.PROFILING_PARAM not in request.GET:
+            return self.get_response(request)
+        if not self.is_staff(request) or not self.lock.acquire(False):
+            return self.get_response(request)
+        try:
+            return self.profile(request)
+        finally:
+            self.lock.release()
+
+    def is_staff(self, request):
+        """Return whether the request is made by a staff user"""
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return True
+        try:
+            auth = TokenAuthentication().authenticate(request)
+        except exceptions.AuthenticationFailed:
+            return False
+        return auth is not None and auth[0].is_staff
+
+    def profile(self, request):
+        """Run the request under the profiler and store the results"""
+        profile_id = uuid.uuid4().hex
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        timeline = SQLTimeline(started)
+        wrappers = [
+            connections[alias].execute_wrapper(timeline)
+            for alias in connections
+        ]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+        try:
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        finally:
+            for wrapper in reversed(wrappers):
+                wrapper.__exit__(None, None, None)
+        duration = time.perf_counter() - started
+
+        self.save(profile_id, profiler, {
+            'id': profile_id,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'created': time.time(),
+            'duration': round(duration * 1000, 3),
+            'sql_duration': round(
+                sum(query['duration'] for query in timeline.queries), 3,
+            ),
+            'queries': timeline.queries,
+        })
+        response[self.response_header] = profile_id
+        return response
+
+    def save(self, profile_id, profiler, meta):
+        """Write the profile files and prune the oldest profiles"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(self.directory / (profile_id + '.prof')))
+
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary) \
+            .sort_stats('cumulative') \
+            .print_stats(settings.PROFILING_TOP_FUNCTIONS)
+        meta['summary'] = summary.getvalue()
+        with open(self.directory / (profile_id + '.json'), 'w') as f:
+            json.dump(meta, f)
+
+        self.prune()
+
+    def prune(self):
+        """Remove the oldest profiles above PROFILING_MAX_PROFILES"""
+        profiles = sorted(
+            self.directory.glob('*.json'),
+            key=lambda path: path.stat().st_mtime_ns,
+            reverse=True,
+        )
+        for path in profiles[settings.PROFILING_MAX_PROFILES:]:
+            for stale in (path, path.with_suffix('.prof')):
+                try:
+                    stale.unlink()
+                except FileNotFoundError:
+                    pass
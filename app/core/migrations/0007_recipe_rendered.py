@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='rendered',
+            field=models.BinaryField(null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_recipe_rendered'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserShard',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='core.user')),
+                ('alias', models.CharField(max_length=64)),
+                ('locked', models.BooleanField(default=False)),
+            ],
+        ),
+    ]
@@ -0,0 +1,159 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.crypto import salted_hmac
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+
+from core import routers, sharding
+
+
+class ShardMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('Your data is being moved, please retry shortly.')
+    default_code = 'shard_moving'
+    wait = 5
+
+
+class IdempotencyKeyMismatch(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = _('This Idempotency-Key was used for another request.')
+    default_code = 'idempotency_key_mismatch'
+
+
+class IdempotencyKeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = _('A request with this Idempotency-Key is in progress.')
+    default_code = 'idempotency_key_in_use'
+    wait = 1
+
+
+class ReplicaReadMixin:
+    """Serve safe requests from replicas unless the user wrote recently"""
+
+    def dispatch(self, request, *args, **kwargs):
+        with routers.read_from_replicas(False):
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS \
+                and not routers.has_recent_write(request.user.pk):
+            routers.allow_replica_reads()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if request.method not in SAFE_METHODS \
+                and request.user.is_authenticated \
+                and response.status_code < 400:
+            routers.mark_recent_write(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ShardRoutingMixin:
+    """Route the queries of a request to the shard of the requesting user"""
+
+    def dispatch(self, request, *args, **kwargs):
+        with sharding.use_shard(None):
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not sharding.sharding_enabled() \
+                or not request.user.is_authenticated:
+            return
+        alias, locked = sharding.lookup_shard(request.user.pk)
+        if locked and request.method not in SAFE_METHODS:
+            raise ShardMoving()
+        sharding.set_current_shard(alias)
+
+
+class IdempotentCreateMixin:
+    """Replay the stored response of creates retried with an Idempotency-Key
+
+    The first successful response is kept for IDEMPOTENCY_TTL seconds per
+    user, or client address when anonymous, and key. While it is being
+    made, retries wait for it up to IDEMPOTENCY_WAIT seconds; reusing a key
+    for another body is refused.
+    """
+    idempotency_header = 'HTTP_IDEMPOTENCY_KEY'
+    idempotency_key_max_length = 255
+    idempotency_poll_interval = 0.05
+    replayed_header = 'Idempotent-Replayed'
+
+    def create(self, request, *args, **kwargs):
+        key = request.META.get(self.idempotency_header)
+        if not key:
+            return super().create(request, *args, **kwargs)
+        if len(key) > self.idempotency_key_max_length:
+            raise ValidationError({'Idempotency-Key': _('Key is too long.')})
+
+        cache_key = 'idempotency:{}:{}:{}'.format(
+            self.idempotency_scope(request), request.path, key,
+        )
+        lock_key = cache_key + ':lock'
+        fingerprint = self.request_fingerprint(request)
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+        while True:
+            stored = cache.get(cache_key)
+            if stored is not None:
+                return self.replay(stored, fingerprint)
+            if cache.add(lock_key, fingerprint,
+                         settings.IDEMPOTENCY_LOCK_TIMEOUT):
+                break
+            in_flight = cache.get(lock_key)
+            if in_flight is not None and in_flight != fingerprint:
+                raise IdempotencyKeyMismatch()
+            if time.monotonic() >= deadline:
+                raise IdempotencyKeyInUse()
+            time.sleep(self.idempotency_poll_interval)
+
+        try:
+            response = super().create(request, *args, **kwargs)
+            if status.is_success(response.status_code):
+                cache.set(cache_key, {
+                    'fingerprint': fingerprint,
+                    'status': response.status_code,
+                    'data': response.data,
+                    'headers': {
+                        name: value for name, value in response.items()
+                        if name == 'Location'
+                    },
+                }, settings.IDEMPOTENCY_TTL)
+        finally:
+            cache.delete(lock_key)
+        return response
+
+    def idempotency_scope(self, request):
+        """Return who the keys of a request belong to"""
+        if request.user.is_authenticated:
+            return request.user.pk
+        return 'anon-{}'.format(BaseThrottle().get_ident(request))
+
+    def request_fingerprint(self, request):
+        """Return a keyed digest identifying the body of a request
+
+        Bodies may carry passwords, so the digest is an HMAC keyed with
+        SECRET_KEY rather than a plain hash that could be guessed from.
+        """
+        data = request.data
+        if hasattr(data, 'lists'):
+            data = dict(data.lists())
+        body = json.dumps(data, sort_keys=True, default=str)
+        return salted_hmac(
+            'core.idempotency', body, algorithm='sha256',
+        ).hexdigest()
+
+    def replay(self, stored, fingerprint):
+        """Return the stored response of an earlier request"""
+        if stored['fingerprint'] != fingerprint:
+            raise IdempotencyKeyMismatch()
+        headers = dict(stored['headers'], **{self.replayed_header: 'true'})
+        return Response(stored['data'], status=stored['status'],
+                        headers=headers)
@@ -2,6 +2,10 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
                                         PermissionsMixin
 from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.transaction import TransactionManagementError
+from django.db.models.functions import Upper
+from django.utils import timezone
 
 
 class UserManager(BaseUserManager):
@@ -32,13 +36,98 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
 
+    class Meta:
+        indexes = [
+            models.Index(Upper('email'), name='core_user_email_upper_idx'),
+        ]
 
-class Tag(models.Model):
+    def soft_delete(self):
+        """Deactivate the user and leave its data to the purger"""
+        self.is_active = False
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['is_active', 'deleted_at'])
+
+
+class ChangeSequence(models.Model):
+    """Source of monotonic change numbers for delta sync"""
+    POSTGRES_SEQUENCE = 'core_change_seq'
+    # First key of the advisory locks serializing the changes of a user
+    LOCK_NAMESPACE = 7311
+
+    @classmethod
+    def allocate(cls, user_id=None, using='default'):
+        """Return a new change number, always taken from the primary
+
+        With a user_id, the number is taken under a lock on that user held
+        by the transaction on using until it ends. The changes of a user are
+        then numbered in the order they commit, so a sync never moves past a
+        lower number that is still to be committed.
+        """
+        if user_id is not None:
+            cls.lock_users([user_id], using)
+        connection = connections['default']
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT nextval(%s)', [cls.POSTGRES_SEQUENCE]
+                )
+                return cursor.fetchone()[0]
+
+        counter = cls.objects.using('default').create()
+        cls.objects.using('default').filter(pk=counter.pk).delete()
+        return counter.pk
+
+    @classmethod
+    def lock_users(cls, user_ids, using='default'):
+        """Lock the changes of users until the current transaction ends
+
+        On SQLite the write lock taken by allocating already serializes the
+        writing transactions.
+        """
+        connection = connections[using]
+        if not connection.in_atomic_block:
+            raise TransactionManagementError(
+                'Change numbers must be allocated in the transaction '
+                'writing the change.'
+            )
+        if connection.vendor != 'postgresql':
+            return
+        with connection.cursor() as cursor:
+            for user_id in sorted(set(user_ids)):
+                cursor.execute(
+                    'SELECT pg_advisory_xact_lock(%s, %s)',
+                    [cls.LOCK_NAMESPACE, user_id % 2 ** 31],
+                )
+
+
+class SyncedModel(models.Model):
+    """Model whose changes are numbered for delta sync"""
+    updated_at = models.DateTimeField(auto_now=True)
+    seq = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') \
+            or router.db_for_write(type(self), instance=self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {
+                'seq', 'updated_at',
+            }
+        with transaction.atomic(using=using, savepoint=False):
+            self.seq = ChangeSequence.allocate(self.user_id, using)
+            super().save(*args, **kwargs)
+
+
+class Tag(SyncedModel):
     """Tag to be used for recipes"""
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
@@ -46,11 +135,21 @@ class Tag(models.Model):
         on_delete=models.CASCADE,
     )
 
+    class Meta:
+        indexes = [
+            models.Index(Upper('name'), name='core_tag_name_upper_idx'),
+            models.Index(fields=['user', 'seq'], name='core_tag_sync_idx'),
+            models.Index(
+                fields=['user', 'name'],
+                name='core_tag_user_name_idx',
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
 
-class Ingredient(models.Model):
+class Ingredient(SyncedModel):
     """Ingredient to be used in a recipe"""
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
@@ -58,11 +157,64 @@ class Ingredient(models.Model):
         on_delete=models.CASCADE,
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                Upper('name'),
+                name='core_ingredient_name_upper_idx',
+            ),
+            models.Index(
+                fields=['user', 'seq'],
+                name='core_ingredient_sync_idx',
+            ),
+            models.Index(
+                fields=['user', 'name'],
+                name='core_ingredient_user_name_idx',
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+
+    def alive(self):
+        """Exclude recipes pending deletion"""
+        return self.filter(deleted_at__isnull=True)
+
+    def soft_delete(self, user_id=None):
+        """Mark recipes for deletion by the purger"""
+        return self.filter(deleted_at__isnull=True).numbered_update(
+            user_id, deleted_at=timezone.now(), updated_at=timezone.now(),
+        )
+
+    def touch(self, user_id=None):
+        """Record a change to recipes that isn't made through save()"""
+        return self.numbered_update(user_id, updated_at=timezone.now())
+
+    def numbered_update(self, user_id=None, **values):
+        """Update the recipes with a new change number
+
+        Restricted to the recipes of user_id when it is given, otherwise
+        the owners of the recipes are looked up to be locked.
+        """
+        queryset = self
+        if user_id is None:
+            user_ids = set(self.values_list('user_id', flat=True))
+        else:
+            queryset = self.filter(user_id=user_id)
+            user_ids = [user_id]
+        if not user_ids:
+            return 0
+        with transaction.atomic(using=self.db, savepoint=False):
+            ChangeSequence.lock_users(user_ids, self.db)
+            return queryset.update(
+                seq=ChangeSequence.allocate(using=self.db), **values
+            )
+
+
+class Recipe(SyncedModel):
     """Recipe object"""
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -74,6 +226,112 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
+    rendered = models.BinaryField(null=True, editable=False)
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(Upper('title'), name='core_recipe_title_upper_idx'),
+            models.Index(fields=['user', 'seq'], name='core_recipe_sync_idx'),
+            models.Index(
+                fields=['user', 'id'], name='core_recipe_user_id_idx',
+            ),
+            models.Index(
+                fields=['user', 'time_minutes', 'id'],
+                name='core_recipe_user_time_idx',
+            ),
+            models.Index(
+                fields=['user', 'price', 'id'],
+                name='core_recipe_user_price_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class UserShard(models.Model):
+    """Database shard holding the recipes, tags and ingredients of a user"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    alias = models.CharField(max_length=64)
+    locked = models.BooleanField(default=False)
+
+    def __str__(self):
+        return '{} -> {}'.format(self.user_id, self.alias)
+
+
+class Job(models.Model):
+    """Background job run by the run_worker command"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=255)
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.IntegerField(default=0)
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=QUEUED,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_at']),
+        ]
+
+    def __str__(self):
+        return '{} #{}'.format(self.name, self.pk)
+
+
+class Tombstone(models.Model):
+    """Record of a deleted tag, ingredient or recipe for delta sync"""
+    TAG = 'tag'
+    INGREDIENT = 'ingredient'
+    RECIPE = 'recipe'
+    KIND_CHOICES = (
+        (TAG, 'Tag'),
+        (INGREDIENT, 'Ingredient'),
+        (RECIPE, 'Recipe'),
+    )
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    seq = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'seq'],
+                name='core_tombstone_sync_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return '{} {}'.format(self.kind, self.object_id)
@@ -0,0 +1,116 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from core import sharding
+from core.models import Tag, Ingredient, Recipe, Tombstone
+
+
+def _delete_in_batches(queryset, batch_size, pause, raw=False):
+    """Delete the rows of a queryset one bounded batch at a time
+
+    With raw, rows are deleted with a plain DELETE, without collecting
+    related rows or sending signals.
+    """
+    deleted = 0
+    alias = queryset.db
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        batch = queryset.model._base_manager.using(alias).filter(pk__in=pks)
+        with transaction.atomic(using=alias):
+            if raw:
+                batch._raw_delete(alias)
+            else:
+                batch.delete()
+        deleted += len(pks)
+        if pause:
+            time.sleep(pause)
+
+
+def purge_recipes(queryset, batch_size=500, pause=0, raw=False):
+    """Delete recipes and their through rows in bounded batches
+
+    With raw, recipes are deleted without signals, leaving no tombstones
+    or events behind.
+    """
+    deleted = 0
+    alias = queryset.db
+    while True:
+        recipe_ids = list(
+            queryset.values_list('pk', flat=True)[:batch_size]
+        )
+        if not recipe_ids:
+            return deleted
+        with transaction.atomic(using=alias):
+            for through in (Recipe.tags.through, Recipe.ingredients.through):
+                through.objects.using(alias) \
+                    .filter(recipe_id__in=recipe_ids) \
+                    ._raw_delete(alias)
+            recipes = Recipe.objects.using(alias).filter(pk__in=recipe_ids)
+            if raw:
+                recipes._raw_delete(alias)
+            else:
+                recipes.delete()
+        deleted += len(recipe_ids)
+        if pause:
+            time.sleep(pause)
+
+
+def purge_user(user, batch_size=500, pause=0):
+    """Delete a user and everything it owns in bounded batches
+
+    Nobody is left to sync or receive the user's changes, so their rows are
+    deleted without signals, tombstones or events, and the tombstones left
+    earlier are removed in batches before the user.
+    """
+    alias = sharding.shard_for_user(user.pk) \
+        if sharding.sharding_enabled() else 'default'
+    purge_recipes(
+        Recipe.objects.using(alias).filter(user_id=user.pk),
+        batch_size,
+        pause,
+        raw=True,
+    )
+    for model in (Tag, Ingredient, Tombstone):
+        _delete_in_batches(
+            model.objects.using(alias).filter(user_id=user.pk),
+            batch_size,
+            pause,
+            raw=True,
+        )
+    if alias != 'default':
+        _delete_in_batches(
+            Tombstone.objects.using('default').filter(user_id=user.pk),
+            batch_size,
+            pause,
+            raw=True,
+        )
+        get_user_model()._base_manager.using(alias) \
+            .filter(pk=user.pk).delete()
+    user.delete()
+
+
+def purge_deleted(batch_size=500, pause=0):
+    """Purge every recipe and user pending deletion
+
+    Returns the number of recipes and users removed.
+    """
+    recipes = 0
+    for alias in sharding.data_aliases():
+        recipes += purge_recipes(
+            Recipe.objects.using(alias).filter(deleted_at__isnull=False),
+            batch_size,
+            pause,
+        )
+
+    users = get_user_model().objects.using('default') \
+        .filter(deleted_at__isnull=False)
+    purged_users = 0
+    for user in users.iterator():
+        purge_user(user, batch_size, pause)
+        purged_users += 1
+
+    return recipes, purged_users
@@ -0,0 +1,175 @@
+import difflib
+import os
+import re
+from pathlib import Path
+
+from django.db import connections
+
+
+LARGE_TABLES = (
+    'core_user', 'core_tag', 'core_ingredient', 'core_recipe',
+    'core_recipe_tags', 'core_recipe_ingredients', 'core_tombstone',
+    'authtoken_token',
+)
+
+UPDATE_ENV = 'UPDATE_QUERY_PLANS'
+
+
+class QueryRecorder:
+    """Record the SQL and parameters of the SELECTs run on a connection"""
+
+    def __init__(self, using='default'):
+        self.connection = connections[using]
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith('SELECT'):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = self.connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+
+def explain(connection, sql, params):
+    """Return the plan of a query as a list of lines"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            depths = {0: -1}
+            lines = []
+            for node_id, parent, _, detail in cursor.fetchall():
+                depths[node_id] = depths.get(parent, -1) + 1
+                lines.append('  ' * depths[node_id] + detail)
+            return lines
+
+        if connection.vendor == 'postgresql':
+            # Make the planner use any index that fits, so the plan of the
+            # small test tables matches the plan of the production ones
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+            lines = []
+            _walk_postgres(plan[0]['Plan'], 0, lines)
+            return lines
+
+    raise NotImplementedError(connection.vendor)
+
+
+def reset_tables(connection, tables=LARGE_TABLES):
+    """Give the tables empty storage for the rest of the transaction
+
+    PostgreSQL plans small tables by their size on disk, which grows with
+    the rows earlier tests rolled back, so plans would depend on the order
+    tests run in. TRUNCATE is transactional there and undone with the test.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('TRUNCATE {} CASCADE'.format(
+            ', '.join(connection.ops.quote_name(table) for table in tables)
+        ))
+
+
+def _walk_postgres(node, depth, lines):
+    parts = [node['Node Type']]
+    if 'Relation Name' in node:
+        parts.append('on ' + node['Relation Name'])
+    if 'Index Name' in node:
+        parts.append('using ' + node['Index Name'])
+        # An index scan without a condition walks the whole index
+        if 'Index Cond' not in node:
+            parts.append('(full)')
+    lines.append('  ' * depth + ' '.join(parts))
+    for child in node.get('Plans', ()):
+        _walk_postgres(child, depth + 1, lines)
+
+
+def plan_problems(vendor, lines, tables=LARGE_TABLES, allow_sort=False):
+    """Return the full scans and sorts over large tables in a plan"""
+    problems = []
+    for line in lines:
+        step = line.strip()
+        if vendor == 'sqlite':
+            # A scan is a full pass over the table or, with USING, over a
+            # whole index; only SEARCH steps seek to the matching rows
+            match = re.match(r'SCAN (?:TABLE )?(\w+)', step)
+            if match and match.group(1) in tables:
+                problems.append(step)
+            elif not allow_sort and step.startswith('USE TEMP B-TREE') \
+                    and 'ORDER BY' in step:
+                problems.append(step)
+        elif vendor == 'postgresql':
+            match = re.match(r'Seq Scan on (\w+)', step) \
+                or re.match(r'.*Scan on (\w+) .*\(full\)$', step)
+            if match and match.group(1) in tables:
+                problems.append(step)
+            elif not allow_sort and step.startswith('Sort'):
+                problems.append(step)
+    return problems
+
+
+class QueryPlanTestMixin:
+    """Test case mixin asserting on the plans of the queries of a call"""
+    plan_snapshot_dir = None
+
+    def assertEfficientQueries(self, func, snapshot=None, allow_sort=False,
+                               using='default'):
+        """Run func and check the plan of every SELECT it made"""
+        connection = connections[using]
+        with QueryRecorder(using) as recorder:
+            result = func()
+        self.assertTrue(recorder.queries, 'No queries were made')
+
+        plans = []
+        for sql, params in recorder.queries:
+            lines = explain(connection, sql, params)
+            problems = plan_problems(
+                connection.vendor, lines, allow_sort=allow_sort,
+            )
+            self.assertEqual(
+                problems, [],
+                'Inefficient plan for:\n{}\n\n{}'.format(
+                    sql, '\n'.join(lines),
+                ),
+            )
+            plans.append('\n'.join([sql] + lines))
+
+        if snapshot:
+            self.assertPlanSnapshot(
+                connection.vendor, snapshot, '\n\n'.join(plans) + '\n',
+            )
+        return result
+
+    def assertPlanSnapshot(self, vendor, name, text):
+        """Compare plans with the stored snapshot, or record it on request"""
+        path = Path(self.plan_snapshot_dir) / vendor / (name + '.txt')
+        if os.environ.get(UPDATE_ENV):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(text)
+            return
+        if not path.exists():
+            self.fail(
+                'No query plan snapshot {}, rerun with {}=1 to record '
+                'it:\n{}'.format(path, UPDATE_ENV, text)
+            )
+
+        expected = path.read_text()
+        if expected != text:
+            diff = difflib.unified_diff(
+                expected.splitlines(keepends=True),
+                text.splitlines(keepends=True),
+                fromfile=str(path),
+                tofile='current plan',
+            )
+            self.fail(
+                'Query plan changed, rerun with {}=1 to accept:\n{}'.format(
+                    UPDATE_ENV, ''.join(diff),
+                )
+            )
@@ -0,0 +1,112 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from core import sharding
+
+
+_replicas_allowed = ContextVar('replicas_allowed', default=False)
+
+STICKY_CACHE_KEY = 'db:primary-pin:{}'
+
+# App label of the table behind the database cache backend
+CACHE_APP_LABEL = 'django_cache'
+
+
+@contextmanager
+def read_from_replicas(allowed=True):
+    """Allow or forbid reads from replicas for the enclosed block"""
+    token = _replicas_allowed.set(allowed)
+    try:
+        yield
+    finally:
+        _replicas_allowed.reset(token)
+
+
+def replicas_allowed():
+    return _replicas_allowed.get()
+
+
+def allow_replica_reads():
+    """Allow reads from replicas for the rest of the current context"""
+    _replicas_allowed.set(True)
+
+
+def mark_recent_write(user_id):
+    """Pin the reads of a user to the primary for the sticky window"""
+    if not settings.DATABASE_REPLICAS:
+        return
+    cache.set(
+        STICKY_CACHE_KEY.format(user_id),
+        True,
+        settings.DATABASE_REPLICA_STICKY_SECONDS,
+    )
+
+
+def has_recent_write(user_id):
+    if not settings.DATABASE_REPLICAS:
+        return False
+    return bool(cache.get(STICKY_CACHE_KEY.format(user_id)))
+
+
+class PrimaryReplicaRouter:
+    """Send writes to the primary and opted-in reads to a replica
+
+    Reads only go to a replica inside a read_from_replicas() block, so
+    anything outside of the safe API views (auth, admin, management
+    commands) keeps reading from the primary. The database cache is always
+    read from the primary, a lagging replica would miss fresh pins.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or not replicas_allowed() \
+                or model._meta.app_label == CACHE_APP_LABEL:
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ShardRouter:
+    """Send user owned rows to the shard of their owner
+
+    Users, tokens and other global tables are left to the next router.
+    The shard is taken from the user of the instance the query is made
+    through, or from the shard selected for the current request.
+    """
+
+    def _db_for_model(self, model, **hints):
+        if not sharding.sharding_enabled() or not sharding.is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return sharding.current_shard()
+        if isinstance(instance, get_user_model()):
+            return sharding.shard_for_user(instance.pk)
+        if instance._state.db:
+            return instance._state.db
+        if getattr(instance, 'user_id', None) is not None:
+            return sharding.shard_for_user(instance.user_id)
+        return sharding.current_shard()
+
+    db_for_read = _db_for_model
+    db_for_write = _db_for_model
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if sharding.sharding_enabled():
+            return True
+        return None
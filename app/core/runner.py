@@ -0,0 +1,28 @@
+import logging
+
+from django.test.runner import DiscoverRunner
+
+from core.logs import BoundedQueueHandler
+
+
+class QuietTestRunner(DiscoverRunner):
+    """Run the tests without writing the application logs to stdout
+
+    Only the configured log sink is silenced; records still reach the
+    loggers and any handler the tests attach to them.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.silenced = {}
+        for name in (None, 'django'):
+            for handler in logging.getLogger(name).handlers:
+                if isinstance(handler, BoundedQueueHandler):
+                    self.silenced.setdefault(handler, handler.level)
+        for handler in self.silenced:
+            handler.setLevel(logging.CRITICAL + 1)
+
+    def teardown_test_environment(self, **kwargs):
+        for handler, level in self.silenced.items():
+            handler.setLevel(level)
+        super().teardown_test_environment(**kwargs)
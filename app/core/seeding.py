@@ -0,0 +1,302 @@
+import csv
+import io
+import itertools
+import random
+from collections import defaultdict
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.models import Max
+
+from core import sharding
+from core.models import User, UserShard, Tag, Ingredient, Recipe, \
+                        ChangeSequence
+
+
+DISTRIBUTIONS = ('fixed', 'uniform', 'exponential')
+
+TAG_WORDS = (
+    'Vegan', 'Vegetarian', 'Dessert', 'Breakfast', 'Lunch', 'Dinner',
+    'Quick', 'Healthy', 'Spicy', 'Comfort food', 'Gluten free', 'Curry',
+    'Soup', 'Salad', 'Baking', 'Grill', 'Party', 'Budget', 'Seafood',
+    'Pasta', 'Holiday', 'Kids', 'Low carb', 'Street food', 'Brunch',
+)
+
+INGREDIENT_WORDS = (
+    'Salt', 'Pepper', 'Olive oil', 'Garlic', 'Onion', 'Butter', 'Flour',
+    'Sugar', 'Eggs', 'Milk', 'Rice', 'Tomato', 'Lemon', 'Chicken', 'Beef',
+    'Potato', 'Carrot', 'Ginger', 'Cumin', 'Basil', 'Cheese', 'Cream',
+    'Chickpeas', 'Lentils', 'Spinach', 'Mushroom', 'Honey', 'Cinnamon',
+    'Coriander', 'Paprika', 'Yoghurt', 'Soy sauce', 'Chili', 'Bread',
+)
+
+DISH_WORDS = (
+    'Roast', 'Stew', 'Pie', 'Risotto', 'Curry', 'Salad', 'Soup', 'Tart',
+    'Bake', 'Stir fry', 'Pancakes', 'Noodles', 'Burger', 'Casserole',
+)
+
+
+class ZipfChooser:
+    """Pick from a sequence with zipf(skew) weights, the first most often"""
+
+    def __init__(self, rng, values, skew):
+        self.rng = rng
+        self.values = values
+        self.cum_weights = list(itertools.accumulate(
+            1 / (rank ** skew) for rank in range(1, len(values) + 1)
+        ))
+
+    def choose(self, k=1):
+        return self.rng.choices(self.values, cum_weights=self.cum_weights,
+                                k=k)
+
+    def sample(self, k):
+        """Return up to k distinct values"""
+        k = min(k, len(self.values))
+        if not k:
+            return []
+        found = dict.fromkeys(self.choose(k))
+        while len(found) < k:
+            found.update(dict.fromkeys(self.choose(k - len(found))))
+        return list(found)
+
+
+class Seeder:
+    """Bulk insert synthetic users with tags, ingredients and recipes
+
+    Primary keys are assigned up front so rows of every table can be written
+    in batches without reading them back, which means nothing else may write
+    to these tables while seeding. Rows are inserted with COPY on PostgreSQL
+    and bulk_create elsewhere, signals are not sent and detail documents are
+    not prerendered.
+    """
+
+    def __init__(self, users=1000, recipes_per_user=20, tags_per_user=10,
+                 ingredients_per_user=30, tags_per_recipe=2,
+                 ingredients_per_recipe=6, distribution='exponential',
+                 name_skew=1.1, seed=0, batch_size=1000,
+                 password='password', email_domain='seed.test'):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError('Unknown distribution {}'.format(distribution))
+        self.users = users
+        self.recipes_per_user = recipes_per_user
+        self.tags_per_user = tags_per_user
+        self.ingredients_per_user = ingredients_per_user
+        self.tags_per_recipe = tags_per_recipe
+        self.ingredients_per_recipe = ingredients_per_recipe
+        self.distribution = distribution
+        self.name_skew = name_skew
+        self.seed = seed
+        self.batch_size = batch_size
+        self.password = make_password(password)
+        self.email_domain = email_domain
+        self.rng = random.Random(seed)
+        self.tag_names = ZipfChooser(
+            self.rng, vocabulary(TAG_WORDS, tags_per_user), name_skew,
+        )
+        self.ingredient_names = ZipfChooser(
+            self.rng,
+            vocabulary(INGREDIENT_WORDS, ingredients_per_user),
+            name_skew,
+        )
+        self.counts = defaultdict(int)
+
+    def count(self, mean):
+        """Draw a count with the configured distribution"""
+        if self.distribution == 'fixed':
+            return mean
+        if self.distribution == 'uniform':
+            return self.rng.randint(0, 2 * mean)
+        return int(self.rng.expovariate(1 / mean)) if mean else 0
+
+    def email(self, index):
+        return 'seed{}-{}@{}'.format(self.seed, index, self.email_domain)
+
+    def run(self, progress=None):
+        """Insert all rows, calling progress(counts) after every batch"""
+        if User.objects.filter(email=self.email(0)).exists():
+            raise ValueError(
+                'Data for seed {} already exists'.format(self.seed)
+            )
+        self.seq = ChangeSequence.allocate()
+        self.next_ids = {}
+        for start in range(0, self.users, self.batch_size):
+            stop = min(start + self.batch_size, self.users)
+            with transaction.atomic():
+                self.seed_users(range(start, stop))
+            if progress:
+                progress(dict(self.counts))
+        reset_sequences()
+        return dict(self.counts)
+
+    def next_id(self, model, using):
+        """Return the next free primary key of a model on a database"""
+        key = (model, using)
+        if key not in self.next_ids:
+            last = model._base_manager.using(using) \
+                .aggregate(last=Max('pk'))['last']
+            self.next_ids[key] = itertools.count((last or 0) + 1)
+        return next(self.next_ids[key])
+
+    def seed_users(self, indexes):
+        users = [
+            User(
+                id=self.next_id(User, 'default'),
+                email=self.email(index),
+                name='Seed user {}'.format(index),
+                password=self.password,
+            )
+            for index in indexes
+        ]
+        insert(User, users, 'default')
+        self.counts['users'] += len(users)
+
+        by_alias = defaultdict(list)
+        for user in users:
+            alias = sharding.hashed_shard(user.pk) \
+                if sharding.sharding_enabled() else 'default'
+            by_alias[alias].append(user)
+        if sharding.sharding_enabled():
+            insert(UserShard, [
+                UserShard(user_id=user.pk, alias=alias)
+                for alias, shard_users in by_alias.items()
+                for user in shard_users
+            ], 'default')
+        for alias, shard_users in by_alias.items():
+            if alias != 'default':
+                with transaction.atomic(using=alias):
+                    insert(User, shard_users, alias)
+                    self.seed_user_data(shard_users, alias)
+            else:
+                self.seed_user_data(shard_users, alias)
+
+    def seed_user_data(self, users, using):
+        tags, ingredients, recipes, recipe_tags, recipe_ingredients = \
+            [], [], [], [], []
+        tag_through = Recipe.tags.through
+        ingredient_through = Recipe.ingredients.through
+        for user in users:
+            user_tags = [
+                Tag(id=self.next_id(Tag, using), user_id=user.pk,
+                    name=name, seq=self.seq)
+                for name in self.tag_names.sample(
+                    self.count(self.tags_per_user)
+                )
+            ]
+            user_ingredients = [
+                Ingredient(id=self.next_id(Ingredient, using),
+                           user_id=user.pk, name=name, seq=self.seq)
+                for name in self.ingredient_names.sample(
+                    self.count(self.ingredients_per_user)
+                )
+            ]
+            tags.extend(user_tags)
+            ingredients.extend(user_ingredients)
+            # Attributes earlier in the user's list are the popular ones
+            tag_chooser = ZipfChooser(self.rng, user_tags, self.name_skew)
+            ingredient_chooser = ZipfChooser(
+                self.rng, user_ingredients, self.name_skew,
+            )
+
+            for _ in range(self.count(self.recipes_per_user)):
+                recipe = Recipe(
+                    id=self.next_id(Recipe, using),
+                    user_id=user.pk,
+                    title='{} {}'.format(
+                        self.ingredient_names.choose()[0],
+                        self.rng.choice(DISH_WORDS).lower(),
+                    ),
+                    time_minutes=self.rng.randint(5, 180),
+                    price=Decimal(self.rng.randint(100, 5000)) / 100,
+                    seq=self.seq,
+                )
+                recipes.append(recipe)
+                recipe_tags.extend(
+                    tag_through(id=self.next_id(tag_through, using),
+                                recipe_id=recipe.pk, tag_id=tag.pk)
+                    for tag in tag_chooser.sample(
+                        self.count(self.tags_per_recipe)
+                    )
+                )
+                recipe_ingredients.extend(
+                    ingredient_through(
+                        id=self.next_id(ingredient_through, using),
+                        recipe_id=recipe.pk, ingredient_id=ingredient.pk,
+                    )
+                    for ingredient in ingredient_chooser.sample(
+                        self.count(self.ingredients_per_recipe)
+                    )
+                )
+
+        for name, model, objs in (
+            ('tags', Tag, tags),
+            ('ingredients', Ingredient, ingredients),
+            ('recipes', Recipe, recipes),
+            ('recipe_tags', tag_through, recipe_tags),
+            ('recipe_ingredients', ingredient_through, recipe_ingredients),
+        ):
+            insert(model, objs, using)
+            self.counts[name] += len(objs)
+
+
+def vocabulary(words, size):
+    """Return at least size distinct names built from words"""
+    names = list(words)
+    for round_ in itertools.count(2):
+        if len(names) >= size:
+            return names
+        names.extend('{} {}'.format(word, round_) for word in words)
+
+
+def insert(model, objs, using):
+    """Insert rows with their primary keys set"""
+    if not objs:
+        return
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        model._base_manager.using(using).bulk_create(objs, batch_size=500)
+        return
+
+    fields = model._meta.concrete_fields
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for obj in objs:
+        writer.writerow([
+            copy_value(field.get_db_prep_save(
+                field.pre_save(obj, True), connection,
+            ))
+            for field in fields
+        ])
+    buffer.seek(0)
+    columns = ', '.join(
+        connection.ops.quote_name(field.column) for field in fields
+    )
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            "COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '\\N')".format(
+                connection.ops.quote_name(model._meta.db_table), columns,
+            ),
+            buffer,
+        )
+
+
+def copy_value(value):
+    """Format a value for COPY in csv format"""
+    return r'\N' if value is None else value
+
+
+def reset_sequences():
+    """Move the id sequences past the inserted primary keys"""
+    models = [
+        User, UserShard, Tag, Ingredient, Recipe,
+        Recipe.tags.through, Recipe.ingredients.through,
+    ]
+    for alias in {'default', *sharding.data_aliases()}:
+        connection = connections[alias]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
@@ -0,0 +1,85 @@
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.conf import settings
+
+
+_current_shard = ContextVar('current_shard', default=None)
+
+SHARDED_MODELS = (
+    'core.Tag', 'core.Ingredient', 'core.Recipe', 'core.Tombstone',
+)
+
+
+def sharding_enabled():
+    return bool(settings.DATABASE_SHARDS)
+
+
+def data_aliases():
+    """Return the aliases of every database holding user owned rows"""
+    return list(settings.DATABASE_SHARDS) or ['default']
+
+
+def is_sharded(model):
+    """Return True for user owned models and their M2M through tables"""
+    label = model._meta.label
+    if label in SHARDED_MODELS:
+        return True
+    recipe = apps.get_model('core', 'Recipe')
+    return model in (recipe.tags.through, recipe.ingredients.through)
+
+
+def hashed_shard(user_id):
+    """Return the shard a user is placed on when it has no explicit entry"""
+    shards = settings.DATABASE_SHARDS
+    return shards[zlib.crc32(str(user_id).encode()) % len(shards)]
+
+
+def lookup_shard(user_id):
+    """Return the (alias, locked) placement of a user"""
+    user_shard = apps.get_model('core', 'UserShard')
+    placement = user_shard.objects.using('default') \
+        .filter(user_id=user_id) \
+        .values_list('alias', 'locked') \
+        .first()
+    return placement or (hashed_shard(user_id), False)
+
+
+def shard_for_user(user_id):
+    return lookup_shard(user_id)[0]
+
+
+def current_shard():
+    return _current_shard.get()
+
+
+@contextmanager
+def use_shard(alias):
+    """Route queries on user owned models to a shard for the block"""
+    token = _current_shard.set(alias)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+def set_current_shard(alias):
+    """Route user owned models to a shard for the rest of the context"""
+    _current_shard.set(alias)
+
+
+def mirror_user(user, alias):
+    """Copy a user row onto a shard so foreign keys to it resolve there"""
+    if alias == 'default':
+        return
+    fields = {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields
+        if not field.primary_key
+    }
+    type(user)._base_manager.using(alias).update_or_create(
+        pk=user.pk,
+        defaults=fields,
+    )
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from core import sharding
+from core.models import UserShard
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def place_user_on_shard(sender, instance, created, using, **kwargs):
+    """Mirror new and updated users onto the shard holding their data"""
+    if not sharding.sharding_enabled() or using != 'default':
+        return
+    if created:
+        alias = sharding.hashed_shard(instance.pk)
+        UserShard.objects.using('default').create(user=instance, alias=alias)
+    else:
+        alias = sharding.shard_for_user(instance.pk)
+    sharding.mirror_user(instance, alias)
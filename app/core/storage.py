@@ -0,0 +1,69 @@
+import gzip
+import io
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.map', '.svg', '.txt', '.html', '.json', '.xml', '.ico',
+    '.eot', '.otf', '.ttf',
+)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Content hashed static files with gzip and brotli variants
+
+    collectstatic writes name.gz and, when brotli is installed, name.br next
+    to every compressible file when they are meaningfully smaller.
+    """
+    min_size = 256
+    max_ratio = 0.95
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in paths:
+            self.compress(name)
+            hashed_name = self.hashed_files.get(
+                self.hash_key(self.clean_name(name))
+            )
+            if hashed_name:
+                self.compress(hashed_name)
+
+    def compress(self, name):
+        """Write the compressed variants of a stored file"""
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+            return
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            content = f.read()
+        if len(content) < self.min_size:
+            return
+
+        variants = [('.gz', gzip_compress)]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress))
+        for suffix, compress in variants:
+            data = compress(content)
+            if len(data) <= len(content) * self.max_ratio:
+                with open(path + suffix, 'wb') as f:
+                    f.write(data)
+            elif os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def gzip_compress(data):
+    """Compress data with gzip, without a timestamp to stay reproducible"""
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9,
+                       mtime=0) as f:
+        f.write(data)
+    return buffer.getvalue()
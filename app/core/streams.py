@@ -0,0 +1,125 @@
+import asyncio
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.authtoken.models import Token
+
+from core.events import format_event, get_backend
+
+
+@sync_to_async
+def authenticate(key):
+    """Return the active user owning an auth token, or None"""
+    token = Token.objects.select_related('user').filter(key=key).first()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+class EventStreamApp:
+    """ASGI app streaming a user's change events as server-sent events
+
+    Each connection is a coroutine waiting on a queue, so idle clients
+    cost no thread. The token is read from the Authorization header, or
+    from the token query parameter for EventSource clients that can't
+    set headers. Last-Event-ID resumes after the last event received.
+    """
+
+    def __init__(self):
+        get_backend().serve()
+
+    async def __call__(self, scope, receive, send):
+        headers = dict(scope['headers'])
+        query = parse_qs(scope.get('query_string', b'').decode())
+
+        key = headers.get(b'authorization', b'').decode()
+        key = key[len('Token '):] if key.startswith('Token ') \
+            else query.get('token', [''])[0]
+        user = await authenticate(key) if key else None
+        if user is None:
+            await self.reject(send, 401, b'Authentication required')
+            return
+
+        last_event_id = headers.get(b'last-event-id', b'').decode() \
+            or query.get('lastEventId', [''])[0]
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            await self.reject(send, 400, b'Invalid Last-Event-ID')
+            return
+
+        subscription = get_backend().subscribe(user.pk, last_event_id)
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ],
+            })
+            await send({
+                'type': 'http.response.body',
+                'body': b'retry: 3000\n\n',
+                'more_body': True,
+            })
+            await self.stream(subscription, receive, send)
+        finally:
+            subscription.close()
+
+    async def stream(self, subscription, receive, send):
+        disconnect = asyncio.ensure_future(self.wait_disconnect(receive))
+        try:
+            while not disconnect.done():
+                next_event = asyncio.ensure_future(
+                    subscription.get(settings.EVENTS_HEARTBEAT)
+                )
+                await asyncio.wait(
+                    (next_event, disconnect),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not next_event.done():
+                    next_event.cancel()
+                    break
+                try:
+                    event = next_event.result()
+                except OverflowError:
+                    break
+                body = format_event(event) if event else b': keepalive\n\n'
+                await send({
+                    'type': 'http.response.body',
+                    'body': body,
+                    'more_body': True,
+                })
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnect.cancel()
+
+    async def wait_disconnect(self, receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    async def reject(self, send, status, body):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'text/plain')],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+class EventStreamRouter:
+    """Serve the event stream path and hand everything else to Django"""
+
+    def __init__(self, application):
+        self.application = application
+        self.event_stream = EventStreamApp()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == settings.EVENTS_PATH:
+            return await self.event_stream(scope, receive, send)
+        return await self.application(scope, receive, send)
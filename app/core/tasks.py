@@ -0,0 +1,5 @@
+from core.jobs import job
+from core.purge import purge_deleted
+
+
+job('core.purge_deleted')(purge_deleted)
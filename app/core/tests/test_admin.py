@@ -1,8 +1,17 @@
-from django.test import TestCase, Client
+from unittest.mock import patch
+
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.urls import reverse
 
+from core import models
+from core.admin import EstimatedCountPaginator
+
 
+# Static files are not collected for the tests
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.'
+                                       'StaticFilesStorage')
 class AdmimSiteTests(TestCase):
 
     def setUp(self):
@@ -39,3 +48,68 @@ class AdmimSiteTests(TestCase):
         res = self.client.get(url)
 
         self.assertEqual(res.status_code, 200)
+
+    def test_recipe_changelist_queries_bounded(self):
+        """Test the recipe changelist doesn't look up users per row"""
+        for i in range(5):
+            models.Recipe.objects.create(
+                user=self.user,
+                title='Recipe {}'.format(i),
+                time_minutes=5,
+                price=5.00,
+            )
+        url = reverse('admin:core_recipe_changelist')
+        self.client.get(url)
+        # PostgreSQL reads the row estimate before the exact count
+        estimates = int(connection.vendor == 'postgresql')
+
+        with self.assertNumQueries(4 + estimates):
+            res = self.client.get(url)
+
+        self.assertContains(res, 'Recipe 4')
+
+    def test_recipe_change_page(self):
+        """Test the recipe change page uses autocomplete widgets"""
+        recipe = models.Recipe.objects.create(
+            user=self.user,
+            title='Curry',
+            time_minutes=5,
+            price=5.00,
+        )
+        url = reverse('admin:core_recipe_change', args=[recipe.id])
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, 'admin-autocomplete')
+
+    def test_tag_search(self):
+        """Test tags can be searched by exact name"""
+        models.Tag.objects.create(user=self.user, name='Vegan')
+        models.Tag.objects.create(user=self.user, name='Vegetarian')
+        url = reverse('admin:core_tag_changelist')
+
+        res = self.client.get(url, {'q': 'vegan'})
+
+        self.assertContains(res, 'Vegan')
+        self.assertNotContains(res, 'Vegetarian')
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1000)
+    def test_paginator_uses_estimate_above_threshold(self):
+        """Test the paginator trusts large row estimates"""
+        paginator = EstimatedCountPaginator(
+            models.Tag.objects.order_by('id'), 10
+        )
+
+        with patch.object(paginator, '_estimate', return_value=5000):
+            self.assertEqual(paginator.count, 5000)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1000)
+    def test_paginator_counts_below_threshold(self):
+        """Test the paginator counts exactly for small tables"""
+        models.Tag.objects.create(user=self.user, name='Vegan')
+        paginator = EstimatedCountPaginator(
+            models.Tag.objects.order_by('id'), 10
+        )
+
+        with patch.object(paginator, '_estimate', return_value=10):
+            self.assertEqual(paginator.count, 1)
@@ -0,0 +1,127 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Tag
+
+
+BATCH_URL = reverse('batch')
+TAGS_URL = reverse('recipe:tag-list')
+ME_URL = reverse('user:me')
+
+
+class BatchApiTests(TestCase):
+    """Test running several API operations in one request"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'gandalf@lotr.com',
+            'youShallNotPass',
+            name='Gandalf',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_login_required(self):
+        """Test that login is required for batches"""
+        res = APIClient().post(BATCH_URL, {}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_batch_runs_operations_in_order(self):
+        """Test every operation is run and returned in order"""
+        payload = {'requests': [
+            {'method': 'POST', 'path': TAGS_URL, 'body': {'name': 'Vegan'}},
+            {'method': 'GET', 'path': TAGS_URL},
+            {'method': 'GET', 'path': ME_URL},
+            {'method': 'GET', 'path': '/api/nowhere/'},
+        ]}
+
+        res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        responses = res.data['responses']
+        self.assertEqual(
+            [r['status'] for r in responses], [201, 200, 200, 404]
+        )
+        self.assertEqual(responses[1]['body'][0]['name'], 'Vegan')
+        self.assertEqual(responses[2]['body']['name'], 'Gandalf')
+
+    def test_batch_headers_not_inherited(self):
+        """Test per-request headers of the batch skip its operations"""
+        payload = {'requests': [
+            {'method': 'POST', 'path': TAGS_URL, 'body': {'name': 'Vegan'}},
+            {'method': 'POST', 'path': TAGS_URL, 'body': {'name': 'Dessert'}},
+        ]}
+
+        res = self.client.post(
+            BATCH_URL, payload, format='json', HTTP_IDEMPOTENCY_KEY='batch-1',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [r['status'] for r in res.data['responses']], [201, 201]
+        )
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+    def test_batch_authenticates_once(self):
+        """Test the token is only looked up for the batch itself"""
+        token = Token.objects.create(user=self.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        payload = {'requests': [
+            {'method': 'GET', 'path': TAGS_URL},
+            {'method': 'GET', 'path': ME_URL},
+        ]}
+
+        with CaptureQueriesContext(connection) as queries:
+            res = client.post(BATCH_URL, payload, format='json')
+
+        token_queries = [
+            q for q in queries if 'authtoken_token' in q['sql']
+        ]
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(token_queries), 1)
+
+    def test_atomic_batch_rolled_back_on_failure(self):
+        """Test an atomic batch is undone when an operation fails"""
+        payload = {'atomic': True, 'requests': [
+            {'method': 'POST', 'path': TAGS_URL, 'body': {'name': 'Vegan'}},
+            {'method': 'POST', 'path': TAGS_URL, 'body': {'name': ''}},
+        ]}
+
+        res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertTrue(res.data['rolled_back'])
+        self.assertFalse(Tag.objects.exists())
+
+    def test_nested_batch_rejected(self):
+        """Test batches can't contain batches"""
+        payload = {'requests': [
+            {'method': 'POST', 'path': BATCH_URL, 'body': {}},
+        ]}
+
+        res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(res.data['responses'][0]['status'], 400)
+
+    def test_non_api_views_rejected(self):
+        """Test operations may only call API views"""
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        payload = {'requests': [
+            {'method': 'GET', 'path': '/admin/'},
+            {'method': 'GET', 'path': '/admin/core/tag/'},
+        ]}
+
+        res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(
+            [r['status'] for r in res.data['responses']], [400, 400],
+        )
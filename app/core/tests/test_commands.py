@@ -1,8 +1,13 @@
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
-from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.core.management import call_command, CommandError
+from django.db import connection
 from django.db.utils import OperationalError
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Recipe, Tag, Ingredient, Tombstone
 
 
 class CommandTests(TestCase):
@@ -21,3 +26,137 @@ class CommandTests(TestCase):
             gi.side_effect = [OperationalError]*5 + [True]
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 6)
+
+
+class PurgeDeletedCommandTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'gandalf@lotr.com',
+            'youShallNotPass',
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+
+    def sample_recipe(self):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=10,
+            price=5.00,
+        )
+        recipe.tags.add(self.tag)
+        return recipe
+
+    def test_purge_deleted_recipes(self):
+        """Test soft deleted recipes are purged in batches"""
+        deleted = [self.sample_recipe() for _ in range(3)]
+        kept = self.sample_recipe()
+        Recipe.objects.filter(pk__in=[r.pk for r in deleted]).soft_delete()
+
+        call_command('purge_deleted', batch_size=2, pause=0, stdout=Mock())
+
+        self.assertEqual(list(Recipe.objects.all()), [kept])
+        self.assertEqual(Recipe.tags.through.objects.count(), 1)
+
+    def test_purge_deleted_users(self):
+        """Test soft deleted users are purged with all their data"""
+        self.sample_recipe()
+        self.user.soft_delete()
+
+        call_command('purge_deleted', batch_size=1, pause=0, stdout=Mock())
+
+        self.assertFalse(get_user_model().objects.exists())
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(Tag.objects.exists())
+
+    def test_purge_user_without_per_row_work(self):
+        """Test a user's rows are deleted in batches, not one by one"""
+        self.sample_recipe()
+        for i in range(20):
+            Tag.objects.create(user=self.user, name='Tag {}'.format(i))
+        self.tag.delete()
+        self.user.soft_delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('purge_deleted', pause=0, stdout=Mock())
+
+        sqls = [query['sql'] for query in queries]
+        self.assertFalse([sql for sql in sqls if sql.startswith('INSERT')])
+        self.assertEqual(
+            len([sql for sql in sqls
+                 if sql.startswith('DELETE FROM "core_tag"')]),
+            1,
+        )
+        self.assertFalse(Tombstone.objects.exists())
+
+    @patch('core.management.commands.purge_deleted.purge_deleted')
+    @patch('time.sleep', side_effect=[None, KeyboardInterrupt])
+    def test_scheduled_purge_survives_errors(self, sleep, purge):
+        """Test a purge run on an interval retries after database errors"""
+        purge.side_effect = [OperationalError('gone'), (1, 0)]
+        stdout, stderr = Mock(), Mock()
+
+        with self.assertRaises(KeyboardInterrupt):
+            call_command('purge_deleted', interval=60, pause=0,
+                         stdout=stdout, stderr=stderr)
+
+        self.assertEqual(purge.call_count, 2)
+        sleep.assert_called_with(60)
+        self.assertIn('gone', stderr.write.call_args[0][0])
+        self.assertIn('Purged 1 recipe(s)', stdout.write.call_args[0][0])
+
+
+class SeedDataCommandTests(TestCase):
+
+    def seed(self, **options):
+        options.setdefault('stdout', Mock())
+        call_command(
+            'seed_data', users=4, recipes_per_user=3, tags_per_user=2,
+            ingredients_per_user=5, tags_per_recipe=1,
+            ingredients_per_recipe=2, distribution='fixed', batch_size=3,
+            **options
+        )
+
+    def test_seed_data_counts(self):
+        """Test seeding creates the requested number of rows"""
+        self.seed()
+
+        users = get_user_model().objects.all()
+        self.assertEqual(users.count(), 4)
+        self.assertEqual(Tag.objects.count(), 8)
+        self.assertEqual(Ingredient.objects.count(), 20)
+        self.assertEqual(Recipe.objects.count(), 12)
+        self.assertEqual(Recipe.tags.through.objects.count(), 12)
+        self.assertEqual(Recipe.ingredients.through.objects.count(), 24)
+        self.assertTrue(users.first().check_password('password'))
+        recipe = Recipe.objects.first()
+        self.assertEqual(recipe.tags.get().user_id, recipe.user_id)
+
+    def test_seed_data_deterministic(self):
+        """Test the same seed produces the same data"""
+        self.seed(seed=7)
+        titles = list(Recipe.objects.values_list('title', flat=True))
+        get_user_model().objects.all().delete()
+
+        self.seed(seed=7)
+
+        self.assertEqual(
+            list(Recipe.objects.values_list('title', flat=True)), titles,
+        )
+
+    def test_seed_data_twice_fails(self):
+        """Test seeding the same seed twice is refused"""
+        self.seed()
+
+        with self.assertRaises(CommandError):
+            self.seed()
+
+    def test_seed_data_reports_progress(self):
+        """Test progress is written after every batch"""
+        stdout = Mock()
+
+        self.seed(stdout=stdout)
+
+        lines = [call[0][0] for call in stdout.write.call_args_list]
+        self.assertTrue(lines[0].startswith('3/4 users'))
+        self.assertTrue(lines[1].startswith('4/4 users'))
@@ -0,0 +1,254 @@
+import asyncio
+import threading
+from unittest import skipUnless
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase
+from rest_framework.authtoken.models import Token
+
+from core import events
+from core.models import Tag
+from core.streams import EventStreamApp
+
+
+class LocalBackendTests(TestCase):
+    """Test the in-process event broker"""
+
+    def setUp(self):
+        self.backend = events.LocalBackend()
+
+    def test_publish_from_other_thread(self):
+        """Test events published from worker threads reach subscribers"""
+        async def listen():
+            subscription = self.backend.subscribe(1)
+            thread = threading.Thread(
+                target=self.backend.publish, args=(1, 'tag.created', {}),
+            )
+            thread.start()
+            event = await subscription.get(timeout=1)
+            thread.join()
+            subscription.close()
+            return event
+
+        event = asyncio.run(listen())
+
+        self.assertEqual(event.type, 'tag.created')
+
+    def test_events_scoped_to_user(self):
+        """Test subscribers only receive the events of their user"""
+        async def listen():
+            subscription = self.backend.subscribe(1)
+            self.backend.publish(2, 'tag.created', {})
+            return await subscription.get(timeout=0.05)
+
+        self.assertIsNone(asyncio.run(listen()))
+
+    def test_resume_after_last_event_id(self):
+        """Test subscribing with a last event id replays missed events"""
+        self.backend.serve()
+        first = self.backend.publish(1, 'tag.created', {'id': 1})
+        self.backend.publish(1, 'tag.created', {'id': 2})
+
+        async def listen():
+            subscription = self.backend.subscribe(1, first.id)
+            return await subscription.get(timeout=0.05)
+
+        self.assertEqual(asyncio.run(listen()).data, {'id': 2})
+
+    def test_history_not_kept_without_stream(self):
+        """Test processes not serving the stream keep no history"""
+        self.backend.publish(1, 'tag.created', {})
+
+        self.assertEqual(self.backend._history, {})
+
+    def test_history_users_bounded(self):
+        """Test only the users who published last keep a history"""
+        backend = events.LocalBackend(users=2)
+        backend.serve()
+
+        for user_id in (1, 2, 1, 3):
+            backend.publish(user_id, 'tag.created', {})
+
+        self.assertEqual(list(backend._history), [1, 3])
+        self.assertEqual(len(backend._history[1]), 2)
+
+    def test_slow_subscriber_dropped(self):
+        """Test a subscriber that falls behind is disconnected"""
+        backend = events.LocalBackend(queue_size=1)
+
+        async def listen():
+            subscription = backend.subscribe(1)
+            backend.publish(1, 'tag.created', {})
+            backend.publish(1, 'tag.created', {})
+            await asyncio.sleep(0)
+            with self.assertRaises(OverflowError):
+                await subscription.get(timeout=0.05)
+
+        asyncio.run(listen())
+
+
+class PostgresBackendTests(TestCase):
+    """Test the broker shared between processes"""
+
+    def test_notified_event_dispatched(self):
+        """Test notified events reach the subscribers of this process"""
+        backend = events.PostgresBackend()
+        backend.serving = True
+
+        async def listen():
+            subscription = backend.subscribe(1)
+            backend.receive(
+                '{"user": 1, "id": 42, "type": "tag.created", "data": {}}'
+            )
+            return await subscription.get(timeout=1)
+
+        self.assertEqual(asyncio.run(listen()).id, 42)
+        self.assertEqual(backend._history[1][-1].id, 42)
+
+    @patch('core.events.connections')
+    def test_in_process_without_postgres(self, connections):
+        """Test events are delivered in-process on other databases"""
+        connections.__getitem__.return_value.vendor = 'sqlite'
+        backend = events.PostgresBackend()
+
+        async def listen():
+            subscription = backend.subscribe(1)
+            backend.publish(1, 'tag.created', {})
+            return await subscription.get(timeout=1)
+
+        self.assertEqual(asyncio.run(listen()).type, 'tag.created')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Needs PostgreSQL')
+class PostgresNotifyTests(TransactionTestCase):
+    """Test events cross processes through PostgreSQL NOTIFY"""
+
+    def setUp(self):
+        self.listener = events.PostgresBackend()
+        self.listener.poll_interval = 0.1
+        self.listener.serve()
+        self.addCleanup(self.listener.stop)
+        self.assertTrue(self.listener.listening.wait(5))
+
+    def publish_elsewhere(self, *events_args, rollback=False):
+        """Publish events from another backend and thread, as a worker"""
+        publisher = events.PostgresBackend()
+        published = []
+
+        def run():
+            try:
+                with transaction.atomic():
+                    for args in events_args:
+                        published.append(publisher.publish(1, *args))
+                    transaction.set_rollback(rollback)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        return published
+
+    def test_event_reaches_other_process(self):
+        """Test an event published elsewhere reaches the subscribers"""
+        async def listen():
+            subscription = self.listener.subscribe(1)
+            published = self.publish_elsewhere(
+                ('tag.created', {'id': 1}), ('tag.updated', {'id': 1}),
+            )
+            received = [
+                await subscription.get(timeout=5),
+                await subscription.get(timeout=5),
+            ]
+            return published, received
+
+        published, received = asyncio.run(listen())
+
+        self.assertEqual(received, published)
+        self.assertLess(published[0].id, published[1].id)
+        self.assertEqual(list(self.listener._history[1]), published)
+
+    def test_rolled_back_event_not_sent(self):
+        """Test events notified in a rolled back transaction are dropped"""
+        async def listen():
+            subscription = self.listener.subscribe(1)
+            self.publish_elsewhere(('tag.created', {'id': 1}), rollback=True)
+            return await subscription.get(timeout=0.5)
+
+        self.assertIsNone(asyncio.run(listen()))
+
+
+class EventStreamTests(TestCase):
+    """Test the server-sent events stream"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'gandalf@lotr.com',
+            'youShallNotPass',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.backend = events.LocalBackend()
+        patcher = patch('core.events._backend', self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.app = EventStreamApp()
+
+    def stream(self, headers):
+        """Connect to the stream and return what was sent"""
+        sent = []
+
+        async def run():
+            received_event = asyncio.Event()
+
+            async def receive():
+                await received_event.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+                if b'event: ' in message.get('body', b''):
+                    received_event.set()
+
+            scope = {
+                'type': 'http',
+                'path': '/api/events/',
+                'headers': headers,
+                'query_string': b'',
+            }
+            await asyncio.wait_for(self.app(scope, receive, send), 5)
+
+        async_to_sync(run)()
+        return sent
+
+    def test_stream_requires_token(self):
+        """Test the stream rejects unauthenticated clients"""
+        sent = self.stream([])
+
+        self.assertEqual(sent[0]['status'], 401)
+
+    def test_stream_replays_after_last_event_id(self):
+        """Test the stream resumes after the Last-Event-ID header"""
+        first = self.backend.publish(self.user.pk, 'tag.created', {'id': 1})
+        self.backend.publish(self.user.pk, 'tag.updated', {'id': 1})
+
+        sent = self.stream([
+            (b'authorization', 'Token {}'.format(self.token.key).encode()),
+            (b'last-event-id', str(first.id).encode()),
+        ])
+
+        self.assertEqual(sent[0]['status'], 200)
+        body = b''.join(message.get('body', b'') for message in sent)
+        self.assertIn(b'event: tag.updated', body)
+        self.assertNotIn(b'event: tag.created', body)
+
+    def test_model_changes_published(self):
+        """Test saving a tag publishes an event after commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.create(user=self.user, name='Vegan')
+
+        history = self.backend._history[self.user.pk]
+        self.assertEqual(history[-1].type, 'tag.created')
+        self.assertEqual(history[-1].data['id'], tag.id)
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import threading
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.checks import check_shared_cache
+from core.models import Tag
+from user.views import CreateUserView
+
+
+TAGS_URL = reverse('recipe:tag-list')
+CREATE_USER_URL = reverse('user:create')
+
+
+class IdempotentCreateTests(TestCase):
+    """Test retried creates carrying an Idempotency-Key"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'gandalf@lotr.com',
+            'youShallNotPass',
+        )
+        self.client.force_authenticate(self.user)
+
+    def post_tag(self, name, key='key-1'):
+        return self.client.post(
+            TAGS_URL, {'name': name}, HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def assertOnlyCacheQueries(self, queries):
+        """Assert the replay only read and wrote the shared cache"""
+        self.assertEqual([
+            query['sql'] for query in queries
+            if 'core_cache' not in query['sql']
+            and 'SAVEPOINT' not in query['sql']
+        ], [])
+
+    def test_retry_replays_response(self):
+        """Test a retry returns the first response without a duplicate"""
+        first = self.post_tag('Vegan')
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.post_tag('Vegan')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Tag.objects.count(), 1)
+        self.assertOnlyCacheQueries(queries)
+
+    def test_without_key_not_deduplicated(self):
+        """Test requests without a key are all executed"""
+        self.client.post(TAGS_URL, {'name': 'Vegan'})
+        self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertEqual(Tag.objects.count(), 2)
+
+    def test_key_scoped_to_user(self):
+        """Test the same key of another user is a new request"""
+        self.post_tag('Vegan')
+        other = get_user_model().objects.create_user(
+            'samwise@lotr.com',
+            'MrFrodoPlease',
+        )
+        self.client.force_authenticate(other)
+
+        res = self.post_tag('Vegan')
+
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(Tag.objects.count(), 2)
+
+    def test_key_reused_with_other_body(self):
+        """Test reusing a key for another body is refused"""
+        self.post_tag('Vegan')
+
+        res = self.post_tag('Dessert')
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(Tag.objects.count(), 1)
+
+    def test_failed_request_not_stored(self):
+        """Test a retry after a validation error runs again"""
+        self.post_tag('')
+
+        res = self.post_tag('Vegan')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_WAIT=0)
+    def test_in_flight_request_conflicts(self):
+        """Test a retry gives up when the first request is still running"""
+        self.post_tag('Vegan', key='other')
+        lock_key = 'idempotency:{}:{}:key-1:lock'.format(
+            self.user.pk, TAGS_URL,
+        )
+        fingerprint = cache.get(
+            'idempotency:{}:{}:other'.format(self.user.pk, TAGS_URL),
+        )['fingerprint']
+        cache.set(lock_key, fingerprint)
+
+        res = self.post_tag('Vegan')
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertIn('Retry-After', res)
+        self.assertEqual(Tag.objects.count(), 1)
+
+    def test_create_user_replayed(self):
+        """Test a retried signup does not create or hash again"""
+        client = APIClient()
+        payload = {
+            'email': 'frodo@lotr.com',
+            'password': 'MyPrecious',
+            'name': 'Frodo',
+        }
+        first = client.post(CREATE_USER_URL, payload,
+                            HTTP_IDEMPOTENCY_KEY='signup')
+
+        with CaptureQueriesContext(connection) as queries:
+            second = client.post(CREATE_USER_URL, payload,
+                                 HTTP_IDEMPOTENCY_KEY='signup')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data, first.data)
+        self.assertOnlyCacheQueries(queries)
+
+    def test_signup_fingerprint_keyed(self):
+        """Test the stored signup digest is not a plain hash of the body"""
+        payload = {
+            'email': 'frodo@lotr.com',
+            'password': 'MyPrecious',
+            'name': 'Frodo',
+        }
+        APIClient().post(CREATE_USER_URL, payload, format='json',
+                         HTTP_IDEMPOTENCY_KEY='signup')
+        stored = cache.get('idempotency:anon-127.0.0.1:{}:signup'.format(
+            CREATE_USER_URL,
+        ))
+
+        body = json.dumps(payload, sort_keys=True)
+        self.assertNotEqual(
+            stored['fingerprint'], hashlib.sha256(body.encode()).hexdigest(),
+        )
+        request = SimpleNamespace(data=payload)
+        fingerprint = CreateUserView().request_fingerprint(request)
+        self.assertEqual(stored['fingerprint'], fingerprint)
+        with self.settings(SECRET_KEY='other'):
+            self.assertNotEqual(
+                CreateUserView().request_fingerprint(request), fingerprint,
+            )
+
+    def test_anonymous_key_scoped_to_client(self):
+        """Test anonymous clients using the same key do not share it"""
+        client = APIClient()
+        client.post(CREATE_USER_URL, {
+            'email': 'frodo@lotr.com',
+            'password': 'MyPrecious',
+            'name': 'Frodo',
+        }, HTTP_IDEMPOTENCY_KEY='signup', REMOTE_ADDR='10.0.0.1')
+
+        res = client.post(CREATE_USER_URL, {
+            'email': 'samwise@lotr.com',
+            'password': 'MrFrodoPlease',
+            'name': 'Sam',
+        }, HTTP_IDEMPOTENCY_KEY='signup', REMOTE_ADDR='10.0.0.2')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(get_user_model().objects.count(), 3)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }})
+    def test_local_memory_cache_refused(self):
+        """Test a per-process cache fails the system checks"""
+        errors = check_shared_cache(None)
+
+        self.assertEqual([error.id for error in errors], ['core.E001'])
+
+
+class IdempotentCreateConcurrencyTests(TransactionTestCase):
+    """Test retries racing a request made by another worker"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'gandalf@lotr.com',
+            'youShallNotPass',
+        )
+        self.client.force_authenticate(self.user)
+
+    def post_tag(self, name, key='key-1'):
+        return self.client.post(
+            TAGS_URL, {'name': name}, HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_in_flight_request_awaited(self):
+        """Test a retry waits for the response stored by another worker"""
+        first = self.post_tag('Vegan', key='other')
+        stored = cache.get(
+            'idempotency:{}:{}:other'.format(self.user.pk, TAGS_URL),
+        )
+        key = 'idempotency:{}:{}:key-1'.format(self.user.pk, TAGS_URL)
+        cache.set(key + ':lock', stored['fingerprint'])
+
+        def finish():
+            cache.set(key, stored)
+            connections.close_all()
+
+        timer = threading.Timer(0.2, finish)
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        res = self.post_tag('Vegan')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data, first.data)
+        self.assertEqual(Tag.objects.count(), 1)
@@ -0,0 +1,133 @@
+from datetime import timedelta
+from unittest.mock import Mock
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from core import jobs
+from core.models import Job
+
+
+calls = []
+
+
+@jobs.job('tests.record')
+def record(value):
+    calls.append(value)
+
+
+@jobs.job('tests.explode')
+def explode():
+    raise RuntimeError('boom')
+
+
+class JobQueueTests(TestCase):
+    """Test queueing, claiming and running jobs"""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_claim_by_priority(self):
+        """Test higher priority jobs are claimed first"""
+        low = jobs.enqueue('tests.record', value=1)
+        high = jobs.enqueue('tests.record', priority=10, value=2)
+
+        claimed = jobs.claim(limit=1)
+
+        self.assertEqual(claimed, [high])
+        self.assertEqual(claimed[0].attempts, 1)
+        self.assertEqual(jobs.claim(limit=5), [low])
+        self.assertEqual(jobs.claim(limit=5), [])
+
+    def test_delayed_job_not_claimed(self):
+        """Test jobs are not claimed before they are due"""
+        jobs.enqueue('tests.record', delay=60, value=1)
+
+        self.assertEqual(jobs.claim(), [])
+
+    def test_execute_records_timing(self):
+        """Test a successful run is recorded with its duration"""
+        jobs.enqueue('tests.record', value=1)
+        job = jobs.claim()[0]
+
+        jobs.execute(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(calls, [1])
+        self.assertEqual(job.status, Job.DONE)
+        self.assertIsNotNone(job.duration)
+
+    @override_settings(JOB_RETRY_BACKOFF=10)
+    def test_failed_job_retried_with_backoff(self):
+        """Test a failed job is queued again after a backoff"""
+        jobs.enqueue('tests.explode')
+        job = jobs.claim()[0]
+
+        jobs.execute(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn('boom', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=5))
+
+    def test_job_fails_after_max_attempts(self):
+        """Test a job is given up on after its last attempt"""
+        jobs.enqueue('tests.explode', max_attempts=1)
+        job = jobs.claim()[0]
+
+        jobs.execute(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+
+    @override_settings(JOB_TIMEOUT=60)
+    def test_abandoned_job_requeued(self):
+        """Test jobs of a worker that died are claimed again"""
+        job = jobs.enqueue('tests.record', value=1)
+        jobs.claim()
+        Job.objects.filter(id=job.id).update(
+            started_at=timezone.now() - timedelta(seconds=120),
+        )
+
+        claimed = jobs.claim()
+
+        self.assertEqual(claimed, [job])
+        self.assertEqual(claimed[0].attempts, 2)
+        self.assertIn('Abandoned', claimed[0].last_error)
+
+    @override_settings(JOB_TIMEOUT=60)
+    def test_abandoned_job_on_last_attempt_failed(self):
+        """Test abandoned jobs without attempts left are given up on"""
+        job = jobs.enqueue('tests.record', max_attempts=1, value=1)
+        jobs.claim()
+        Job.objects.filter(id=job.id).update(
+            started_at=timezone.now() - timedelta(seconds=120),
+        )
+
+        self.assertEqual(jobs.claim(), [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+
+    def test_running_job_not_requeued(self):
+        """Test jobs within the timeout are left to their worker"""
+        jobs.enqueue('tests.record', value=1)
+        jobs.claim()
+
+        self.assertEqual(jobs.claim(), [])
+
+
+class RunWorkerCommandTests(TransactionTestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_run_worker_burst(self):
+        """Test the worker runs every queued job and exits"""
+        for value in range(3):
+            jobs.enqueue('tests.record', value=value)
+
+        call_command('run_worker', burst=True, concurrency=1, stdout=Mock())
+
+        self.assertEqual(sorted(calls), [0, 1, 2])
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 3)
@@ -0,0 +1,171 @@
+import threading
+import time
+
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from core.middleware import AdaptiveLimiter, LoadSheddingMiddleware
+
+
+def sample_limiter(**params):
+    defaults = {
+        'initial': 4,
+        'minimum': 2,
+        'maximum': 10,
+        'latency_target': 0.5,
+        'backoff': 0.5,
+    }
+    defaults.update(params)
+    return AdaptiveLimiter(**defaults)
+
+
+class AdaptiveLimiterTests(TestCase):
+    """Test the adaptive concurrency limit"""
+
+    def test_acquire_up_to_limit(self):
+        """Test slots are refused above the limit"""
+        limiter = sample_limiter()
+
+        self.assertTrue(all(limiter.acquire() for _ in range(4)))
+        self.assertFalse(limiter.acquire())
+
+    def test_share_of_limit(self):
+        """Test a share only allows part of the limit"""
+        limiter = sample_limiter()
+
+        self.assertTrue(limiter.acquire(share=0.5))
+        self.assertTrue(limiter.acquire(share=0.5))
+        self.assertFalse(limiter.acquire(share=0.5))
+        self.assertTrue(limiter.acquire())
+
+    def test_slow_request_decreases_limit(self):
+        """Test the limit is cut by the backoff on slow requests"""
+        limiter = sample_limiter()
+        limiter.acquire()
+
+        limiter.release(latency=1.0)
+
+        self.assertEqual(limiter.limit, 2)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_busy_fast_requests_increase_limit(self):
+        """Test the limit grows when it is used and requests are fast"""
+        limiter = sample_limiter()
+        for _ in range(3):
+            limiter.acquire()
+
+        limiter.release(latency=0.1)
+
+        self.assertEqual(limiter.limit, 4.25)
+
+    def test_idle_limit_not_increased(self):
+        """Test the limit does not grow while mostly unused"""
+        limiter = sample_limiter()
+        limiter.acquire()
+
+        limiter.release(latency=0.1)
+
+        self.assertEqual(limiter.limit, 4)
+
+    def test_limit_bounded(self):
+        """Test the limit stays within its bounds"""
+        limiter = sample_limiter(initial=2)
+        limiter.acquire()
+
+        limiter.release(latency=1.0, failed=True)
+
+        self.assertEqual(limiter.limit, 2)
+
+    def test_release_wakes_waiter_that_fits(self):
+        """Test a freed slot reaches a writer queued behind a read"""
+        limiter = sample_limiter()
+        for _ in range(4):
+            limiter.acquire()
+        acquired = []
+        waiters = [
+            threading.Thread(target=lambda share=share: acquired.append(
+                (share, limiter.acquire(share=share, timeout=2)),
+            ))
+            for share in (0.5, 1.0)
+        ]
+        for waiter in waiters:
+            waiter.start()
+            time.sleep(0.05)
+
+        started = time.monotonic()
+        limiter.release(latency=0.1)
+        waiters[1].join()
+
+        self.assertEqual(acquired, [(1.0, True)])
+        self.assertLess(time.monotonic() - started, 1)
+        waiters[0].join()
+
+
+@override_settings(
+    LOAD_SHEDDING_INITIAL_LIMIT=5,
+    LOAD_SHEDDING_MAX_LIMIT=10,
+    LOAD_SHEDDING_READ_SHARE=0.6,
+    LOAD_SHEDDING_MAX_WAIT={'critical': 0, 'read': 0},
+)
+class LoadSheddingMiddlewareTests(TestCase):
+    """Test requests are shed when the worker is saturated"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = LoadSheddingMiddleware(
+            lambda request: HttpResponse('ok'),
+        )
+
+    def test_request_served(self):
+        """Test requests within the limit are served"""
+        res = self.middleware(self.factory.get('/api/recipe/recipes/'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.middleware.limiter.in_flight, 0)
+
+    def test_reads_shed_first(self):
+        """Test reads are shed before writes and logins"""
+        self.middleware.limiter.in_flight = 3
+
+        read = self.middleware(self.factory.get('/api/recipe/recipes/'))
+        write = self.middleware(self.factory.post('/api/recipe/tags/'))
+        login = self.middleware(self.factory.get('/api/user/token/'))
+
+        self.assertEqual(read.status_code, 503)
+        self.assertEqual(read['Retry-After'], '2')
+        self.assertEqual(write.status_code, 200)
+        self.assertEqual(login.status_code, 200)
+        self.assertEqual(self.middleware.shed, 1)
+
+    def test_saturated_worker_sheds_writes(self):
+        """Test every request is shed when the limit is reached"""
+        self.middleware.limiter.in_flight = 5
+
+        res = self.middleware(self.factory.post('/api/recipe/tags/'))
+
+        self.assertEqual(res.status_code, 503)
+
+    @override_settings(LOAD_SHEDDING_MAX_WAIT={'critical': 5, 'read': 1})
+    def test_request_queued_too_long_shed(self):
+        """Test requests that waited too long in front of the worker"""
+        start = 't={:.3f}'.format(time.time() - 2)
+
+        read = self.middleware(self.factory.get(
+            '/api/recipe/recipes/', HTTP_X_REQUEST_START=start,
+        ))
+        write = self.middleware(self.factory.post(
+            '/api/recipe/tags/', HTTP_X_REQUEST_START=start,
+        ))
+
+        self.assertEqual(read.status_code, 503)
+        self.assertEqual(write.status_code, 200)
+
+    def test_request_start_in_milliseconds(self):
+        """Test millisecond request start stamps are understood"""
+        request = self.factory.get(
+            '/', HTTP_X_REQUEST_START=str(int((time.time() - 3) * 1000)),
+        )
+
+        self.assertAlmostEqual(
+            self.middleware.proxy_wait(request), 3, delta=0.5,
+        )
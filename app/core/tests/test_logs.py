@@ -0,0 +1,121 @@
+import io
+import json
+import logging
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.logs import BoundedQueueHandler, JSONFormatter, \
+                      RequestContextFilter
+
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def sample_record(msg='Hello %s', args=('world',), **extra):
+    return logging.makeLogRecord(dict(
+        name='tests', levelno=logging.INFO, levelname='INFO', msg=msg,
+        args=args, **extra
+    ))
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.addFilter(RequestContextFilter())
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class JSONFormatterTests(TestCase):
+    """Test log records are formatted as JSON"""
+
+    def test_format_with_extra(self):
+        """Test the message and extra fields are included"""
+        record = sample_record(user_id=1, view=None)
+
+        data = json.loads(JSONFormatter().format(record))
+
+        self.assertEqual(data['message'], 'Hello world')
+        self.assertEqual(data['level'], 'INFO')
+        self.assertEqual(data['user_id'], 1)
+        self.assertNotIn('view', data)
+
+
+class BoundedQueueHandlerTests(TestCase):
+    """Test records are written by a background thread"""
+
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.handler = BoundedQueueHandler(stream=self.stream, maxsize=2)
+        self.handler.setFormatter(JSONFormatter())
+        self.addCleanup(self.handler.close)
+
+    def test_records_written(self):
+        """Test records reach the stream once the queue is drained"""
+        self.handler.handle(sample_record())
+        self.handler.stop()
+
+        line = json.loads(self.stream.getvalue())
+        self.assertEqual(line['message'], 'Hello world')
+
+    def test_full_queue_drops_records(self):
+        """Test records are dropped and counted while the queue is full"""
+        self.handler.stop()
+        for _ in range(5):
+            self.handler.handle(sample_record())
+
+        self.assertEqual(self.handler.dropped, 3)
+
+        self.handler.queue.get_nowait()
+        self.handler.queue.get_nowait()
+        self.handler.handle(sample_record())
+        self.handler.queue.get_nowait()
+        report = self.handler.queue.get_nowait()
+        self.assertEqual(
+            report.getMessage(),
+            'Dropped 3 log records, the log queue was full',
+        )
+
+
+class RequestContextTests(TestCase):
+    """Test log records carry the context of their request"""
+
+    def setUp(self):
+        self.handler = ListHandler()
+        logger = logging.getLogger('app.requests')
+        logger.addHandler(self.handler)
+        self.addCleanup(logger.removeHandler, self.handler)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'gandalf@lotr.com',
+            'youShallNotPass',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_request_logged_with_context(self):
+        """Test the finished request is logged with its context"""
+        res = self.client.get(TAGS_URL, HTTP_X_REQUEST_ID='abc123')
+
+        self.assertEqual(res['X-Request-ID'], 'abc123')
+        record, = self.handler.records
+        self.assertEqual(record.request_id, 'abc123')
+        self.assertEqual(record.user_id, self.user.pk)
+        self.assertEqual(record.view, 'recipe:tag-list')
+        self.assertEqual(record.status, 200)
+        self.assertGreater(record.db_time, 0)
+
+    def test_request_id_generated(self):
+        """Test requests without an id are given one"""
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(len(res['X-Request-ID']), 32)
+        self.assertEqual(
+            self.handler.records[0].request_id, res['X-Request-ID'],
+        )
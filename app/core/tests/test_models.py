@@ -1,4 +1,5 @@
-from django.test import TestCase
+from django.db.transaction import TransactionManagementError
+from django.test import TestCase, TransactionTestCase
 from django.contrib.auth import get_user_model
 
 from core import models
@@ -67,3 +68,23 @@ class ModelTests(TestCase):
         )
 
         self.assertEqual(str(recipe), recipe.title)
+
+
+class ChangeSequenceTests(TransactionTestCase):
+    """Test change numbers are allocated with the change they number"""
+
+    def test_allocate_requires_transaction(self):
+        """Test a user's change number is refused outside a transaction"""
+        user = sample_user()
+
+        with self.assertRaises(TransactionManagementError):
+            models.ChangeSequence.allocate(user.pk)
+
+    def test_save_numbered_in_transaction(self):
+        """Test saves outside a transaction open one for their number"""
+        user = sample_user()
+
+        first = models.Tag.objects.create(user=user, name='Vegan')
+        second = models.Tag.objects.create(user=user, name='Curry')
+
+        self.assertGreater(second.seq, first.seq)
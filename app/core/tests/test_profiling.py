@@ -0,0 +1,99 @@
+import json
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """Test the on-demand profiling of staff requests"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        override = override_settings(PROFILING_DIR=self.directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = get_user_model().objects.create_user(
+            'gandalf@lotr.com',
+            'youShallNotPass',
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION='Token ' + Token.objects.create(
+                user=self.user,
+            ).key,
+        )
+
+    def profiles(self):
+        return sorted(os.listdir(self.directory.name))
+
+    def test_staff_request_profiled(self):
+        """Test a staff request with the header is profiled"""
+        self.user.is_staff = True
+        self.user.save()
+
+        res = self.client.get(TAGS_URL, HTTP_X_PROFILE='1')
+
+        profile_id = res['X-Profile-Id']
+        self.assertEqual(
+            self.profiles(), [profile_id + '.json', profile_id + '.prof'],
+        )
+        path = os.path.join(self.directory.name, profile_id + '.json')
+        with open(path) as f:
+            meta = json.load(f)
+        self.assertEqual(meta['path'], TAGS_URL)
+        self.assertEqual(meta['status'], 200)
+        self.assertTrue(
+            any('core_tag' in query['sql'] for query in meta['queries'])
+        )
+
+    def test_query_flag_profiles(self):
+        """Test the query parameter opts in as well"""
+        self.user.is_staff = True
+        self.user.save()
+
+        res = self.client.get(TAGS_URL, {'_profile': 1})
+
+        self.assertIn('X-Profile-Id', res)
+
+    def test_non_staff_not_profiled(self):
+        """Test requests of regular users are never profiled"""
+        res = self.client.get(TAGS_URL, HTTP_X_PROFILE='1')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertEqual(self.profiles(), [])
+
+    def test_not_requested_not_profiled(self):
+        """Test staff requests are only profiled when asked for"""
+        self.user.is_staff = True
+        self.user.save()
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertEqual(self.profiles(), [])
+
+    @override_settings(PROFILING_MAX_PROFILES=2)
+    def test_retention_cap(self):
+        """Test only the newest profiles are kept"""
+        self.user.is_staff = True
+        self.user.save()
+
+        ids = [
+            self.client.get(TAGS_URL, HTTP_X_PROFILE='1')['X-Profile-Id']
+            for _ in range(3)
+        ]
+
+        self.assertEqual(len(self.profiles()), 4)
+        self.assertIn(ids[-1] + '.json', self.profiles())
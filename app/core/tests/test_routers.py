@@ -0,0 +1,143 @@
+from contextlib import ExitStack
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import models, routers
+
+
+TAGS_URL = reverse('recipe:tag-list')
+ME_URL = reverse('user:me')
+
+# Replica databases configured by app.test_settings
+REPLICAS = {'replica1', 'replica2'}
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class PrimaryReplicaRouterTests(TestCase):
+    """Test routing of reads and writes between primary and replicas"""
+
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+        cache.clear()
+
+    def test_reads_use_primary_by_default(self):
+        """Test reads outside of a replica block go to the primary"""
+        self.assertEqual(self.router.db_for_read(models.Tag), 'default')
+
+    def test_reads_use_replica_when_allowed(self):
+        """Test reads inside a replica block go to a replica"""
+        with routers.read_from_replicas():
+            db = self.router.db_for_read(models.Tag)
+
+        self.assertIn(db, ['replica1', 'replica2'])
+
+    def test_writes_use_primary(self):
+        """Test writes always go to the primary"""
+        with routers.read_from_replicas():
+            db = self.router.db_for_write(models.Tag)
+
+        self.assertEqual(db, 'default')
+
+    def test_replicas_not_migrated(self):
+        """Test migrations are never run against replicas"""
+        self.assertFalse(self.router.allow_migrate('replica1', 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
+
+    def test_recent_write_is_sticky(self):
+        """Test a write pins the user to the primary"""
+        self.assertFalse(routers.has_recent_write(1))
+
+        routers.mark_recent_write(1)
+
+        self.assertTrue(routers.has_recent_write(1))
+        self.assertFalse(routers.has_recent_write(2))
+
+
+@skipUnless(
+    REPLICAS <= set(settings.DATABASES),
+    'Needs the replica databases of app.test_settings',
+)
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaReadApiTests(TransactionTestCase):
+    """Test the API views read from the replica databases"""
+    databases = {'default'} | (REPLICAS & set(settings.DATABASES))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'gandalf@lotr.com',
+            'youShallNotPass',
+        )
+        self.client.force_authenticate(self.user)
+        cache.clear()
+
+    def table_reads(self, request, table='core_tag'):
+        """Return the aliases a table was read from during a request"""
+        aliases = []
+        with ExitStack() as stack:
+            captured = {
+                alias: stack.enter_context(
+                    CaptureQueriesContext(connections[alias])
+                )
+                for alias in self.databases
+            }
+            res = request()
+        for alias, queries in captured.items():
+            if any(q['sql'].startswith('SELECT') and table in q['sql']
+                   for q in queries):
+                aliases.append(alias)
+        return res, aliases
+
+    def test_list_reads_from_replica(self):
+        """Test listing tags reads from a replica"""
+        res, aliases = self.table_reads(lambda: self.client.get(TAGS_URL))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(aliases), 1)
+        self.assertIn(aliases[0], ['replica1', 'replica2'])
+        self.assertFalse(routers.replicas_allowed())
+
+    def test_reads_spread_over_replicas(self):
+        """Test reads land on every replica"""
+        aliases = set()
+        for _ in range(20):
+            aliases.update(
+                self.table_reads(lambda: self.client.get(TAGS_URL))[1]
+            )
+
+        self.assertEqual(aliases, {'replica1', 'replica2'})
+
+    def test_reads_stick_to_primary_after_write(self):
+        """Test reads go to the primary right after the user wrote"""
+        self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        res, aliases = self.table_reads(lambda: self.client.get(TAGS_URL))
+
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(aliases, ['default'])
+
+    def test_profile_read_from_primary(self):
+        """Test the profile is the user authenticated on the primary"""
+        res, aliases = self.table_reads(
+            lambda: self.client.get(ME_URL), table='core_user',
+        )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data['email'], self.user.email)
+        self.assertNotIn('replica1', aliases)
+        self.assertNotIn('replica2', aliases)
+
+    def test_profile_update_is_sticky(self):
+        """Test updating the profile pins the user to the primary"""
+        self.client.patch(ME_URL, {'name': 'Gandalf the White'})
+
+        self.assertTrue(routers.has_recent_write(self.user.pk))
@@ -0,0 +1,192 @@
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import routers, sharding
+from core.models import Ingredient, Recipe, Tag, UserShard
+
+
+TAGS_URL = reverse('recipe:tag-list')
+
+# Shard databases configured by app.test_settings
+SHARDS = ['shard1', 'shard2']
+
+
+def sample_user(email='gandalf@lotr.com', password='youShallNotPass'):
+    """Create a sample user"""
+    return get_user_model().objects.create_user(email, password)
+
+
+@override_settings(DATABASE_SHARDS=['default'])
+class ShardingTests(TestCase):
+    """Test routing of user owned rows to shards"""
+
+    def setUp(self):
+        self.router = routers.ShardRouter()
+
+    def test_hashed_shard_is_stable(self):
+        """Test users are placed by a stable hash of their id"""
+        with self.settings(DATABASE_SHARDS=['a', 'b', 'c']):
+            placements = [sharding.hashed_shard(i) for i in range(100)]
+
+            self.assertEqual(
+                placements, [sharding.hashed_shard(i) for i in range(100)]
+            )
+            self.assertEqual(set(placements), {'a', 'b', 'c'})
+
+    def test_new_user_placed_on_shard(self):
+        """Test creating a user records its shard"""
+        user = sample_user()
+
+        self.assertTrue(UserShard.objects.filter(user=user).exists())
+
+    def test_lookup_table_overrides_hash(self):
+        """Test an explicit placement wins over the hash"""
+        user = sample_user()
+        UserShard.objects.filter(user=user).update(alias='shard9')
+
+        self.assertEqual(sharding.shard_for_user(user.pk), 'shard9')
+
+    def test_router_uses_owner_shard(self):
+        """Test user owned rows are routed by their owner"""
+        user = sample_user()
+        UserShard.objects.filter(user=user).update(alias='shard9')
+
+        self.assertEqual(
+            self.router.db_for_write(Tag, instance=Tag(user=user)), 'shard9'
+        )
+        self.assertEqual(
+            self.router.db_for_read(Tag, instance=user), 'shard9'
+        )
+        self.assertIsNone(
+            self.router.db_for_read(get_user_model(), instance=user)
+        )
+
+    def test_router_uses_current_shard(self):
+        """Test queries without an instance use the request shard"""
+        with sharding.use_shard('shard9'):
+            self.assertEqual(self.router.db_for_read(Tag), 'shard9')
+
+        self.assertIsNone(self.router.db_for_read(Tag))
+
+    def test_api_through_shard(self):
+        """Test the API reads and writes through the user shard"""
+        client = APIClient()
+        client.force_authenticate(sample_user())
+
+        client.post(TAGS_URL, {'name': 'Vegan'})
+        res = client.get(TAGS_URL)
+
+        self.assertEqual(res.data[0]['name'], 'Vegan')
+
+    def test_writes_rejected_while_moving(self):
+        """Test writes are rejected while the user is being moved"""
+        user = sample_user()
+        UserShard.objects.filter(user=user).update(locked=True)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        res = client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', res)
+        self.assertEqual(client.get(TAGS_URL).status_code, status.HTTP_200_OK)
+
+
+class RebalanceShardsCommandTests(TestCase):
+
+    def test_rebalance_requires_sharding(self):
+        """Test the command refuses to run without shards"""
+        with self.assertRaises(CommandError):
+            call_command('rebalance_shards')
+
+
+@skipUnless(
+    set(SHARDS) <= set(settings.DATABASES),
+    'Needs the shard databases of app.test_settings',
+)
+@override_settings(DATABASE_SHARDS=SHARDS)
+class RebalanceShardsMoveTests(TestCase):
+    """Test moving a user and their rows between two shards"""
+    databases = {'default'} | (set(SHARDS) & set(settings.DATABASES))
+
+    def setUp(self):
+        self.user = sample_user()
+        self.source = sharding.shard_for_user(self.user.pk)
+        self.target = next(s for s in SHARDS if s != self.source)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        with sharding.use_shard(self.source):
+            tags = [
+                Tag.objects.create(user=self.user, name=name)
+                for name in ('Vegan', 'Dessert')
+            ]
+            ingredient = Ingredient.objects.create(
+                user=self.user, name='Salt',
+            )
+            recipe = Recipe.objects.create(
+                user=self.user, title='Lembas', time_minutes=10, price=5.00,
+            )
+            recipe.tags.add(*tags)
+            recipe.ingredients.add(ingredient)
+
+    def row_counts(self, alias):
+        """Return the number of rows of the user on a shard"""
+        return [
+            queryset.using(alias).count() for queryset in (
+                Tag.objects.filter(user=self.user),
+                Ingredient.objects.filter(user=self.user),
+                Recipe.objects.filter(user=self.user),
+                Recipe.tags.through.objects.filter(recipe__user=self.user),
+                Recipe.ingredients.through.objects.filter(
+                    recipe__user=self.user,
+                ),
+            )
+        ]
+
+    def test_move_user(self):
+        """Test the rows of a user are moved and the placement flipped"""
+        responses = []
+
+        def during_grace(seconds):
+            responses.append(self.client.post(TAGS_URL, {'name': 'Keto'}))
+            responses.append(self.client.get(TAGS_URL))
+
+        with patch(
+            'core.management.commands.rebalance_shards.time.sleep',
+            side_effect=during_grace,
+        ):
+            call_command(
+                'rebalance_shards',
+                user=[self.user.pk],
+                target=self.target,
+                batch_size=1,
+                stdout=StringIO(),
+            )
+
+        write, read = responses
+        self.assertEqual(
+            write.status_code, status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+        self.assertEqual(read.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(read.data), 2)
+        self.assertEqual(self.row_counts(self.source), [0, 0, 0, 0, 0])
+        self.assertEqual(self.row_counts(self.target), [2, 1, 1, 2, 1])
+        self.assertEqual(
+            sharding.lookup_shard(self.user.pk), (self.target, False),
+        )
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(
+            sorted(tag['name'] for tag in res.data), ['Dessert', 'Vegan'],
+        )
@@ -0,0 +1,168 @@
+import gzip
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from core.middleware import StaticFilesMiddleware
+from core.storage import CompressedManifestStaticFilesStorage
+
+
+CSS = b'body { color: #333; margin: 0; padding: 0; }\n' * 40
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+class CompressedStorageTests(TestCase):
+    """Test collected static files get hashed and compressed variants"""
+
+    def setUp(self):
+        source = tempfile.TemporaryDirectory()
+        target = tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        self.addCleanup(target.cleanup)
+        write(os.path.join(source.name, 'css', 'app.css'), CSS)
+        write(os.path.join(source.name, 'img', 'logo.png'), b'\x89PNG' * 100)
+        self.source = FileSystemStorage(location=source.name)
+        self.storage = CompressedManifestStaticFilesStorage(
+            location=target.name,
+        )
+        self.root = target.name
+
+    def collect(self):
+        paths = {}
+        for name in ('css/app.css', 'img/logo.png'):
+            with self.source.open(name) as f:
+                self.storage.save(name, f)
+            paths[name] = (self.source, name)
+        return list(self.storage.post_process(paths))
+
+    def test_hashed_and_compressed(self):
+        """Test hashed names and their compressed variants are written"""
+        self.collect()
+
+        hashed = self.storage.stored_name('css/app.css')
+        self.assertNotEqual(hashed, 'css/app.css')
+        for name in ('css/app.css', hashed):
+            path = os.path.join(self.root, name)
+            with open(path + '.gz', 'rb') as f:
+                self.assertEqual(gzip.decompress(f.read()), CSS)
+            self.assertTrue(os.path.exists(path + '.br'))
+
+    def test_binary_files_not_compressed(self):
+        """Test already compressed formats are left alone"""
+        self.collect()
+
+        path = os.path.join(self.root, 'img', 'logo.png')
+        self.assertFalse(os.path.exists(path + '.gz'))
+
+    def test_name_missing_from_manifest_hashed(self):
+        """Test stored files missing from the manifest are still hashed"""
+        self.collect()
+        write(os.path.join(self.root, 'css', 'late.css'), CSS)
+
+        self.assertRegex(
+            self.storage.stored_name('css/late.css'), r'^css/late\.\w+\.css$',
+        )
+
+    def test_missing_file_raises(self):
+        """Test names of files that were never collected are errors"""
+        self.collect()
+
+        with self.assertRaises(ValueError):
+            self.storage.stored_name('css/missing.css')
+
+
+class StaticFilesMiddlewareTests(TestCase):
+    """Test serving collected static files from the app process"""
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        write(os.path.join(root.name, 'app.css'), CSS)
+        write(os.path.join(root.name, 'app.css.gz'), gzip.compress(CSS))
+        write(os.path.join(root.name, 'app.css.br'), b'brotli')
+        write(os.path.join(root.name, 'plain.txt'), b'plain')
+        override = override_settings(STATIC_ROOT=root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.factory = RequestFactory()
+        self.middleware = StaticFilesMiddleware(
+            lambda request: HttpResponse('app', status=404),
+        )
+        self.middleware.immutable = {'app.css'}
+
+    def get(self, path, **extra):
+        return self.middleware(self.factory.get(path, **extra))
+
+    def test_brotli_preferred(self):
+        """Test the brotli variant is served when accepted"""
+        res = self.get('/static/app.css', HTTP_ACCEPT_ENCODING='gzip, br')
+
+        self.assertEqual(res['Content-Encoding'], 'br')
+        self.assertEqual(b''.join(res.streaming_content), b'brotli')
+        self.assertEqual(res['Content-Type'], 'text/css')
+        self.assertEqual(res['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', res['Cache-Control'])
+
+    def test_refused_encoding_not_used(self):
+        """Test encodings with a zero q-value are never sent"""
+        res = self.get('/static/app.css', HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+
+    def test_encoding_preference(self):
+        """Test the encoding with the highest q-value is sent"""
+        res = self.get(
+            '/static/app.css', HTTP_ACCEPT_ENCODING='br;q=0.5, gzip;q=0.8',
+        )
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+
+    def test_no_acceptable_encoding(self):
+        """Test the plain file is sent when every variant is refused"""
+        res = self.get(
+            '/static/app.css', HTTP_ACCEPT_ENCODING='*;q=0, identity',
+        )
+
+        self.assertNotIn('Content-Encoding', res)
+        self.assertEqual(b''.join(res.streaming_content), CSS)
+
+    def test_gzip_variant(self):
+        """Test the gzip variant is served to gzip only clients"""
+        res = self.get('/static/app.css', HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            gzip.decompress(b''.join(res.streaming_content)), CSS,
+        )
+
+    def test_uncompressed_file(self):
+        """Test unhashed files without variants are cached briefly"""
+        res = self.get('/static/plain.txt', HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertNotIn('Content-Encoding', res)
+        self.assertEqual(b''.join(res.streaming_content), b'plain')
+        self.assertEqual(res['Cache-Control'], 'public, max-age=60')
+
+    def test_not_modified(self):
+        """Test conditional requests get a 304"""
+        res = self.get('/static/app.css')
+
+        res = self.get(
+            '/static/app.css', HTTP_IF_MODIFIED_SINCE=res['Last-Modified'],
+        )
+
+        self.assertEqual(res.status_code, 304)
+
+    def test_unknown_paths_passed_on(self):
+        """Test other requests go through the application"""
+        self.assertEqual(self.get('/static/missing.css').content, b'app')
+        self.assertEqual(self.get('/api/recipe/').content, b'app')
@@ -0,0 +1,12 @@
+from django.test import TestCase
+
+from core.warmup import warm_up
+
+
+class WarmUpTests(TestCase):
+    """Test the warm-up run before forking workers"""
+
+    def test_warm_up_without_queries(self):
+        """Test warming up does not touch the database"""
+        with self.assertNumQueries(0):
+            warm_up()
@@ -0,0 +1,132 @@
+import json
+from contextlib import ExitStack
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.db import transaction
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+
+from rest_framework import status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core import sharding
+from core.serializers import BatchSerializer
+
+
+class BatchView(APIView):
+    """Run several API operations in one round trip
+
+    Operations are dispatched in order straight to their views with the
+    user authenticated for the batch, skipping middleware and any further
+    authentication, so only API views under api_prefix may be called. With
+    atomic set, every operation runs in a single transaction that is rolled
+    back if any of them fails.
+    """
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    api_prefix = '/api/'
+    # Headers describing the batch request itself, not its operations
+    request_headers = (
+        'HTTP_IDEMPOTENCY_KEY',
+        'HTTP_IF_MATCH',
+        'HTTP_IF_NONE_MATCH',
+        'HTTP_IF_MODIFIED_SINCE',
+        'HTTP_IF_UNMODIFIED_SINCE',
+        'HTTP_IF_RANGE',
+        'HTTP_RANGE',
+        'HTTP_CONTENT_ENCODING',
+        'HTTP_CONTENT_MD5',
+    )
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data['requests']
+
+        if not serializer.validated_data['atomic']:
+            results = [self.run(request, op) for op in operations]
+            return Response({'responses': results})
+
+        aliases = {'default'} | set(sharding.data_aliases())
+        with ExitStack() as stack:
+            for alias in sorted(aliases):
+                stack.enter_context(transaction.atomic(using=alias))
+            results = []
+            for op in operations:
+                results.append(self.run(request, op))
+                if results[-1]['status'] >= 400:
+                    break
+            rolled_back = results[-1]['status'] >= 400
+            if rolled_back:
+                for alias in aliases:
+                    transaction.set_rollback(True, using=alias)
+
+        return Response({'responses': results, 'rolled_back': rolled_back})
+
+    def run(self, request, op):
+        """Dispatch a single operation and return its outcome"""
+        url = urlsplit(op['path'])
+        try:
+            match = resolve(url.path)
+        except Resolver404:
+            return {'status': status.HTTP_404_NOT_FOUND, 'body': None}
+        if not self.dispatchable(url.path, match.func):
+            return {'status': status.HTTP_400_BAD_REQUEST, 'body': None}
+
+        sub_request = self.build_request(request, op, url)
+        response = match.func(sub_request, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+
+        body = None
+        if response.content:
+            if response.get('Content-Type', '').startswith(
+                    'application/json'):
+                body = json.loads(response.content)
+            else:
+                body = response.content.decode(response.charset)
+        return {'status': response.status_code, 'body': body}
+
+    def dispatchable(self, path, view):
+        """Return whether an operation may be dispatched to a view"""
+        # APIView.as_view and ViewSet.as_view both record the class as cls
+        view_class = getattr(view, 'cls', None)
+        return path.startswith(self.api_prefix) \
+            and isinstance(view_class, type) \
+            and issubclass(view_class, APIView) \
+            and not issubclass(view_class, BatchView)
+
+    def build_request(self, request, op, url):
+        """Build a request for an operation that reuses the batch user"""
+        body = b''
+        if 'body' in op:
+            body = json.dumps(op['body']).encode()
+
+        sub_request = HttpRequest()
+        sub_request.method = op['method']
+        sub_request.path = sub_request.path_info = url.path
+        sub_request.META = {
+            key: value for key, value in request.META.items()
+            if not key.startswith('wsgi.')
+            and key not in self.request_headers
+        }
+        sub_request.META.update({
+            'REQUEST_METHOD': op['method'],
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'HTTP_ACCEPT': 'application/json',
+        })
+        sub_request.GET = QueryDict(url.query)
+        sub_request.COOKIES = request.COOKIES
+        sub_request._stream = BytesIO(body)
+        sub_request._read_started = False
+        sub_request.user = request.user
+        sub_request._force_auth_user = request.user
+        sub_request._force_auth_token = request.auth
+        return sub_request
@@ -0,0 +1,60 @@
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver
+from django.utils import translation
+
+from rest_framework.settings import api_settings
+
+
+# DRF settings holding import strings, resolved on first access
+API_SETTINGS = (
+    'DEFAULT_RENDERER_CLASSES',
+    'DEFAULT_PARSER_CLASSES',
+    'DEFAULT_AUTHENTICATION_CLASSES',
+    'DEFAULT_PERMISSION_CLASSES',
+    'DEFAULT_THROTTLE_CLASSES',
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS',
+    'DEFAULT_METADATA_CLASS',
+    'DEFAULT_VERSIONING_CLASS',
+    'DEFAULT_PAGINATION_CLASS',
+    'DEFAULT_FILTER_BACKENDS',
+    'EXCEPTION_HANDLER',
+)
+
+
+def warm_up():
+    """Fill the lazily built caches of the process
+
+    Run in the gunicorn master after the application is loaded, so forked
+    workers share the caches instead of each building its own copy on their
+    first requests. No database connection is left open.
+    """
+    resolver = get_resolver()
+    resolver.reverse_dict
+    resolver.namespace_dict
+    resolver.app_dict
+    for _ in iter_patterns(resolver.url_patterns):
+        pass
+
+    for model in apps.get_models():
+        model._meta.get_fields()
+        model._meta._relation_tree
+
+    for name in API_SETTINGS:
+        getattr(api_settings, name)
+
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.deactivate()
+
+    connections.close_all()
+
+
+def iter_patterns(patterns):
+    """Yield the URL patterns, populating the nested resolvers"""
+    for pattern in patterns:
+        if hasattr(pattern, 'url_patterns'):
+            pattern.reverse_dict
+            yield from iter_patterns(pattern.url_patterns)
+        else:
+            yield pattern
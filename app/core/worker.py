@@ -0,0 +1,23 @@
+import django
+from django.db import close_old_connections
+from django.utils.module_loading import autodiscover_modules
+
+
+def init_process():
+    """Set up Django in a freshly spawned pool process"""
+    django.setup()
+    autodiscover_modules('tasks')
+
+
+def run_job(job_id):
+    """Run a job in a pool worker and release its database connection
+
+    Models are imported lazily so spawned processes can unpickle this
+    function before Django is set up.
+    """
+    from core import jobs
+
+    try:
+        jobs.execute(job_id)
+    finally:
+        close_old_connections()
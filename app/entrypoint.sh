@@ -0,0 +1,33 @@
+#!/bin/sh
+set -e
+
+python manage.py wait_for_db
+
+# The event stream at /api/events/ is only served by the ASGI application,
+# run as a separate process with "entrypoint.sh events" behind the proxy
+# that routes that path to it. The API itself stays on threaded workers.
+# Background jobs, such as rebuilding stored recipe documents, are run by
+# "entrypoint.sh worker", and "entrypoint.sh purge" removes soft deleted
+# users and recipes every PURGE_INTERVAL seconds
+case "$1" in
+    events)
+        shift
+        exec gunicorn app.asgi:application --config gunicorn.conf.py \
+            --worker-class uvicorn.workers.UvicornWorker \
+            --bind "${EVENTS_BIND:-0.0.0.0:8001}" "$@"
+        ;;
+    worker)
+        shift
+        exec python manage.py run_worker "$@"
+        ;;
+    purge)
+        shift
+        exec python manage.py purge_deleted \
+            --interval "${PURGE_INTERVAL:-3600}" "$@"
+        ;;
+esac
+
+python manage.py migrate --noinput
+python manage.py createcachetable
+
+exec gunicorn app.wsgi:application --config gunicorn.conf.py "$@"
@@ -0,0 +1,99 @@
+import gc
+import multiprocessing
+import os
+import time
+
+
+# Collections in the master would free objects between the long lived ones
+# and make the pages they share with the workers diverge, so the garbage
+# collector stays off until the application is loaded and frozen
+gc.disable()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+workers = int(os.environ.get(
+    'GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1,
+))
+
+threads = int(os.environ.get('GUNICORN_THREADS', 2))
+
+worker_class = 'gthread'
+
+preload_app = True
+
+# Recycle workers to bound memory growth, the jitter keeps them from all
+# restarting at the same time
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+graceful_timeout = 30
+
+keepalive = 5
+
+# Requests are logged by the application, with their id, user and timings,
+# so gunicorn keeps no access log of its own
+accesslog = None
+
+
+def when_ready(server):
+    """Warm up the preloaded application and freeze it before forking"""
+    from core.warmup import warm_up
+
+    started = time.monotonic()
+    warm_up()
+    gc.collect()
+    gc.freeze()
+    server.log.info(
+        'Warmed up in %.0fms, %d objects frozen, master RSS %s kB',
+        (time.monotonic() - started) * 1000,
+        gc.get_freeze_count(),
+        memory_usage().get('Rss', '?'),
+    )
+
+
+def post_fork(server, worker):
+    gc.enable()
+    worker.forked_at = time.monotonic()
+    worker.served_first_request = False
+
+
+def pre_request(worker, req):
+    if not worker.served_first_request:
+        worker.started_first_request = time.monotonic()
+
+
+def post_request(worker, req, environ, resp):
+    """Report the startup cost of the worker on its first request"""
+    if worker.served_first_request:
+        return
+    worker.served_first_request = True
+    now = time.monotonic()
+    usage = memory_usage()
+    worker.log.info(
+        'Worker %s first request %s took %.1fms, %.0fms after fork; '
+        'RSS %s kB, PSS %s kB, private %s kB',
+        worker.pid,
+        req.path,
+        (now - worker.started_first_request) * 1000,
+        (now - worker.forked_at) * 1000,
+        usage.get('Rss', '?'),
+        usage.get('Pss', '?'),
+        usage.get('Private_Clean', 0) + usage.get('Private_Dirty', 0),
+    )
+
+
+def memory_usage():
+    """Return the memory counters of the process in kB, on Linux only"""
+    usage = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if value.strip().endswith('kB'):
+                    usage[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return usage
@@ -0,0 +1,78 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from core.events import publish_on_commit
+from core.models import Recipe
+from recipe import rendering
+
+
+_pending = ContextVar('pending_recipe_changes', default=None)
+
+
+class RecipeChanges:
+    """Recipes changed during a write, by database alias"""
+
+    def __init__(self):
+        self.saved = defaultdict(set)
+        self.related = defaultdict(dict)
+
+    def record_saved(self, using, recipe_id):
+        self.saved[using].add(recipe_id)
+
+    def record_related(self, using, recipe_ids, user_id):
+        for recipe_id in recipe_ids:
+            self.related[using][recipe_id] = user_id
+
+    def flush(self):
+        """Renumber and rerender every changed recipe once"""
+        for using in set(self.saved) | set(self.related):
+            saved = self.saved[using]
+            # Saved recipes already got a change number and an event
+            touched = {
+                recipe_id: user_id
+                for recipe_id, user_id in self.related[using].items()
+                if recipe_id not in saved
+            }
+            for user_id in set(touched.values()):
+                recipe_ids = [
+                    recipe_id for recipe_id, owner in touched.items()
+                    if owner == user_id
+                ]
+                Recipe.objects.using(using).filter(pk__in=recipe_ids) \
+                    .touch(user_id)
+                for recipe_id in recipe_ids:
+                    publish_on_commit(
+                        user_id, 'recipe.updated', {'id': recipe_id},
+                        using=using,
+                    )
+            if rendering.prerender_enabled():
+                rendering.rerender_recipes(
+                    sorted(saved | set(self.related[using])), using=using,
+                )
+
+
+def pending_changes():
+    """Return the changes collected by the enclosing block, if any"""
+    return _pending.get()
+
+
+@contextmanager
+def deferred_recipe_changes():
+    """Renumber and rerender the recipes changed in the block at its end
+
+    Saves and tag or ingredient changes made in the block only record the
+    recipes they touch, so a write changing a recipe and both of its
+    relations pays for one change number and one rendering. Nothing is
+    flushed when the block raises. Must be used inside a transaction.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+    changes = RecipeChanges()
+    token = _pending.set(changes)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    changes.flush()
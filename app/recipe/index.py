@@ -0,0 +1,126 @@
+import threading
+from array import array
+from bisect import insort
+from collections import Counter, OrderedDict
+from heapq import nlargest
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Max
+
+from core.models import Recipe
+
+
+TAG = 0
+INGREDIENT = 1
+
+
+def feature_key(kind, pk):
+    """Pack a tag or ingredient id into a single integer feature key"""
+    return pk << 1 | kind
+
+
+class UserIndex:
+    """Inverted index of the tags and ingredients of one user's recipes
+
+    Every tag and ingredient maps to a sorted array of the ids of the
+    recipes using it, and every recipe maps to a sorted array of its own
+    feature keys. Scoring a recipe only walks the posting lists of its own
+    features, so the cost is bound by how popular those features are
+    rather than by the number of recipes. It is never changed once built.
+    """
+
+    def __init__(self, version, postings, features):
+        self.version = version
+        self.postings = postings
+        self.features = features
+
+    @classmethod
+    def build(cls, user_id, version, using):
+        """Build the index of a user from the recipe through tables"""
+        postings = {}
+        features = {}
+        sources = (
+            (TAG, Recipe.tags.through, 'tag_id'),
+            (INGREDIENT, Recipe.ingredients.through, 'ingredient_id'),
+        )
+        for kind, through, column in sources:
+            rows = through.objects.using(using) \
+                .filter(recipe__user_id=user_id,
+                        recipe__deleted_at__isnull=True) \
+                .values_list('recipe_id', column)
+            for recipe_id, pk in rows:
+                key = feature_key(kind, pk)
+                insort(postings.setdefault(key, array('q')), recipe_id)
+                insort(features.setdefault(recipe_id, array('q')), key)
+        return cls(version, postings, features)
+
+    def similar(self, recipe_id, limit=10):
+        """Return (recipe id, jaccard score) pairs ranked by similarity"""
+        features = self.features.get(recipe_id)
+        if not features:
+            return []
+
+        overlap = Counter()
+        for key in features:
+            overlap.update(self.postings[key])
+        del overlap[recipe_id]
+
+        size = len(features)
+        scored = (
+            (shared / (size + len(self.features[other]) - shared), other)
+            for other, shared in overlap.items()
+        )
+        return [(other, score) for score, other in nlargest(limit, scored)]
+
+
+class RecipeIndex:
+    """Similar recipe indexes of the most recently active users
+
+    The index of a user is built on first use and kept for the
+    RECIPE_INDEX_MAX_USERS most recently used users. It is tagged with the
+    latest change number of the user's recipes, which moves with every
+    change to their tags and ingredients, so an index is rebuilt after any
+    committed change whichever process made it, and changes rolled back
+    never reach it. Indexes are built outside the lock and swapped in whole.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Drop every index, they are rebuilt on next use"""
+        with self._lock:
+            self._users = OrderedDict()
+
+    def similar(self, user_id, recipe_id, limit=10):
+        """Return (recipe id, jaccard score) pairs ranked by similarity"""
+        return self.get(user_id).similar(recipe_id, limit)
+
+    def get(self, user_id):
+        """Return the current index of a user, building it when needed"""
+        # The version and the rows are read from the same database, a
+        # replica chosen at random for each would mix their lag
+        using = router.db_for_read(Recipe)
+        version = Recipe.objects.using(using).filter(user_id=user_id) \
+            .aggregate(version=Max('seq'))['version']
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None and index.version == version:
+                self._users.move_to_end(user_id)
+                return index
+
+        index = UserIndex.build(user_id, version, using)
+        if connections[using].in_atomic_block:
+            # Uncommitted rows may still be rolled back
+            return index
+        with self._lock:
+            self._users[user_id] = index
+            self._users.move_to_end(user_id)
+            while len(self._users) > settings.RECIPE_INDEX_MAX_USERS:
+                self._users.popitem(last=False)
+        return index
+
+
+recipe_index = RecipeIndex()
@@ -0,0 +1,105 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class ShoppingListPagination(CursorPagination):
+    """Paginate aggregated shopping list rows by ingredient name"""
+    ordering = ('name', 'ingredient')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class RecipeKeysetPagination(CursorPagination):
+    """Paginate recipes by the key of their sort order and their id
+
+    A page starts right after the (value, id) of the last recipe of the
+    previous one, so with an index on (user, value, id) every page is an
+    index range read however deep it is. Lists requested without ordering
+    are sorted as the view suggests, newest first otherwise.
+    """
+    ordering_param = 'ordering'
+    orderings = ('price', '-price', 'time_minutes', '-time_minutes', '-id')
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.request = request
+        self.field, descending = self.get_sort(request, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        if reverse:
+            descending = not descending
+
+        keys = (self.field, 'id') if self.field != 'id' else ('id',)
+        queryset = queryset.order_by(
+            *('-' + key if descending else key for key in keys)
+        )
+        if self.cursor is not None:
+            queryset = queryset.filter(
+                self.after(self.cursor.position, queryset.model, descending)
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else self.cursor is not None
+        return self.page
+
+    def get_sort(self, request, view=None):
+        """Return the field to sort by and whether it is descending"""
+        ordering = request.query_params.get(self.ordering_param)
+        if ordering is None:
+            default = getattr(view, 'get_default_ordering', None)
+            ordering = (default and default()) or self.ordering
+        if ordering not in self.orderings:
+            raise ValidationError({
+                self.ordering_param: 'Expected one of {}.'.format(
+                    ', '.join(self.orderings)
+                ),
+            })
+        return ordering.lstrip('-'), ordering.startswith('-')
+
+    def after(self, position, model, descending):
+        """Return the filter for the rows following position"""
+        lookup = 'lt' if descending else 'gt'
+        try:
+            value, pk = position.split(',')
+            value = model._meta.get_field(self.field).to_python(value)
+            pk = int(pk)
+        except (AttributeError, ValueError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if self.field == 'id':
+            return Q(**{'id__' + lookup: pk})
+        # Equivalent to (field, id) > (value, pk), the leading range keeps
+        # the index usable
+        return Q(**{'{}__{}e'.format(self.field, lookup): value}) & (
+            Q(**{'{}__{}'.format(self.field, lookup): value}) |
+            Q(**{'id__' + lookup: pk})
+        )
+
+    def get_position(self, recipe):
+        return '{},{}'.format(getattr(recipe, self.field), recipe.pk)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        cursor = Cursor(offset=0, reverse=False,
+                        position=self.get_position(self.page[-1]))
+        return self.encode_cursor(cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        cursor = Cursor(offset=0, reverse=True,
+                        position=self.get_position(self.page[0]))
+        return self.encode_cursor(cursor)
@@ -0,0 +1,48 @@
+from django.db import router, transaction
+from django.db.models.signals import m2m_changed
+
+
+def set_related_ids(instance, field_name, pks):
+    """Make the targets of a many-to-many field of instance exactly pks
+
+    Reads the current rows of the through table once, then deletes the
+    removed targets with one query and inserts the added ones with one bulk
+    insert. m2m_changed is sent as for the related manager's add/remove.
+    """
+    field = instance._meta.get_field(field_name)
+    through = field.remote_field.through
+    source = field.m2m_field_name()
+    target_column = field.m2m_reverse_name()
+
+    db = router.db_for_write(through, instance=instance)
+    rows = through._default_manager.using(db).filter(**{source: instance})
+    current = set(rows.values_list(target_column, flat=True))
+    wanted = set(pks)
+    removed = current - wanted
+    added = wanted - current
+
+    def send(action, pk_set):
+        m2m_changed.send(
+            sender=through, action=action, instance=instance, reverse=False,
+            model=field.related_model, pk_set=pk_set, using=db,
+        )
+
+    with transaction.atomic(using=db, savepoint=False):
+        if removed:
+            send('pre_remove', set(removed))
+            rows.filter(**{target_column + '__in': removed}).delete()
+            send('post_remove', set(removed))
+        if added:
+            send('pre_add', set(added))
+            through._default_manager.using(db).bulk_create([
+                through(**{
+                    field.m2m_column_name(): instance.pk,
+                    target_column: pk,
+                })
+                for pk in added
+            ])
+            send('post_add', set(added))
+
+    if hasattr(instance, '_prefetched_objects_cache'):
+        instance._prefetched_objects_cache.pop(field.name, None)
+    return added, removed
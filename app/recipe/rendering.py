@@ -0,0 +1,52 @@
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+from core.models import Recipe
+
+
+def prerender_enabled():
+    return getattr(settings, 'RECIPE_PRERENDER', False)
+
+
+def render_recipe(recipe):
+    """Return the detail representation of a recipe as JSON bytes"""
+    from recipe.serializers import RecipeDetailSerializer
+
+    return JSONRenderer().render(RecipeDetailSerializer(recipe).data)
+
+
+def rerender_recipes(recipe_ids, using=None):
+    """Rebuild the stored detail documents of the given recipes"""
+    recipe_ids = list(recipe_ids)
+    batch_size = settings.RECIPE_PRERENDER_BATCH_SIZE
+    for start in range(0, len(recipe_ids), batch_size):
+        recipes = list(
+            Recipe.objects
+            .using(using)
+            .filter(id__in=recipe_ids[start:start + batch_size])
+            .defer('rendered')
+            .prefetch_related('tags', 'ingredients')
+        )
+        for recipe in recipes:
+            recipe.rendered = render_recipe(recipe)
+        Recipe.objects.using(using).bulk_update(recipes, ['rendered'])
+
+
+def recipe_ids_using(field_name, pk, using=None):
+    """Return the ids of the recipes using a tag or ingredient"""
+    through = getattr(Recipe, field_name).through
+    return through.objects \
+        .using(using) \
+        .filter(**{'{}_id'.format(field_name[:-1]): pk}) \
+        .values_list('recipe_id', flat=True)
+
+
+def rerender_recipes_using(field_name, pk, using=None):
+    """Rebuild the documents of every recipe using a tag or ingredient"""
+    rerender_recipes(recipe_ids_using(field_name, pk, using), using=using)
+
+
+def invalidate_recipes(recipe_ids, using=None):
+    """Drop stored documents, the detail view serializes until rebuilt"""
+    Recipe.objects.using(using).filter(id__in=recipe_ids) \
+        .update(rendered=None)
@@ -1,6 +1,13 @@
+from contextlib import contextmanager
+
+from django.db import router, transaction
+from django.utils.translation import gettext_lazy as _
+
 from rest_framework import serializers
 
-from core.models import Tag, Ingredient
+from core.models import Tag, Ingredient, Recipe
+from recipe.changes import deferred_recipe_changes
+from recipe.relations import set_related_ids
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -19,3 +26,124 @@ class IngredientSerializer(serializers.ModelSerializer):
         model = Ingredient
         fields = ('id', 'name')
         read_only_fields = ('id',)
+
+
+class OwnedPrimaryKeysField(serializers.ListField):
+    """List of ids of objects owned by the user, checked in one query"""
+    child = serializers.IntegerField()
+    default_error_messages = {
+        'does_not_exist': _('Invalid pk "{pk_value}" - object does not '
+                            'exist.'),
+    }
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        pks = list(dict.fromkeys(super().to_internal_value(data)))
+        if not pks:
+            return pks
+        user = self.context['request'].user
+        found = set(
+            self.queryset.filter(user=user, pk__in=pks)
+            .values_list('pk', flat=True)
+        )
+        for pk in pks:
+            if pk not in found:
+                self.fail('does_not_exist', pk_value=pk)
+        return pks
+
+    def to_representation(self, value):
+        return [obj.pk for obj in value.all()]
+
+
+class RecipeSerializer(serializers.ModelSerializer):
+    """Serialize for Recipe objects"""
+    ingredients = OwnedPrimaryKeysField(
+        queryset=Ingredient.objects.all(),
+        required=False,
+    )
+    tags = OwnedPrimaryKeysField(
+        queryset=Tag.objects.all(),
+        required=False,
+    )
+    related_fields = ('tags', 'ingredients')
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id', 'title', 'ingredients', 'tags', 'time_minutes', 'price',
+            'link',
+        )
+        read_only_fields = ('id',)
+
+    def create(self, validated_data):
+        """Create a recipe and its tags and ingredients"""
+        related = self._pop_related(validated_data)
+        with self._write(Recipe(**validated_data)) as recipe:
+            recipe.save()
+            self._set_related(recipe, related)
+        return recipe
+
+    def update(self, instance, validated_data):
+        """Update a recipe, writing only the changed tags and ingredients"""
+        related = self._pop_related(validated_data)
+        with self._write(instance):
+            if validated_data:
+                for attr, value in validated_data.items():
+                    setattr(instance, attr, value)
+                instance.save()
+            self._set_related(instance, related)
+        return instance
+
+    @contextmanager
+    def _write(self, recipe):
+        """Write a recipe and its relations atomically, numbered once"""
+        using = router.db_for_write(Recipe, instance=recipe)
+        with transaction.atomic(using=using), deferred_recipe_changes():
+            yield recipe
+
+    def _pop_related(self, validated_data):
+        return {
+            name: validated_data.pop(name)
+            for name in self.related_fields if name in validated_data
+        }
+
+    def _set_related(self, recipe, related):
+        for name, pks in related.items():
+            set_related_ids(recipe, name, pks)
+
+
+class RecipeDetailSerializer(RecipeSerializer):
+    """Serialize a recipe detail"""
+    ingredients = IngredientSerializer(many=True, read_only=True)
+    tags = TagSerializer(many=True, read_only=True)
+
+
+class ShoppingListItemSerializer(serializers.Serializer):
+    """Serialize an aggregated shopping list entry"""
+    id = serializers.IntegerField(source='ingredient')
+    name = serializers.CharField()
+    recipe_count = serializers.IntegerField()
+    recipes = serializers.ListField(child=serializers.IntegerField())
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Serialize a list of recipe ids"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=1000,
+    )
+
+
+class RecipeFilterSerializer(serializers.Serializer):
+    """Serialize the range filters of the recipe list"""
+    max_time = serializers.IntegerField(min_value=0, required=False)
+    min_price = serializers.DecimalField(
+        max_digits=5, decimal_places=2, required=False,
+    )
+    max_price = serializers.DecimalField(
+        max_digits=5, decimal_places=2, required=False,
+    )
@@ -0,0 +1,178 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, \
+                                     post_save, pre_delete
+from django.dispatch import receiver
+
+from core import jobs
+from core.events import publish_on_commit
+from core.models import Tag, Ingredient, Recipe, Tombstone, ChangeSequence
+from recipe import rendering
+from recipe.changes import pending_changes
+
+
+TOMBSTONE_KINDS = {
+    Tag: Tombstone.TAG,
+    Ingredient: Tombstone.INGREDIENT,
+    Recipe: Tombstone.RECIPE,
+}
+
+
+@receiver(post_save, sender=Recipe)
+def render_saved_recipe(sender, instance, update_fields, using, **kwargs):
+    """Rebuild the stored detail document of a saved recipe"""
+    if update_fields is not None and set(update_fields) == {'rendered'}:
+        return
+    changes = pending_changes()
+    if changes is not None:
+        changes.record_saved(using, instance.pk)
+        return
+    if not rendering.prerender_enabled():
+        return
+    rendering.rerender_recipes([instance.pk], using=using)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def collect_cleared_recipes(sender, instance, action, reverse, **kwargs):
+    """Remember the recipes losing a tag or ingredient that is cleared"""
+    if action == 'pre_clear' and reverse:
+        instance._changed_recipe_ids = list(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+
+
+def changed_recipe_ids(instance, action, reverse, pk_set):
+    """Return the ids of the recipes affected by an m2m change"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return []
+    if not reverse:
+        return [instance.pk]
+    if action == 'post_clear':
+        return getattr(instance, '_changed_recipe_ids', [])
+    return list(pk_set)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def render_changed_recipes(sender, instance, action, reverse, pk_set,
+                           using, **kwargs):
+    """Rebuild the stored detail documents after tags or ingredients change"""
+    if not rendering.prerender_enabled() or pending_changes() is not None:
+        return
+    recipe_ids = changed_recipe_ids(instance, action, reverse, pk_set)
+    if recipe_ids:
+        rendering.rerender_recipes(recipe_ids, using=using)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_changed_recipes(sender, instance, action, reverse, pk_set, using,
+                          **kwargs):
+    """Number tag and ingredient changes of recipes for delta sync"""
+    recipe_ids = changed_recipe_ids(instance, action, reverse, pk_set)
+    changes = pending_changes()
+    if recipe_ids and changes is not None:
+        changes.record_related(using, recipe_ids, instance.user_id)
+    elif recipe_ids:
+        Recipe.objects.using(using).filter(pk__in=recipe_ids) \
+            .touch(instance.user_id)
+        for recipe_id in recipe_ids:
+            publish_on_commit(
+                instance.user_id, 'recipe.updated', {'id': recipe_id},
+                using=using,
+            )
+
+
+def enqueue_on_commit(name, using, **kwargs):
+    """Queue a job once the transaction of the change commits"""
+    transaction.on_commit(
+        lambda: jobs.enqueue(name, using=using, **kwargs),
+        using=using,
+    )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def render_recipes_using_renamed(sender, instance, created, using,
+                                 **kwargs):
+    """Rebuild the documents of recipes embedding a renamed attribute
+
+    The documents are dropped at once and rebuilt by a background job, an
+    attribute may be used by any number of recipes.
+    """
+    if created or not rendering.prerender_enabled():
+        return
+    field_name = 'tags' if sender is Tag else 'ingredients'
+    rendering.invalidate_recipes(
+        rendering.recipe_ids_using(field_name, instance.pk, using),
+        using=using,
+    )
+    enqueue_on_commit(
+        'recipe.rerender_recipes_using', using,
+        field_name=field_name, pk=instance.pk,
+    )
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def collect_recipes_using_deleted(sender, instance, **kwargs):
+    """Remember the recipes using an attribute that is being deleted"""
+    instance._changed_recipe_ids = list(
+        instance.recipe_set.values_list('id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def update_recipes_using_deleted(sender, instance, using, **kwargs):
+    """Rebuild and renumber the recipes that used a deleted attribute"""
+    recipe_ids = getattr(instance, '_changed_recipe_ids', None)
+    if not recipe_ids:
+        return
+    Recipe.objects.using(using).filter(pk__in=recipe_ids) \
+        .touch(instance.user_id)
+    if rendering.prerender_enabled():
+        rendering.invalidate_recipes(recipe_ids, using=using)
+        enqueue_on_commit(
+            'recipe.rerender_recipes', using, recipe_ids=recipe_ids,
+        )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+def record_tombstone(sender, instance, using, **kwargs):
+    """Leave a tombstone for delta sync clients"""
+    Tombstone.objects.using(using).create(
+        user_id=instance.user_id,
+        kind=TOMBSTONE_KINDS[sender],
+        object_id=instance.pk,
+        seq=ChangeSequence.allocate(instance.user_id, using),
+    )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+def publish_saved(sender, instance, created, using, **kwargs):
+    """Notify the owner's event streams of a created or updated row"""
+    event_type = '{}.{}'.format(
+        TOMBSTONE_KINDS[sender], 'created' if created else 'updated',
+    )
+    publish_on_commit(
+        instance.user_id, event_type,
+        {'id': instance.pk, 'seq': instance.seq},
+        using=using,
+    )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+def publish_deleted(sender, instance, using, **kwargs):
+    """Notify the owner's event streams of a deleted row"""
+    publish_on_commit(
+        instance.user_id, '{}.deleted'.format(TOMBSTONE_KINDS[sender]),
+        {'id': instance.pk},
+        using=using,
+    )
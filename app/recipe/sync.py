@@ -0,0 +1,66 @@
+from django.db.models import Q
+
+from core.models import Tag, Ingredient, Recipe, Tombstone
+
+
+# Changes are ordered by (seq, source, id), sources are numbered in the
+# order they are listed here
+SOURCES = (
+    ('tags', Tag),
+    ('ingredients', Ingredient),
+    ('recipes', Recipe),
+    ('tombstones', Tombstone),
+)
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+def parse_token(token):
+    """Return the (seq, source, id) position encoded in a sync token"""
+    if not token:
+        return (0, 0, 0)
+    try:
+        seq, source, pk = (int(part) for part in token.split('.'))
+    except ValueError:
+        raise InvalidToken(token)
+    return (seq, source, pk)
+
+
+def format_token(position):
+    return '{}.{}.{}'.format(*position)
+
+
+def changes_since(user, token, limit):
+    """Return the next changes of a user after the token position
+
+    Returns a (changes, next token, more) tuple where changes is a list of
+    (source name, object) pairs in sync order.
+    """
+    seq, last_source, last_id = parse_token(token)
+    rows = []
+    for source, (name, model) in enumerate(SOURCES):
+        if source > last_source:
+            after = Q(seq__gte=seq)
+        elif source == last_source:
+            # The redundant lower bound keeps the seq range on the index
+            after = Q(seq__gte=seq) & (Q(seq__gt=seq) | Q(id__gt=last_id))
+        else:
+            after = Q(seq__gt=seq)
+        queryset = model.objects.filter(after, user=user) \
+            .order_by('seq', 'id')
+        if model is Recipe:
+            queryset = queryset.defer('rendered') \
+                .prefetch_related('tags', 'ingredients')
+        rows.extend(
+            ((obj.seq, source, obj.id), name, obj)
+            for obj in queryset[:limit + 1]
+        )
+
+    rows.sort(key=lambda row: row[0])
+    more = len(rows) > limit
+    rows = rows[:limit]
+    next_token = format_token(rows[-1][0]) if rows \
+        else format_token((seq, last_source, last_id))
+    return [(name, obj) for _, name, obj in rows], next_token, more
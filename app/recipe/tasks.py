@@ -0,0 +1,6 @@
+from core.jobs import job
+from recipe.rendering import rerender_recipes, rerender_recipes_using
+
+
+job('recipe.rerender_recipes')(rerender_recipes)
+job('recipe.rerender_recipes_using')(rerender_recipes_using)
@@ -0,0 +1,110 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from core.models import Recipe, Tag
+
+from recipe.index import RecipeIndex
+
+
+def sample_recipes(user, tag, count=3):
+    """Create recipes sharing a tag"""
+    recipes = [
+        Recipe.objects.create(
+            user=user,
+            title='Recipe {}'.format(i),
+            time_minutes=10,
+            price=5.00,
+        )
+        for i in range(count)
+    ]
+    for recipe in recipes:
+        recipe.tags.add(tag)
+    return recipes
+
+
+class RecipeIndexTests(TestCase):
+    """Test the similar recipes inverted index"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'gandalf@lotr.com',
+            'youShallNotPass',
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipes = sample_recipes(self.user, self.tag)
+
+    def test_build_from_through_tables(self):
+        """Test the index is built from the recipe through tables"""
+        similar = RecipeIndex().similar(self.user.pk, self.recipes[0].id)
+
+        self.assertEqual(
+            sorted(recipe_id for recipe_id, _ in similar),
+            [r.id for r in self.recipes[1:]],
+        )
+        self.assertTrue(all(score == 1 for _, score in similar))
+
+    def test_scoped_to_user(self):
+        """Test recipes of other users are not in a user's index"""
+        other = get_user_model().objects.create_user(
+            'samwise@lotr.com',
+            'MrFrodoPlease',
+        )
+        Recipe.objects.create(
+            user=other, title='Stew', time_minutes=10, price=5.00,
+        ).tags.add(self.tag)
+
+        similar = RecipeIndex().similar(self.user.pk, self.recipes[0].id)
+
+        self.assertEqual(len(similar), 2)
+
+
+class RecipeIndexCacheTests(TransactionTestCase):
+    """Test user indexes are kept until the user's recipes change"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'gandalf@lotr.com',
+            'youShallNotPass',
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipes = sample_recipes(self.user, self.tag)
+        self.index = RecipeIndex()
+
+    def test_index_reused_until_changed(self):
+        """Test only the version is read while the recipes are unchanged"""
+        self.index.similar(self.user.pk, self.recipes[0].id)
+
+        with self.assertNumQueries(1):
+            self.index.similar(self.user.pk, self.recipes[0].id)
+
+        self.recipes[2].tags.remove(self.tag)
+        similar = self.index.similar(self.user.pk, self.recipes[0].id)
+
+        self.assertEqual([r for r, _ in similar], [self.recipes[1].id])
+
+    def test_rolled_back_changes_not_kept(self):
+        """Test an index built inside a transaction is not kept"""
+        self.index.similar(self.user.pk, self.recipes[0].id)
+
+        with transaction.atomic():
+            self.recipes[1].tags.remove(self.tag)
+            inside = self.index.similar(self.user.pk, self.recipes[0].id)
+            transaction.set_rollback(True)
+
+        outside = self.index.similar(self.user.pk, self.recipes[0].id)
+        self.assertEqual(len(inside), 1)
+        self.assertEqual(len(outside), 2)
+
+    @override_settings(RECIPE_INDEX_MAX_USERS=1)
+    def test_least_recently_used_evicted(self):
+        """Test only the most recently used user indexes are kept"""
+        other = get_user_model().objects.create_user(
+            'samwise@lotr.com',
+            'MrFrodoPlease',
+        )
+        self.index.similar(self.user.pk, self.recipes[0].id)
+        self.index.similar(other.pk, self.recipes[0].id)
+
+        with self.assertNumQueries(3):
+            self.index.similar(self.user.pk, self.recipes[0].id)
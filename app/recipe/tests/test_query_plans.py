@@ -0,0 +1,210 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+from core.queryplan import UPDATE_ENV, QueryPlanTestMixin, explain, \
+                           plan_problems, reset_tables
+
+from recipe.index import recipe_index
+
+
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+SHOPPING_LIST_URL = reverse('recipe:recipe-shopping-list')
+SYNC_URL = reverse('recipe:sync')
+
+
+def detail_url(recipe_id):
+    """Return recipe detail URL"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def similar_url(recipe_id):
+    """Return similar recipes URL"""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+class PlanProblemsTests(TestCase):
+    """Test the detection of full scans and sorts in query plans"""
+
+    def test_sqlite_scan_detected(self):
+        """Test a full scan of a large table is reported"""
+        lines = ['SCAN core_recipe', 'SEARCH core_tag USING INDEX x (id=?)']
+
+        self.assertEqual(plan_problems('sqlite', lines), ['SCAN core_recipe'])
+
+    def test_sqlite_index_scan_detected(self):
+        """Test a full scan of an index of a large table is reported"""
+        lines = [
+            'SCAN core_recipe USING INDEX core_recipe_user_id',
+            'SCAN core_tag USING COVERING INDEX core_tag_user_id_name',
+            'SCAN tiny USING INDEX tiny_id',
+        ]
+
+        self.assertEqual(plan_problems('sqlite', lines), lines[:2])
+
+    def test_sqlite_sort_detected(self):
+        """Test a temporary sort is reported unless allowed"""
+        lines = ['USE TEMP B-TREE FOR ORDER BY']
+
+        self.assertEqual(plan_problems('sqlite', lines), lines)
+        self.assertEqual(plan_problems('sqlite', lines, allow_sort=True), [])
+
+    def test_postgres_problems_detected(self):
+        """Test sequential scans and sorts are reported on PostgreSQL"""
+        lines = ['Sort', '  Seq Scan on core_tag', '  Seq Scan on tiny']
+
+        self.assertEqual(
+            plan_problems('postgresql', lines),
+            ['Sort', 'Seq Scan on core_tag'],
+        )
+
+    def test_postgres_index_scan_detected(self):
+        """Test an index scan without condition is reported on PostgreSQL"""
+        lines = [
+            'Index Scan on core_recipe using core_recipe_pkey (full)',
+            'Index Scan on core_recipe using core_recipe_user_id_idx',
+            'Index Only Scan on tiny using tiny_pkey (full)',
+        ]
+
+        self.assertEqual(plan_problems('postgresql', lines), lines[:1])
+
+    def test_explain_full_scan(self):
+        """Test an unindexed filter shows up as a problem"""
+        sql = 'SELECT id FROM core_recipe WHERE link = %s'
+        lines = explain(connection, sql, ['x'])
+
+        self.assertTrue(plan_problems(connection.vendor, lines))
+
+    def test_missing_snapshot_fails(self):
+        """Test a missing snapshot fails unless recording is requested"""
+        checker = QueryPlanTestMixin()
+        checker.fail = self.fail
+        with tempfile.TemporaryDirectory() as directory:
+            checker.plan_snapshot_dir = directory
+            with patch.dict(os.environ, {UPDATE_ENV: ''}):
+                with self.assertRaises(AssertionError):
+                    checker.assertPlanSnapshot('sqlite', 'plan', 'SCAN\n')
+
+            with patch.dict(os.environ, {UPDATE_ENV: '1'}):
+                checker.assertPlanSnapshot('sqlite', 'plan', 'SCAN\n')
+            checker.assertPlanSnapshot('sqlite', 'plan', 'SCAN\n')
+
+
+class EndpointQueryPlanTests(QueryPlanTestMixin, TestCase):
+    """Test every endpoint only reads large tables through indexes"""
+    plan_snapshot_dir = os.path.join(os.path.dirname(__file__), 'plans')
+
+    def setUp(self):
+        reset_tables(connection)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'gandalf@lotr.com',
+            'youShallNotPass',
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Rice',
+        )
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Risotto', time_minutes=30, price=8.00,
+        )
+        self.recipe.tags.add(self.tag)
+        self.recipe.ingredients.add(self.ingredient)
+
+    def tearDown(self):
+        recipe_index.clear()
+
+    def get(self, url, params=None):
+        res = self.client.get(url, params)
+        self.assertEqual(res.status_code, 200)
+        return res
+
+    def test_list_tags(self):
+        """Test the tag list plan"""
+        self.assertEfficientQueries(
+            lambda: self.get(TAGS_URL), snapshot='list_tags',
+        )
+
+    def test_list_ingredients(self):
+        """Test the ingredient list plan"""
+        self.assertEfficientQueries(
+            lambda: self.get(INGREDIENTS_URL), snapshot='list_ingredients',
+        )
+
+    def test_list_recipes(self):
+        """Test the recipe list plan"""
+        self.assertEfficientQueries(
+            lambda: self.get(RECIPES_URL), snapshot='list_recipes',
+        )
+
+    def test_filter_recipes(self):
+        """Test the plan of filtering recipes by time and price"""
+        params = {'max_time': 45, 'min_price': '5.00', 'max_price': '10.00'}
+        res = self.assertEfficientQueries(
+            lambda: self.get(RECIPES_URL, params),
+            snapshot='filter_recipes',
+        )
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_sort_recipes_by_price(self):
+        """Test the plan of a later page of price filtered recipes"""
+        params = {'ordering': 'price', 'max_price': '10.00', 'page_size': 1}
+        Recipe.objects.create(
+            user=self.user, title='Salad', time_minutes=10, price=4.00,
+        )
+        res = self.get(RECIPES_URL, params)
+        self.assertEfficientQueries(
+            lambda: self.get(res.data['next']),
+            snapshot='sort_recipes_by_price',
+        )
+
+    def test_sort_recipes_by_time(self):
+        """Test the plan of time filtered recipes, quickest first"""
+        params = {'ordering': 'time_minutes', 'max_time': 45}
+        self.assertEfficientQueries(
+            lambda: self.get(RECIPES_URL, params),
+            snapshot='sort_recipes_by_time',
+        )
+
+    def test_retrieve_recipe(self):
+        """Test the recipe detail plan"""
+        self.assertEfficientQueries(
+            lambda: self.get(detail_url(self.recipe.id)),
+            snapshot='retrieve_recipe',
+        )
+
+    def test_similar_recipes(self):
+        """Test the similar recipes plan, including the index build"""
+        self.assertEfficientQueries(
+            lambda: self.get(similar_url(self.recipe.id)),
+            snapshot='similar_recipes',
+        )
+
+    def test_shopping_list(self):
+        """Test the shopping list plan, its sort is over the result only"""
+        self.assertEfficientQueries(
+            lambda: self.get(SHOPPING_LIST_URL, {'recipes': self.recipe.id}),
+            snapshot='shopping_list',
+            allow_sort=True,
+        )
+
+    def test_sync(self):
+        """Test the initial and incremental sync plans"""
+        res = self.assertEfficientQueries(
+            lambda: self.get(SYNC_URL), snapshot='sync_initial',
+        )
+        self.assertEfficientQueries(
+            lambda: self.get(SYNC_URL, {'since': res.data['next']}),
+            snapshot='sync_since',
+        )
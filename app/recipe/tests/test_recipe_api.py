@@ -0,0 +1,621 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import jobs
+from core.models import Recipe, Tag, Ingredient
+
+from recipe import tasks  # noqa: F401
+from recipe.index import recipe_index
+from recipe.relations import set_related_ids
+from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+SHOPPING_LIST_URL = reverse('recipe:recipe-shopping-list')
+BULK_DELETE_URL = reverse('recipe:recipe-bulk-delete')
+
+
+def detail_url(recipe_id):
+    """Return recipe detail URL"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def similar_url(recipe_id):
+    """Return similar recipes URL"""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+def sample_tag(user, name='Main course'):
+    """Create and return a sample tag"""
+    return Tag.objects.create(user=user, name=name)
+
+
+def sample_ingredient(user, name='Cinnamon'):
+    """Create and return a sample ingredient"""
+    return Ingredient.objects.create(user=user, name=name)
+
+
+def sample_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': 5.00,
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicRecipeApiTests(TestCase):
+    """Test unauthenticated recipe API access"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_auth_required(self):
+        """Test that authentication is required"""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateRecipeApiTests(TestCase):
+    """Test authenticated recipe API access"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'gandalf@lotr.com',
+            'youShallNotPass',
+        )
+        self.client.force_authenticate(self.user)
+        recipe_index.clear()
+
+    def test_retrieve_recipes(self):
+        """Test retrieving a list of recipes"""
+        sample_recipe(user=self.user)
+        sample_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL)
+
+        recipes = Recipe.objects.all().order_by('-id')
+        serializer = RecipeSerializer(recipes, many=True)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], serializer.data)
+
+    def test_retrieve_recipes_queries_bounded(self):
+        """Test listing recipes does not query their tags one by one"""
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        for _ in range(30):
+            recipe = sample_recipe(user=self.user)
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        results = res.data['results']
+        self.assertEqual(len(results), 30)
+        self.assertEqual(results[0]['tags'], [tag.id])
+        self.assertEqual(results[0]['ingredients'], [ingredient.id])
+
+    def test_recipes_limited_to_user(self):
+        """Test retrieving recipes for user"""
+        user2 = get_user_model().objects.create_user(
+            'samwise@lotr.com',
+            'MrFrodoPlease',
+        )
+        sample_recipe(user=user2)
+        sample_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL)
+
+        recipes = Recipe.objects.filter(user=self.user)
+        serializer = RecipeSerializer(recipes, many=True)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'], serializer.data)
+
+    def test_filter_recipes_by_time_and_price(self):
+        """Test recipes are filtered by cooking time and price ranges"""
+        quick = sample_recipe(user=self.user, time_minutes=20, price=8)
+        sample_recipe(user=self.user, time_minutes=45, price=8)
+        sample_recipe(user=self.user, time_minutes=20, price=12)
+        sample_recipe(user=self.user, time_minutes=20, price=3)
+
+        res = self.client.get(
+            RECIPES_URL,
+            {'max_time': 30, 'min_price': '5', 'max_price': '10.00'},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['results']], [quick.id])
+
+    def test_filter_recipes_invalid_range(self):
+        """Test non numeric range filters are rejected"""
+        res = self.client.get(RECIPES_URL, {'max_price': 'cheap'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('max_price', res.data)
+
+    def test_order_recipes_by_price_paginated(self):
+        """Test recipes sorted by price are paginated by their keys"""
+        recipes = [
+            sample_recipe(user=self.user, price=price)
+            for price in (7, 3, 5, 3, 9)
+        ]
+        expected = [recipes[i].id for i in (1, 3, 2, 0, 4)]
+
+        res = self.client.get(RECIPES_URL, {
+            'ordering': 'price', 'page_size': 2,
+        })
+        ids = [r['id'] for r in res.data['results']]
+        self.assertIsNone(res.data['previous'])
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids.extend(r['id'] for r in res.data['results'])
+
+        self.assertEqual(ids, expected)
+
+        res = self.client.get(res.data['previous'])
+        self.assertEqual(
+            [r['id'] for r in res.data['results']], expected[2:4],
+        )
+
+    def test_order_recipes_by_time_descending(self):
+        """Test recipes are sorted by cooking time, longest first"""
+        short = sample_recipe(user=self.user, time_minutes=10)
+        long = sample_recipe(user=self.user, time_minutes=90)
+        medium = sample_recipe(user=self.user, time_minutes=30)
+
+        res = self.client.get(RECIPES_URL, {
+            'ordering': '-time_minutes', 'max_time': 60,
+        })
+
+        self.assertEqual(
+            [r['id'] for r in res.data['results']], [medium.id, short.id],
+        )
+        self.assertNotIn(long.id, [r['id'] for r in res.data['results']])
+
+    def test_retrieve_recipes_paginated(self):
+        """Test recipes listed without ordering are paginated newest first"""
+        recipes = [sample_recipe(user=self.user) for _ in range(3)]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+        self.assertEqual(
+            [r['id'] for r in res.data['results']],
+            [recipes[2].id, recipes[1].id],
+        )
+        self.assertIsNone(res.data['previous'])
+
+        res = self.client.get(res.data['next'])
+        self.assertEqual(
+            [r['id'] for r in res.data['results']], [recipes[0].id],
+        )
+        self.assertIsNone(res.data['next'])
+
+    def test_order_recipes_invalid(self):
+        """Test unknown orderings and cursors are rejected"""
+        res = self.client.get(RECIPES_URL, {'ordering': 'title'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(RECIPES_URL, {
+            'ordering': 'price', 'cursor': 'bm9wZQ==',
+        })
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_view_recipe_detail(self):
+        """Test viewing a recipe detail"""
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user))
+        recipe.ingredients.add(sample_ingredient(user=self.user))
+
+        res = self.client.get(detail_url(recipe.id))
+
+        serializer = RecipeDetailSerializer(recipe)
+        self.assertEqual(res.json(), serializer.data)
+
+    def test_recipe_detail_served_from_stored_document(self):
+        """Test the detail view returns the precomputed document"""
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user))
+        recipe.refresh_from_db()
+
+        with self.assertNumQueries(1):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.content, bytes(recipe.rendered))
+
+    def test_recipe_detail_rebuilt_on_rename(self):
+        """Test renaming a tag rebuilds the documents embedding it"""
+        tag = sample_tag(user=self.user, name='Vegan')
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(tag)
+
+        tag.name = 'Vegetarian'
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.save()
+        res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.json()['tags'][0]['name'], 'Vegetarian')
+        recipe.refresh_from_db()
+        self.assertIsNone(recipe.rendered)
+
+        job = jobs.claim()[0]
+        self.assertEqual(job.name, 'recipe.rerender_recipes_using')
+        jobs.execute(job.id)
+
+        recipe.refresh_from_db()
+        self.assertIn(b'"Vegetarian"', bytes(recipe.rendered))
+
+    def test_recipe_detail_rebuilt_on_delete(self):
+        """Test deleting an ingredient rebuilds the documents embedding it"""
+        ingredient = sample_ingredient(user=self.user)
+        recipe = sample_recipe(user=self.user)
+        recipe.ingredients.add(ingredient)
+
+        ingredient.delete()
+        res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.json()['ingredients'], [])
+
+    @override_settings(RECIPE_PRERENDER=False)
+    def test_recipe_detail_without_stored_document(self):
+        """Test the detail view serializes when prerendering is disabled"""
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user))
+
+        res = self.client.get(detail_url(recipe.id))
+
+        self.assertIsNone(Recipe.objects.get(id=recipe.id).rendered)
+        self.assertEqual(res.data, RecipeDetailSerializer(recipe).data)
+
+    def test_delete_recipe_is_soft(self):
+        """Test deleting a recipe hides it until it is purged"""
+        recipe = sample_recipe(user=self.user)
+
+        res = self.client.delete(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        recipe.refresh_from_db()
+        self.assertIsNotNone(recipe.deleted_at)
+        self.assertEqual(self.client.get(RECIPES_URL).data['results'], [])
+        self.assertEqual(
+            self.client.get(detail_url(recipe.id)).status_code,
+            status.HTTP_404_NOT_FOUND,
+        )
+
+    def test_bulk_delete_recipes(self):
+        """Test many recipes of the user can be deleted at once"""
+        user2 = get_user_model().objects.create_user(
+            'samwise@lotr.com',
+            'MrFrodoPlease',
+        )
+        recipe1 = sample_recipe(user=self.user)
+        recipe2 = sample_recipe(user=self.user)
+        kept = sample_recipe(user=self.user)
+        other = sample_recipe(user=user2)
+
+        res = self.client.post(
+            BULK_DELETE_URL,
+            {'ids': [recipe1.id, recipe2.id, other.id]},
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual([r['id'] for r in res.data['results']], [kept.id])
+        self.assertIsNone(Recipe.objects.get(id=other.id).deleted_at)
+
+    def test_create_basic_recipe(self):
+        """Test creating a recipe"""
+        payload = {
+            'title': 'Lembas bread',
+            'time_minutes': 30,
+            'price': 5.00,
+        }
+
+        res = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.user, self.user)
+        for key in payload.keys():
+            self.assertEqual(payload[key], getattr(recipe, key))
+
+    def test_create_recipe_with_tags_and_ingredients(self):
+        """Test creating a recipe with tags and ingredients"""
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Dessert')
+        ingredient = sample_ingredient(user=self.user, name='Ginger')
+        payload = {
+            'title': 'Ginger cheesecake',
+            'tags': [tag1.id, tag2.id],
+            'ingredients': [ingredient.id],
+            'time_minutes': 60,
+            'price': 20.00,
+        }
+
+        res = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertCountEqual(recipe.tags.all(), [tag1, tag2])
+        self.assertCountEqual(recipe.ingredients.all(), [ingredient])
+        self.assertCountEqual(res.data['tags'], [tag1.id, tag2.id])
+
+    def test_create_recipe_with_other_users_tag(self):
+        """Test tags of another user can't be assigned"""
+        user2 = get_user_model().objects.create_user(
+            'samwise@lotr.com',
+            'MrFrodoPlease',
+        )
+        tag = sample_tag(user=user2)
+        payload = {
+            'title': 'Second breakfast',
+            'tags': [tag.id],
+            'time_minutes': 10,
+            'price': 2.00,
+        }
+
+        res = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', res.data)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_partial_update_recipe(self):
+        """Test updating a recipe with patch"""
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user))
+        new_tag = sample_tag(user=self.user, name='Curry')
+
+        res = self.client.patch(
+            detail_url(recipe.id),
+            {'title': 'Chicken tikka', 'tags': [new_tag.id]},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Chicken tikka')
+        self.assertEqual(list(recipe.tags.all()), [new_tag])
+
+    def test_full_update_recipe(self):
+        """Test updating a recipe with put"""
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user))
+        payload = {
+            'title': 'Spaghetti carbonara',
+            'time_minutes': 25,
+            'price': 5.00,
+            'tags': [],
+        }
+
+        res = self.client.put(detail_url(recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, payload['title'])
+        self.assertEqual(recipe.time_minutes, payload['time_minutes'])
+        self.assertEqual(recipe.tags.count(), 0)
+
+    def test_update_recipe_writes_only_changes(self):
+        """Test tags are updated with one delete and one insert"""
+        kept, dropped, added = (
+            sample_tag(user=self.user, name=name)
+            for name in ('Kept', 'Dropped', 'Added')
+        )
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(kept, dropped)
+        through = Recipe.tags.through
+        kept_row = through.objects.get(recipe=recipe, tag=kept)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.patch(
+                detail_url(recipe.id),
+                {'tags': [kept.id, added.id]},
+                format='json',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        writes = [
+            query['sql'].split()[0] for query in queries
+            if '"core_recipe_tags"' in query['sql'].split('(')[0]
+            and not query['sql'].startswith('SELECT')
+        ]
+        self.assertEqual(writes, ['DELETE', 'INSERT'])
+        self.assertCountEqual(recipe.tags.all(), [kept, added])
+        self.assertTrue(through.objects.filter(id=kept_row.id).exists())
+
+    def test_update_recipe_numbered_and_rendered_once(self):
+        """Test a write changing fields and relations is processed once"""
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(tag)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.patch(
+                detail_url(recipe.id),
+                {'title': 'Stew', 'tags': [], 'ingredients': [ingredient.id]},
+                format='json',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        sqls = [query['sql'] for query in queries]
+        recipe_updates = [
+            sql for sql in sqls if sql.startswith('UPDATE "core_recipe"')
+        ]
+        self.assertEqual(
+            len([sql for sql in recipe_updates if '"seq"' in sql]), 1,
+        )
+        self.assertEqual(
+            len([sql for sql in recipe_updates if '"rendered"' in sql]), 1,
+        )
+        recipe.refresh_from_db()
+        self.assertIn(b'"Stew"', bytes(recipe.rendered))
+        self.assertIn(ingredient.name.encode(), bytes(recipe.rendered))
+
+    def test_update_recipe_atomic(self):
+        """Test a write failing partway leaves the recipe unchanged"""
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        recipe = sample_recipe(user=self.user, title='Soup')
+
+        def fail_on_ingredients(instance, field_name, pks):
+            if field_name == 'ingredients':
+                raise RuntimeError('Connection lost')
+            return set_related_ids(instance, field_name, pks)
+
+        with patch('recipe.serializers.set_related_ids',
+                   side_effect=fail_on_ingredients):
+            with self.assertRaises(RuntimeError):
+                self.client.patch(
+                    detail_url(recipe.id),
+                    {'title': 'Stew', 'tags': [tag.id],
+                     'ingredients': [ingredient.id]},
+                    format='json',
+                )
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Soup')
+        self.assertFalse(recipe.tags.exists())
+
+    def test_similar_recipes_ranked_by_overlap(self):
+        """Test similar recipes are ranked by shared tags and ingredients"""
+        vegan = sample_tag(user=self.user, name='Vegan')
+        curry = sample_tag(user=self.user, name='Curry')
+        rice = sample_ingredient(user=self.user, name='Rice')
+        recipe = sample_recipe(user=self.user, title='Chana masala')
+        recipe.tags.add(vegan, curry)
+        recipe.ingredients.add(rice)
+        close = sample_recipe(user=self.user, title='Aloo gobi')
+        close.tags.add(vegan, curry)
+        far = sample_recipe(user=self.user, title='Fried rice')
+        far.ingredients.add(rice)
+        sample_recipe(user=self.user, title='Toast')
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data], [close.id, far.id])
+        self.assertEqual(res.data[0]['score'], round(2 / 3, 4))
+        self.assertEqual(res.data[1]['score'], round(1 / 3, 4))
+
+    def test_similar_recipes_follow_m2m_changes(self):
+        """Test the similarity index is updated when tags change"""
+        vegan = sample_tag(user=self.user, name='Vegan')
+        recipe = sample_recipe(user=self.user)
+        other = sample_recipe(user=self.user)
+        recipe.tags.add(vegan)
+
+        res = self.client.get(similar_url(recipe.id))
+        self.assertEqual(res.data, [])
+
+        other.tags.add(vegan)
+        res = self.client.get(similar_url(recipe.id))
+        self.assertEqual([r['id'] for r in res.data], [other.id])
+
+        vegan.recipe_set.remove(other)
+        res = self.client.get(similar_url(recipe.id))
+        self.assertEqual(res.data, [])
+
+    def test_similar_recipes_of_other_user_not_found(self):
+        """Test similar recipes can't be requested for another user"""
+        user2 = get_user_model().objects.create_user(
+            'samwise@lotr.com',
+            'MrFrodoPlease',
+        )
+        recipe = sample_recipe(user=user2)
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ShoppingListApiTests(TestCase):
+    """Test the aggregated shopping list API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'gandalf@lotr.com',
+            'youShallNotPass',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_shopping_list_merges_ingredients(self):
+        """Test ingredients are deduplicated across the requested recipes"""
+        rice = sample_ingredient(user=self.user, name='Rice')
+        onion = sample_ingredient(user=self.user, name='Onion')
+        salt = sample_ingredient(user=self.user, name='Salt')
+        recipe1 = sample_recipe(user=self.user)
+        recipe1.ingredients.add(rice, onion)
+        recipe2 = sample_recipe(user=self.user)
+        recipe2.ingredients.add(rice)
+        recipe3 = sample_recipe(user=self.user)
+        recipe3.ingredients.add(salt)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(
+                SHOPPING_LIST_URL,
+                {'recipes': '{},{}'.format(recipe1.id, recipe2.id)},
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [
+            {'id': onion.id, 'name': 'Onion', 'recipe_count': 1,
+             'recipes': [recipe1.id]},
+            {'id': rice.id, 'name': 'Rice', 'recipe_count': 2,
+             'recipes': [recipe1.id, recipe2.id]},
+        ])
+
+    def test_shopping_list_limited_to_user(self):
+        """Test recipes of other users are ignored"""
+        user2 = get_user_model().objects.create_user(
+            'samwise@lotr.com',
+            'MrFrodoPlease',
+        )
+        recipe = sample_recipe(user=user2)
+        recipe.ingredients.add(sample_ingredient(user=user2))
+
+        res = self.client.get(SHOPPING_LIST_URL, {'recipes': recipe.id})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [])
+
+    def test_shopping_list_paginated(self):
+        """Test the shopping list is cursor paginated"""
+        recipe = sample_recipe(user=self.user)
+        for name in ('Apple', 'Basil', 'Chilli'):
+            recipe.ingredients.add(sample_ingredient(self.user, name=name))
+
+        res = self.client.get(
+            SHOPPING_LIST_URL,
+            {'recipes': recipe.id, 'page_size': 2},
+        )
+        self.assertEqual(
+            [i['name'] for i in res.data['results']], ['Apple', 'Basil']
+        )
+
+        res = self.client.get(res.data['next'])
+        self.assertEqual([i['name'] for i in res.data['results']], ['Chilli'])
+        self.assertIsNone(res.data['next'])
+
+    def test_shopping_list_invalid_ids(self):
+        """Test non numeric recipe ids are rejected"""
+        res = self.client.get(SHOPPING_LIST_URL, {'recipes': '1,abc'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
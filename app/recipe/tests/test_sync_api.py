@@ -0,0 +1,134 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+
+SYNC_URL = reverse('recipe:sync')
+
+
+def sample_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': 5.00,
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicSyncApiTests(TestCase):
+    """Test unauthenticated sync API access"""
+
+    def test_login_required(self):
+        """Test that login is required to sync"""
+        res = APIClient().get(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateSyncApiTests(TestCase):
+    """Test the delta sync API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'gandalf@lotr.com',
+            'youShallNotPass',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_initial_sync_returns_everything(self):
+        """Test syncing without a token returns all of the user's rows"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        Ingredient.objects.create(user=self.user, name='Rice')
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(tag)
+        other = get_user_model().objects.create_user('sam@lotr.com', 'pass')
+        Tag.objects.create(user=other, name='Hidden')
+
+        res = self.client.get(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([t['name'] for t in res.data['tags']], ['Vegan'])
+        self.assertEqual(len(res.data['ingredients']), 1)
+        self.assertEqual(res.data['recipes'][0]['tags'], [tag.id])
+        self.assertFalse(res.data['more'])
+
+    def test_sync_returns_only_changes(self):
+        """Test syncing with a token returns rows changed after it"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Curry')
+        token = self.client.get(SYNC_URL).data['next']
+
+        tag.name = 'Vegetarian'
+        tag.save()
+        res = self.client.get(SYNC_URL, {'since': token})
+
+        self.assertEqual(
+            [t['name'] for t in res.data['tags']], ['Vegetarian']
+        )
+        res = self.client.get(SYNC_URL, {'since': res.data['next']})
+        self.assertEqual(res.data['tags'], [])
+
+    def test_sync_reports_deletions(self):
+        """Test deleted and soft deleted rows are reported"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(tag)
+        token = self.client.get(SYNC_URL).data['next']
+
+        tag_id = tag.id
+        tag.delete()
+        Recipe.objects.filter(pk=recipe.pk).soft_delete()
+        res = self.client.get(SYNC_URL, {'since': token})
+
+        self.assertEqual(res.data['deleted']['tags'], [tag_id])
+        self.assertEqual(res.data['deleted']['recipes'], [recipe.id])
+        self.assertEqual(res.data['recipes'], [])
+
+    def test_recipe_m2m_change_synced(self):
+        """Test changing the tags of a recipe marks the recipe changed"""
+        recipe = sample_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        token = self.client.get(SYNC_URL).data['next']
+
+        recipe.tags.add(tag)
+        res = self.client.get(SYNC_URL, {'since': token})
+
+        self.assertEqual(res.data['recipes'][0]['tags'], [tag.id])
+
+    def test_sync_paginated(self):
+        """Test changes are returned in pages"""
+        for name in ('Vegan', 'Curry', 'Spicy'):
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(SYNC_URL, {'page_size': 2})
+        self.assertEqual(len(res.data['tags']), 2)
+        self.assertTrue(res.data['more'])
+
+        res = self.client.get(
+            SYNC_URL, {'page_size': 2, 'since': res.data['next']}
+        )
+        self.assertEqual([t['name'] for t in res.data['tags']], ['Spicy'])
+        self.assertFalse(res.data['more'])
+
+    def test_invalid_token(self):
+        """Test a malformed token is rejected"""
+        res = self.client.get(SYNC_URL, {'since': 'garbage'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_page_size(self):
+        """Test a non numeric page size is reported as such"""
+        res = self.client.get(SYNC_URL, {'page_size': 'many'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('page_size', res.data)
+        self.assertNotIn('since', res.data)
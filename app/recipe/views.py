@@ -1,12 +1,28 @@
-from rest_framework import viewsets, mixins
+from django.db.models import Count, F
+from django.http import HttpResponse
+from rest_framework import viewsets, mixins, status
 from rest_framework.authentication import TokenAuthentication
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from core.models import Tag, Ingredient
-from recipe.serializers import TagSerializer, IngredientSerializer
+from core.events import publish_on_commit
+from core.mixins import IdempotentCreateMixin, ReplicaReadMixin, \
+                        ShardRoutingMixin
+from core.models import Tag, Ingredient, Recipe
+from recipe import rendering, serializers, sync
+from recipe.aggregates import GroupConcat
+from recipe.index import recipe_index
+from recipe.pagination import RecipeKeysetPagination, \
+                              ShoppingListPagination
 
 
-class BaseRecipeAttrsViewSet(viewsets.GenericViewSet,
+class BaseRecipeAttrsViewSet(IdempotentCreateMixin,
+                             ShardRoutingMixin,
+                             ReplicaReadMixin,
+                             viewsets.GenericViewSet,
                              mixins.ListModelMixin,
                              mixins.CreateModelMixin):
     authentication_classes = (TokenAuthentication,)
@@ -23,11 +39,210 @@ class BaseRecipeAttrsViewSet(viewsets.GenericViewSet,
 
 class TagViewSet(BaseRecipeAttrsViewSet):
     """Manage tags in the database"""
-    serializer_class = TagSerializer
+    serializer_class = serializers.TagSerializer
     queryset = Tag.objects.all()
 
 
 class IngredientViewSet(BaseRecipeAttrsViewSet):
     """Manage ingresdients in the database"""
-    serializer_class = IngredientSerializer
+    serializer_class = serializers.IngredientSerializer
     queryset = Ingredient.objects.all()
+
+
+class RecipeViewSet(IdempotentCreateMixin,
+                    ShardRoutingMixin,
+                    ReplicaReadMixin,
+                    viewsets.GenericViewSet,
+                    mixins.ListModelMixin,
+                    mixins.CreateModelMixin,
+                    mixins.RetrieveModelMixin,
+                    mixins.UpdateModelMixin,
+                    mixins.DestroyModelMixin):
+    """Manage recipes in the database"""
+    serializer_class = serializers.RecipeSerializer
+    queryset = Recipe.objects.all()
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    pagination_class = RecipeKeysetPagination
+    similar_limit = 10
+    range_filters = {
+        'max_time': 'time_minutes__lte',
+        'min_price': 'price__gte',
+        'max_price': 'price__lte',
+    }
+
+    def get_queryset(self):
+        """Retrieve the recipes for the authenticated user"""
+        queryset = self.queryset.filter(user=self.request.user).alive()
+        if self.action != 'retrieve':
+            queryset = queryset.defer('rendered')
+        if self.action == 'list':
+            queryset = self._filter_ranges(queryset) \
+                .prefetch_related('tags', 'ingredients')
+        return queryset.order_by('-id')
+
+    def get_default_ordering(self):
+        """Sort range filtered lists by the filtered key, a range read"""
+        for name, lookup in self.range_filters.items():
+            if name in self.request.query_params:
+                return lookup.split('__')[0]
+        return None
+
+    def get_serializer_class(self):
+        """Return appropriate serializer class"""
+        if self.action == 'retrieve':
+            return serializers.RecipeDetailSerializer
+        elif self.action == 'shopping_list':
+            return serializers.ShoppingListItemSerializer
+        elif self.action == 'bulk_delete':
+            return serializers.RecipeIdsSerializer
+
+        return self.serializer_class
+
+    def retrieve(self, request, *args, **kwargs):
+        """Return the stored detail document when one is available"""
+        instance = self.get_object()
+        if instance.rendered is not None and rendering.prerender_enabled() \
+                and request.accepted_renderer.format == 'json':
+            return HttpResponse(
+                bytes(instance.rendered),
+                content_type='application/json',
+            )
+
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
+
+    def perform_create(self, serializer):
+        """Create a new recipe"""
+        serializer.save(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        """Mark the recipe for deletion, the purger removes it later"""
+        Recipe.objects.filter(pk=instance.pk).soft_delete(instance.user_id)
+        publish_on_commit(
+            instance.user_id, 'recipe.deleted', {'id': instance.pk},
+        )
+
+    @action(detail=False, methods=['post'], url_path='bulk-delete')
+    def bulk_delete(self, request):
+        """Mark many recipes of the user for deletion at once"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(
+            self.get_queryset()
+            .filter(id__in=serializer.validated_data['ids'])
+            .values_list('id', flat=True)
+        )
+        Recipe.objects.filter(id__in=recipe_ids) \
+            .soft_delete(request.user.pk)
+        for recipe_id in recipe_ids:
+            publish_on_commit(
+                request.user.pk, 'recipe.deleted', {'id': recipe_id},
+            )
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Return the user's recipes ranked by shared tags and ingredients"""
+        recipe = self.get_object()
+        ranked = recipe_index.similar(
+            request.user.pk, recipe.id, limit=self.similar_limit,
+        )
+        scores = dict(ranked)
+        recipes = self.get_queryset().filter(id__in=scores) \
+            .prefetch_related('tags', 'ingredients')
+        recipes = sorted(recipes, key=lambda r: (-scores[r.id], r.id))
+
+        serializer = self.get_serializer(recipes, many=True)
+        data = [
+            dict(item, score=round(scores[item['id']], 4))
+            for item in serializer.data
+        ]
+        return Response(data)
+
+    @action(detail=False, methods=['get'], url_path='shopping-list',
+            pagination_class=ShoppingListPagination)
+    def shopping_list(self, request):
+        """Return the merged ingredients of the requested recipes"""
+        recipe_ids = self._params_to_ints(request.query_params.get('recipes'))
+        through = Recipe.ingredients.through
+        rows = through.objects \
+            .filter(recipe__user=request.user, recipe_id__in=recipe_ids,
+                    recipe__deleted_at__isnull=True) \
+            .values('ingredient') \
+            .annotate(
+                name=F('ingredient__name'),
+                recipe_count=Count('recipe'),
+                recipes=GroupConcat('recipe'),
+            )
+
+        page = self.paginate_queryset(rows)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def _filter_ranges(self, queryset):
+        """Filter recipes by the time and price ranges in the query"""
+        serializer = serializers.RecipeFilterSerializer(
+            data=self.request.query_params,
+        )
+        serializer.is_valid(raise_exception=True)
+        return queryset.filter(**{
+            self.range_filters[name]: value
+            for name, value in serializer.validated_data.items()
+        })
+
+    def _params_to_ints(self, qs):
+        """Convert a comma separated list of ids to a list of integers"""
+        try:
+            return [int(str_id) for str_id in (qs or '').split(',') if str_id]
+        except ValueError:
+            raise ValidationError(
+                {'recipes': 'Expected a comma separated list of ids.'}
+            )
+
+
+class SyncView(ShardRoutingMixin, ReplicaReadMixin, APIView):
+    """Return the changes to the user's data since a sync token"""
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    page_size = 500
+    max_page_size = 1000
+    serializer_classes = {
+        'tags': serializers.TagSerializer,
+        'ingredients': serializers.IngredientSerializer,
+        'recipes': serializers.RecipeSerializer,
+    }
+
+    def get(self, request):
+        try:
+            page_size = int(
+                request.query_params.get('page_size', self.page_size)
+            )
+        except ValueError:
+            raise ValidationError({'page_size': 'Expected an integer.'})
+        try:
+            changes, next_token, more = sync.changes_since(
+                request.user,
+                request.query_params.get('since'),
+                min(max(page_size, 1), self.max_page_size),
+            )
+        except sync.InvalidToken:
+            raise ValidationError({'since': 'Invalid sync token.'})
+
+        updated = {name: [] for name in self.serializer_classes}
+        deleted = {name: [] for name in self.serializer_classes}
+        for name, obj in changes:
+            if name == 'tombstones':
+                deleted[obj.kind + 's'].append(obj.object_id)
+            elif getattr(obj, 'deleted_at', None) is not None:
+                deleted[name].append(obj.id)
+            else:
+                updated[name].append(obj)
+
+        data = {
+            name: serializer_class(updated[name], many=True).data
+            for name, serializer_class in self.serializer_classes.items()
+        }
+        data.update(deleted=deleted, next=next_token, more=more)
+        return Response(data)
@@ -2,10 +2,11 @@ from rest_framework import generics, authentication, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 
+from core.mixins import IdempotentCreateMixin, ReplicaReadMixin
 from user.serializers import UserSerializer, AuthTokenSerializer
 
 
-class CreateUserView(generics.CreateAPIView):
+class CreateUserView(IdempotentCreateMixin, generics.CreateAPIView):
     """Create new user"""
     serializer_class = UserSerializer
 
@@ -16,8 +17,15 @@ class CreateTokenView(ObtainAuthToken):
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
 
-class MangeUserView(generics.RetrieveUpdateAPIView):
-    """Manage the authenticated user"""
+class MangeUserView(ReplicaReadMixin,
+                    generics.RetrieveUpdateDestroyAPIView):
+    """Manage the authenticated user
+
+    The profile is served from the user loaded by the token lookup, which
+    runs on the primary before replica reads are allowed; reading it again
+    from a replica would only add a query. ReplicaReadMixin pins the user
+    to the primary after a profile update, for the reads of other views.
+    """
     serializer_class = UserSerializer
     authentication_classes = (authentication.TokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
@@ -25,3 +33,7 @@ class MangeUserView(generics.RetrieveUpdateAPIView):
     def get_object(self):
         """Retrieve and retunr the authenticated user"""
         return self.request.user
+
+    def perform_destroy(self, instance):
+        """Deactivate the user, its data is purged in the background"""
+        instance.soft_delete()